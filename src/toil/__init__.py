@@ -17,12 +17,9 @@ from __future__ import absolute_import
 import errno
 import logging
 import os
-import requests
 import sys
 import time
 from datetime import datetime
-from pytz import timezone
-from docker.errors import ImageNotFound
 from toil.lib.memoize import memoize
 from toil.lib.misc import mkdir_p
 from toil.lib.retry import retry
@@ -40,10 +37,18 @@ try:
 except ImportError:
     import pickle
 
-try:
-    from urllib import urlretrieve
-except ImportError:
-    from urllib.request import urlretrieve
+
+def urlretrieve(*args, **kwargs):
+    """
+    See urllib.request.urlretrieve, which is only imported when needed, as it pulls in the HTTP
+    client and the email package.
+    """
+    try:
+        from urllib import urlretrieve as _urlretrieve
+    except ImportError:
+        from urllib.request import urlretrieve as _urlretrieve
+    return _urlretrieve(*args, **kwargs)
+
 
 log = logging.getLogger(__name__)
 
@@ -315,6 +320,7 @@ def parseDockerAppliance(appliance):
 
 
 def checkDockerSchema(appliance):
+    from docker.errors import ImageNotFound
     if not appliance:
         raise ImageNotFound("No docker image specified.")
     elif '://' in appliance:
@@ -325,13 +331,16 @@ def checkDockerSchema(appliance):
                             "" % appliance)
 
 
-class ApplianceImageNotFound(ImageNotFound):
+class ApplianceImageNotFound(RuntimeError):
     """
     Compose an ApplianceImageNotFound error complaining that the given name and
     tag for TOIL_APPLIANCE_SELF specify an image manifest which could not be
     retrieved from the given URL, because it produced the given HTTP error
     code.
 
+    The errors raised by Toil also derive from docker's ImageNotFound, see
+    :func:`_dockerApplianceImageNotFoundClass`.
+
     :param str origAppliance: The full url of the docker image originally
                               specified by the user (or the default).
                               e.g. "quay.io/ucsc_cgl/toil:latest"
@@ -339,16 +348,36 @@ class ApplianceImageNotFound(ImageNotFound):
     :param int statusCode: the failing HTTP status code returned by the URL
     """
     def __init__(self, origAppliance, url, statusCode):
-        msg = ("The docker image that TOIL_APPLIANCE_SELF specifies (%s) produced "
-               "a nonfunctional manifest URL (%s). The HTTP status returned was %s. "
-               "The specifier is most likely unsupported or malformed.  "
-               "Please supply a docker image with the format: "
-               "'<websitehost>.io/<repo_path>:<tag>' or '<repo_path>:<tag>' "
-               "(for official docker.io images).  Examples: "
-               "'quay.io/ucsc_cgl/toil:latest', 'ubuntu:latest', or "
-               "'broadinstitute/genomes-in-the-cloud:2.0.0'."
-               "" % (origAppliance, url, str(statusCode)))
-        super(ApplianceImageNotFound, self).__init__(msg)
+        super(ApplianceImageNotFound, self).__init__(self._message(origAppliance, url, statusCode))
+
+    @staticmethod
+    def _message(origAppliance, url, statusCode):
+        return ("The docker image that TOIL_APPLIANCE_SELF specifies (%s) produced "
+                "a nonfunctional manifest URL (%s). The HTTP status returned was %s. "
+                "The specifier is most likely unsupported or malformed.  "
+                "Please supply a docker image with the format: "
+                "'<websitehost>.io/<repo_path>:<tag>' or '<repo_path>:<tag>' "
+                "(for official docker.io images).  Examples: "
+                "'quay.io/ucsc_cgl/toil:latest', 'ubuntu:latest', or "
+                "'broadinstitute/genomes-in-the-cloud:2.0.0'."
+                "" % (origAppliance, url, str(statusCode)))
+
+
+@memoize
+def _dockerApplianceImageNotFoundClass():
+    """
+    Returns the class of the ApplianceImageNotFound errors raised by Toil, which also derives from
+    docker's ImageNotFound. It is only defined when an error is raised because importing docker
+    pulls in requests, which takes longer to import than Toil itself.
+    """
+    from docker.errors import ImageNotFound
+
+    class DockerApplianceImageNotFound(ImageNotFound, ApplianceImageNotFound):
+        def __init__(self, origAppliance, url, statusCode):
+            super(DockerApplianceImageNotFound, self).__init__(
+                ApplianceImageNotFound._message(origAppliance, url, statusCode))
+
+    return DockerApplianceImageNotFound
 
 
 def requestCheckRegularDocker(origAppliance, registryName, imageName, tag):
@@ -372,11 +401,12 @@ def requestCheckRegularDocker(origAppliance, registryName, imageName, tag):
     :param str tag: The tag used at that docker image's registry.  e.g. "latest"
     :return: Return True if match found.  Raise otherwise.
     """
+    import requests
     ioURL = 'https://{webhost}/v2/{pathName}/manifests/{tag}' \
               ''.format(webhost=registryName, pathName=imageName, tag=tag)
     response = requests.head(ioURL)
     if not response.ok:
-        raise ApplianceImageNotFound(origAppliance, ioURL, response.status_code)
+        raise _dockerApplianceImageNotFoundClass()(origAppliance, ioURL, response.status_code)
     else:
         return origAppliance
 
@@ -393,6 +423,7 @@ def requestCheckDockerIo(origAppliance, imageName, tag):
     :param str tag: The tag used at that docker image's registry.  e.g. "latest"
     :return: Return True if match found.  Raise otherwise.
     """
+    import requests
     # only official images like 'busybox' or 'ubuntu'
     if '/' not in imageName:
         imageName = 'library/' + imageName
@@ -405,7 +436,8 @@ def requestCheckDockerIo(origAppliance, imageName, tag):
     bearer = jsonToken["token"]
     response = requests.head(requests_url, headers={'Authorization': 'Bearer {}'.format(bearer)})
     if not response.ok:
-        raise ApplianceImageNotFound(origAppliance, requests_url, response.status_code)
+        raise _dockerApplianceImageNotFoundClass()(origAppliance, requests_url,
+                                                    response.status_code)
     else:
         return origAppliance
 
@@ -428,6 +460,7 @@ def _monkey_patch_boto():
     from boto import provider
     from botocore.session import Session
     from botocore.credentials import create_credential_resolver, RefreshableCredentials
+    from pytz import timezone
 
     # We cache the final credentials so that we don't send multiple processes to
     # simultaneously bang on the EC2 metadata server or ask for MFA pins from the
@@ -22,6 +22,7 @@ import logging
 from abc import ABCMeta, abstractmethod
 from collections import namedtuple
 from contextlib import contextmanager
+from six.moves.queue import Empty
 
 from toil.lib.objects import abstractclassmethod
 from toil.batchSystems import registry
@@ -54,6 +55,14 @@ class AbstractBatchSystem(with_metaclass(ABCMeta, object)):
     system must provide to Toil.
     """
 
+    # The results passed back by the workers of finished jobs, by job ID, see getWorkerResult().
+    # Batch systems that have a channel for the results set this to a dictionary, which they fill
+    # in before returning a job as updated.
+    workerResults = None
+    """
+    :type: dict[int,bytes]|None
+    """
+
     # noinspection PyMethodParameters
     @abstractclassmethod
     def supportsAutoDeployment(cls):
@@ -83,6 +92,18 @@ class AbstractBatchSystem(with_metaclass(ABCMeta, object)):
         """
         raise NotImplementedError()
 
+    @classmethod
+    def supportsWorkerPool(cls):
+        """
+        Whether this batch system can run the jobs in warm worker processes, which run one job
+        after the other, when --workerPool is given. Batch systems that start the worker processes
+        on a machine they control can do so by handing the commands of the jobs to a
+        :class:`toil.batchSystems.workerPool.WorkerPool` on that machine.
+
+        :rtype: bool
+        """
+        return False
+
     def setUserScript(self, userScript):
         """
         Set the user script for this workflow. This method must be called before the first job is
@@ -158,6 +179,49 @@ class AbstractBatchSystem(with_metaclass(ABCMeta, object)):
         """
         raise NotImplementedError()
 
+    def getUpdatedBatchJobs(self, maxWait, maxCount=None):
+        """
+        Returns as many jobs that have updated their status as are available, blocking only
+        while waiting for the first one.
+
+        :param float maxWait: the number of seconds to block, waiting for the first result
+
+        :param int maxCount: the maximum number of results to return, or None for no limit
+
+        :rtype: list[tuple(str, int, float)]
+        :return: A list of tuples (jobID, exitValue, wallTime) as returned by
+                 :meth:`getUpdatedBatchJob`, possibly empty if no result became available within
+                 maxWait seconds.
+
+        This default implementation calls :meth:`getUpdatedBatchJob`. Batch systems that keep
+        their updated jobs in a queue should override it to drain the queue directly.
+        """
+        updatedJobs = []
+        updatedJob = self.getUpdatedBatchJob(maxWait)
+        while updatedJob is not None:
+            updatedJobs.append(updatedJob)
+            if maxCount is not None and len(updatedJobs) >= maxCount:
+                break
+            updatedJob = self.getUpdatedBatchJob(0)
+        return updatedJobs
+
+    def getWorkerResult(self, jobID):
+        """
+        Returns the result the worker of the given job passed back through the batch system,
+        sparing the leader from loading the job from the job store. The result of a job can only
+        be retrieved once, after the job was returned by :meth:`getUpdatedBatchJob` or
+        :meth:`getUpdatedBatchJobs`.
+
+        :param int jobID: the ID of the job
+        :rtype: bytes or None
+        :return: the serialized record of the job as the worker left it in the job store, an
+                 empty string if the worker deleted the job, or None if the batch system didn't
+                 get a result from the worker, in which case the job store must be consulted.
+        """
+        if self.workerResults is None:
+            return None
+        return self.workerResults.pop(jobID, None)
+
     @abstractmethod
     def shutdown(self):
         """
@@ -226,6 +290,8 @@ class BatchSystemSupport(AbstractBatchSystem):
         self.workerCleanupInfo = WorkerCleanupInfo(workDir=self.config.workDir,
                                                    workflowID=self.config.workflowID,
                                                    cleanWorkDir=self.config.cleanWorkDir)
+        # See AbstractBatchSystem.workerResults
+        self.workerResults = {}
 
     def checkResourceRequest(self, memory, cores, disk):
         """
@@ -369,6 +435,18 @@ class BatchSystemLocalSupport(BatchSystemSupport):
         """To be called by getUpdatedBatchJob()"""
         return self.localBatch.getUpdatedBatchJob(maxWait)
 
+    def getUpdatedLocalJobs(self, maxWait, maxCount=None):
+        # type: (int, Optional[int]) -> List[Tuple[int, int, int]]
+        """To be called by getUpdatedBatchJobs()"""
+        return self.localBatch.getUpdatedBatchJobs(maxWait, maxCount)
+
+    def getWorkerResult(self, jobID):
+        # Local and batch jobs share the ID space, see getNextJobID()
+        result = self.localBatch.getWorkerResult(jobID)
+        if result is None:
+            result = super(BatchSystemLocalSupport, self).getWorkerResult(jobID)
+        return result
+
     def getNextJobID(self):  # type: () -> int
         """
         Must be used to get job IDs so that the local and batch jobs do not
@@ -384,6 +462,36 @@ class BatchSystemLocalSupport(BatchSystemSupport):
         self.localBatch.shutdown()
 
 
+def drainQueue(queue, maxWait, maxCount=None):
+    """
+    Get items from the given queue, waiting at most maxWait seconds for the first one and then
+    taking whatever else is immediately available, up to a total of maxCount items.
+
+    >>> from six.moves.queue import Queue
+    >>> q = Queue()
+    >>> for i in range(5): q.put(i)
+    >>> drainQueue(q, 0, maxCount=3)
+    [0, 1, 2]
+    >>> drainQueue(q, 0)
+    [3, 4]
+    >>> drainQueue(q, 0.01)
+    []
+
+    :param six.moves.queue.Queue queue: the queue to get the items from
+    :param float maxWait: the number of seconds to block, waiting for the first item
+    :param int maxCount: the maximum number of items to return, or None for no limit
+    :rtype: list
+    """
+    items = []
+    try:
+        items.append(queue.get(timeout=maxWait))
+        while maxCount is None or len(items) < maxCount:
+            items.append(queue.get_nowait())
+    except Empty:
+        pass
+    return items
+
+
 class NodeInfo(object):
     """
     The coresUsed attribute  is a floating point value between 0 (all cores idle) and 1 (all cores
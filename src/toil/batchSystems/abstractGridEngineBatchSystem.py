@@ -28,7 +28,7 @@ from future.utils import with_metaclass
 from toil import subprocess
 from toil.lib.objects import abstractclassmethod
 
-from toil.batchSystems.abstractBatchSystem import BatchSystemLocalSupport
+from toil.batchSystems.abstractBatchSystem import BatchSystemLocalSupport, drainQueue
 
 logger = logging.getLogger(__name__)
 
@@ -398,6 +398,20 @@ class AbstractGridEngineBatchSystem(BatchSystemLocalSupport):
             self.currentJobs.remove(jobID)
             return jobID, retcode, None
 
+    def getUpdatedBatchJobs(self, maxWait, maxCount=None):
+        updatedJobs = self.getUpdatedLocalJobs(0, maxCount)
+        if maxCount is not None:
+            maxCount -= len(updatedJobs)
+            if maxCount <= 0:
+                return updatedJobs
+        # Only wait on the batch system if there were no local jobs to return
+        maxWait = 0 if updatedJobs else maxWait
+        for jobID, retcode in drainQueue(self.updatedJobsQueue, maxWait, maxCount):
+            logger.debug('UpdatedJobsQueue Item: %s', (jobID, retcode))
+            self.currentJobs.remove(jobID)
+            updatedJobs.append((jobID, retcode, None))
+        return updatedJobs
+
     def shutdown(self):
         """
         Signals worker to shutdown (via sentinel) then cleanly joins the thread
@@ -45,7 +45,8 @@ from toil.lib.memoize import strict_bool
 from toil import resolveEntryPoint
 from toil.batchSystems.abstractBatchSystem import (AbstractScalableBatchSystem,
                                                    BatchSystemLocalSupport,
-                                                   NodeInfo)
+                                                   NodeInfo,
+                                                   drainQueue)
 from toil.batchSystems.mesos import ToilJob, MesosShape, TaskData, JobQueue
 
 log = logging.getLogger(__name__)
@@ -279,6 +280,30 @@ class MesosBatchSystem(BatchSystemLocalSupport,
                 return item
             else:
                 log.debug('Job %s ended naturally before it could be killed.', jobId)
+                # Nobody will ask for the result of the worker
+                self.workerResults.pop(jobId, None)
+
+    def getUpdatedBatchJobs(self, maxWait, maxCount=None):
+        updatedJobs = self.getUpdatedLocalJobs(0, maxCount)
+        if maxCount is not None:
+            maxCount -= len(updatedJobs)
+            if maxCount <= 0:
+                return updatedJobs
+        # Only wait on Mesos if there were no local jobs to return
+        maxWait = 0 if updatedJobs else maxWait
+        for item in drainQueue(self.updatedJobsQueue, maxWait, maxCount):
+            jobId, exitValue, wallTime = item
+            try:
+                self.intendedKill.remove(jobId)
+            except KeyError:
+                log.debug('Job %s ended with status %i, took %s seconds.', jobId, exitValue,
+                          '???' if wallTime is None else str(wallTime))
+                updatedJobs.append(item)
+            else:
+                log.debug('Job %s ended naturally before it could be killed.', jobId)
+                # Nobody will ask for the result of the worker
+                self.workerResults.pop(jobId, None)
+        return updatedJobs
 
     def nodeInUse(self, nodeIP):
         return nodeIP in self.hostToJobIDs
@@ -621,6 +646,15 @@ class MesosBatchSystem(BatchSystemLocalSupport,
                 # state from other threads.
                 self.killedJobIds.add(jobID)
 
+        def workerResult():
+            """
+            Keep the result of the worker the executor passed back, if any, for the leader.
+            """
+            for label in update.get('labels', {}).get('labels', []):
+                if label['key'] == 'workerResult':
+                    self.workerResults[jobID] = decode_data(label['value'])
+                    break
+
         if update.state == 'TASK_FINISHED':
             # We get the running time of the job via the timestamp, which is in job-local time in seconds
             labels = update.labels.labels
@@ -630,6 +664,7 @@ class MesosBatchSystem(BatchSystemLocalSupport,
                     wallTime = float(label['value'])
                     break
             assert(wallTime is not None)
+            workerResult()
             jobEnded(0, wallTime=wallTime)
         elif update.state == 'TASK_FAILED':
             try:
@@ -645,6 +680,7 @@ class MesosBatchSystem(BatchSystemLocalSupport,
                             update.message, update.reason,
                             update.executor_id, update.agent_id)
             
+            workerResult()
             jobEnded(exitStatus)
         elif update.state in ('TASK_LOST', 'TASK_KILLED', 'TASK_ERROR'):
             log.warning("Job %i is in unexpected state %s with message '%s' due to reason '%s'.",
@@ -41,6 +41,7 @@ from pymesos import MesosExecutorDriver, Executor, decode_data, encode_data
 from toil import subprocess, pickle
 from toil.lib.expando import Expando
 from toil.batchSystems.abstractBatchSystem import BatchSystemSupport
+from toil.worker import workerResultEnvVar, readWorkerResult
 from toil.resource import Resource
 
 log = logging.getLogger(__name__)
@@ -171,17 +172,22 @@ class MesosExecutor(Executor):
 
             # try to invoke a run on the unpickled task
             try:
-                process = runJob(taskData)
+                # The worker leaves its result in the sandbox, from where it is passed back to
+                # the leader with the status update
+                resultPath = os.path.abspath('%s.workerResult' % task.task_id.value)
+                process = runJob(taskData, resultPath)
                 self.runningTasks[task.task_id.value] = process.pid
                 try:
                     exitStatus = process.wait()
                     wallTime = time.time() - startTime
+                    result = readWorkerResult(resultPath)
                     if 0 == exitStatus:
-                        sendUpdate(task, 'TASK_FINISHED', wallTime)
+                        sendUpdate(task, 'TASK_FINISHED', wallTime, result=result)
                     elif -9 == exitStatus:
                         sendUpdate(task, 'TASK_KILLED', wallTime)
                     else:
-                        sendUpdate(task, 'TASK_FAILED', wallTime, msg=str(exitStatus))
+                        sendUpdate(task, 'TASK_FAILED', wallTime, msg=str(exitStatus),
+                                   result=result)
                 finally:
                     del self.runningTasks[task.task_id.value]
             except:
@@ -195,10 +201,12 @@ class MesosExecutor(Executor):
             sendUpdate(task, 'TASK_FINISHED', wallTime)
 
 
-        def runJob(job):
+        def runJob(job, resultPath):
             """
             :type job: toil.batchSystems.mesos.ToilJob
 
+            :param str resultPath: the file the worker should leave its result in
+
             :rtype: subprocess.Popen
             """
             if job.userScript:
@@ -206,13 +214,14 @@ class MesosExecutor(Executor):
             log.debug("Invoking command: '%s'", job.command)
             # Construct the job's environment
             jobEnv = dict(os.environ, **job.environment)
+            jobEnv[workerResultEnvVar] = resultPath
             log.debug('Using environment variables: %s', jobEnv.keys())
             with self.popenLock:
                 return subprocess.Popen(job.command,
                                         preexec_fn=lambda: os.setpgrp(),
                                         shell=True, env=jobEnv)
 
-        def sendUpdate(task, taskState, wallTime, msg=''):
+        def sendUpdate(task, taskState, wallTime, msg='', result=None):
             update = addict.Dict()
             update.task_id.value = task.task_id.value
             if self.id is not None:
@@ -221,9 +230,11 @@ class MesosExecutor(Executor):
             update.state = taskState
             update.message = msg
 
-            # Add wallTime as a label.
+            # Add wallTime and the result of the worker, if any, as labels.
             labels = addict.Dict()
             labels.labels = [{'key': 'wallTime', 'value': str(wallTime)}]
+            if result is not None:
+                labels.labels.append({'key': 'workerResult', 'value': encode_data(result)})
             update.labels = labels
 
             driver.sendStatusUpdate(update)
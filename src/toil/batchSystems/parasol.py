@@ -34,7 +34,7 @@ from six import itervalues
 from toil.lib.iterables import concat
 from toil import which
 
-from toil.batchSystems.abstractBatchSystem import BatchSystemSupport
+from toil.batchSystems.abstractBatchSystem import BatchSystemSupport, drainQueue
 from toil.lib.bioio import getTempFile
 from toil.common import Toil
 
@@ -68,9 +68,9 @@ class ParasolBatchSystem(BatchSystemSupport):
         logger.debug('Using Parasol at %s', command)
         self.parasolCommand = command
         jobStoreType, path = Toil.parseLocator(config.jobStore)
-        if jobStoreType != 'file':
+        if jobStoreType not in ('file', 'sqlite'):
             raise RuntimeError("The parasol batch system doesn't currently work with any "
-                               "jobStore type except file jobStores.")
+                               "jobStore type except file and sqlite jobStores.")
         self.parasolResultsDir = tempfile.mkdtemp(dir=os.path.abspath(path))
         logger.debug("Using parasol results dir: %s", self.parasolResultsDir)
 
@@ -280,6 +280,18 @@ class ParasolBatchSystem(BatchSystemSupport):
             else:
                 return jobID, status, wallTime
 
+    def getUpdatedBatchJobs(self, maxWait, maxCount=None):
+        updatedJobs = []
+        for jobID, status, wallTime in drainQueue(self.updatedJobsQueue, maxWait, maxCount):
+            try:
+                self.runningJobs.remove(jobID)
+            except KeyError:
+                # We tried to kill this job, but it ended by itself instead, so skip it.
+                pass
+            else:
+                updatedJobs.append((jobID, status, wallTime))
+        return updatedJobs
+
     def updatedJobWorker(self):
         """
         We use the parasol results to update the status of jobs, adding them
@@ -24,6 +24,8 @@ from contextlib import contextmanager
 import logging
 import multiprocessing
 import os
+import shutil
+import tempfile
 import time
 import math
 from threading import Thread
@@ -32,7 +34,8 @@ from six.moves.queue import Empty, Queue
 
 import toil
 from toil import subprocess
-from toil.batchSystems.abstractBatchSystem import BatchSystemSupport
+from toil.batchSystems.abstractBatchSystem import BatchSystemSupport, drainQueue
+from toil.batchSystems.workerPool import WorkerPool, isWorkerCommand
 from toil import worker as toil_worker
 from toil.common import Toil
 
@@ -53,6 +56,10 @@ class SingleMachineBatchSystem(BatchSystemSupport):
     def supportsWorkerCleanup(cls):
         return True
 
+    @classmethod
+    def supportsWorkerPool(cls):
+        return True
+
     numCores = multiprocessing.cpu_count()
 
     minCores = 0.1
@@ -103,6 +110,10 @@ class SingleMachineBatchSystem(BatchSystemSupport):
         """
         :type: dict[str,Info]
         """
+        # The directory the workers leave their results in, see toil.worker.writeWorkerResult()
+        self.workerResultDir = tempfile.mkdtemp(prefix='toilWorkerResults')
+        # The warm worker processes that run the jobs, if requested, see toil.batchSystems.workerPool
+        self.workerPool = WorkerPool(config.workerPoolMaxJobs) if config.workerPool else None
         # The list of worker threads
         self.workerThreads = []
         """
@@ -140,6 +151,7 @@ class SingleMachineBatchSystem(BatchSystemSupport):
         debugWorker is True.
         """
         startTime = time.time()  # Time job is started
+        resultPath = os.path.join(self.workerResultDir, str(jobID))
         if self.debugWorker and "_toil_worker" in jobCommand:
             # Run the worker without forking
             jobName, jobStoreLocator, jobStoreID = jobCommand.split()[1:] # Parse command
@@ -151,17 +163,24 @@ class SingleMachineBatchSystem(BatchSystemSupport):
                 self.runningJobs[jobID] = info
                 try:
                     toil_worker.workerScript(jobStore, jobStore.config, jobName, jobStoreID, 
-                                             redirectOutputToLogFile=not self.debugWorker) # Call the worker
+                                             redirectOutputToLogFile=not self.debugWorker,
+                                             resultPath=resultPath) # Call the worker
                 finally:
                     self.runningJobs.pop(jobID)
             finally:
+                self._collectWorkerResult(jobID, resultPath, info)
                 if not info.killIntended:
                     self.outputQueue.put((jobID, 0, time.time() - startTime))
         else:
+            environment = dict(environment)
+            environment[toil_worker.workerResultEnvVar] = resultPath
             with self.popenLock:
-                popen = subprocess.Popen(jobCommand,
-                                         shell=True,
-                                         env=dict(os.environ, **environment))
+                if self.workerPool is not None and isWorkerCommand(jobCommand):
+                    popen = self.workerPool.submit(jobCommand, environment)
+                else:
+                    popen = subprocess.Popen(jobCommand,
+                                             shell=True,
+                                             env=dict(os.environ, **environment))
             info = Info(time.time(), popen, killIntended=False)
             try:
                 self.runningJobs[jobID] = info
@@ -173,8 +192,18 @@ class SingleMachineBatchSystem(BatchSystemSupport):
                 finally:
                     self.runningJobs.pop(jobID)
             finally:
+                self._collectWorkerResult(jobID, resultPath, info)
                 if not info.killIntended:
                     self.outputQueue.put((jobID, statusCode, time.time() - startTime))
+
+    def _collectWorkerResult(self, jobID, resultPath, info):
+        """
+        Pick up the result the worker left, which must happen before the job is reported as
+        updated, so that the leader finds it.
+        """
+        result = toil_worker.readWorkerResult(resultPath)
+        if result is not None and not info.killIntended:
+            self.workerResults[jobID] = result
         
     # Note: The input queue is passed as an argument because the corresponding attribute is reset
     # to None in shutdown()
@@ -278,6 +307,9 @@ class SingleMachineBatchSystem(BatchSystemSupport):
             inputQueue.put(None)
         for thread in self.workerThreads:
             thread.join()
+        if self.workerPool is not None:
+            self.workerPool.shutdown()
+        shutil.rmtree(self.workerResultDir, ignore_errors=True)
         BatchSystemSupport.workerCleanup(self.workerCleanupInfo)
 
     def getUpdatedBatchJob(self, maxWait):
@@ -291,6 +323,14 @@ class SingleMachineBatchSystem(BatchSystemSupport):
         log.debug("Ran jobID: %s with exit value: %i", jobID, exitValue)
         return jobID, exitValue, wallTime
 
+    def getUpdatedBatchJobs(self, maxWait, maxCount=None):
+        """Drains the queue of finished jobs, returning the list of their results."""
+        updatedJobs = drainQueue(self.outputQueue, maxWait, maxCount)
+        for jobID, exitValue, wallTime in updatedJobs:
+            self.jobs.pop(jobID)
+            log.debug("Ran jobID: %s with exit value: %i", jobID, exitValue)
+        return updatedJobs
+
     @classmethod
     def setOptions(cls, setOption):
         setOption("scale", default=1)
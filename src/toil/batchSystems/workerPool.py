@@ -0,0 +1,236 @@
+# Copyright (C) 2015-2019 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Warm worker processes, which run one job after the other without paying for the startup of the
+interpreter, the imports of Toil and the user script, and the resumption of the job store for
+every job.
+
+A batch system that runs the workers on a machine it controls, like the single machine batch
+system, can hand its worker commands to a :class:`WorkerPool` instead of starting a process for
+each of them, see :meth:`toil.batchSystems.abstractBatchSystem.AbstractBatchSystem.supportsWorkerPool`.
+Each warm worker runs a single job at a time. It is replaced after it ran --workerPoolMaxJobs
+jobs, or a job that failed, so that state leaked by the jobs doesn't accumulate.
+"""
+from __future__ import absolute_import
+from builtins import object
+from builtins import str
+import logging
+import os
+import pickle
+import shlex
+import socket
+import sys
+from threading import Lock
+
+from toil import subprocess
+from toil.common import Toil
+from toil.worker import workerResultEnvVar, workerScript
+
+log = logging.getLogger(__name__)
+
+
+def isWorkerCommand(jobCommand):
+    """
+    Returns True if the given command runs a Toil worker, which a warm worker can run instead.
+    The leader refers to the worker's entry point by its absolute path if Toil is installed in a
+    virtualenv, see :func:`toil.resolveEntryPoint`.
+    """
+    try:
+        args = shlex.split(jobCommand)
+    except ValueError:
+        return False
+    return len(args) == 4 and os.path.basename(args[0]) == '_toil_worker'
+
+
+class WorkerPool(object):
+    """
+    A pool of warm worker processes on this machine.
+    """
+
+    def __init__(self, maxJobsPerWorker):
+        """
+        :param int maxJobsPerWorker: the number of jobs after which a warm worker is replaced
+        """
+        self.maxJobsPerWorker = maxJobsPerWorker
+        # The warm workers waiting for a job
+        self.idleWorkers = []
+        """
+        :type: list[WarmWorker]
+        """
+        self.lock = Lock()
+
+    def submit(self, jobCommand, environment):
+        """
+        Run the given worker command in an idle warm worker, starting one if there is none.
+
+        :param str jobCommand: the command running the worker, see :func:`isWorkerCommand`
+        :param dict environment: the environment variables to set for the job, in addition to
+               those of the current process
+
+        :return: a handle to wait for the job with, mimicking :class:`subprocess.Popen`
+        :rtype: WarmWorkerJob
+        """
+        assert isWorkerCommand(jobCommand)
+        with self.lock:
+            warmWorker = self.idleWorkers.pop() if self.idleWorkers else None
+        if warmWorker is not None:
+            try:
+                warmWorker.send((jobCommand, environment))
+            except (IOError, OSError):
+                log.warning('Warm worker %i died while idle, replacing it.', warmWorker.popen.pid)
+                warmWorker.close()
+                warmWorker = None
+        if warmWorker is None:
+            warmWorker = WarmWorker()
+            warmWorker.send((jobCommand, environment))
+        return WarmWorkerJob(self, warmWorker)
+
+    def _release(self, warmWorker, jobFailed):
+        """
+        Return the given warm worker to the pool after it ran a job, or retire it.
+        """
+        warmWorker.numJobs += 1
+        if jobFailed or warmWorker.numJobs >= self.maxJobsPerWorker:
+            warmWorker.close()
+        else:
+            with self.lock:
+                self.idleWorkers.append(warmWorker)
+
+    def shutdown(self):
+        """
+        Stop the idle warm workers. Jobs still running must be waited for, or killed, first.
+        """
+        with self.lock:
+            idleWorkers, self.idleWorkers = self.idleWorkers, []
+        for warmWorker in idleWorkers:
+            warmWorker.close()
+
+
+class WarmWorker(object):
+    """
+    A worker process running the jobs sent to it over a socket, one after the other, see
+    :func:`main`.
+    """
+
+    def __init__(self):
+        parentSocket, childSocket = socket.socketpair()
+        try:
+            self.popen = subprocess.Popen([sys.executable, '-m', __name__,
+                                           str(childSocket.fileno())],
+                                          pass_fds=[childSocket.fileno()])
+        finally:
+            childSocket.close()
+        self.socket = parentSocket
+        self.channel = parentSocket.makefile('rwb')
+        self.numJobs = 0
+        log.debug('Started warm worker %i.', self.popen.pid)
+
+    def send(self, message):
+        pickle.dump(message, self.channel, protocol=2)
+        self.channel.flush()
+
+    def receive(self):
+        return pickle.load(self.channel)
+
+    def close(self):
+        """
+        Stop the worker, which exits once it sees the end of the channel, or was killed already.
+        """
+        try:
+            self.channel.close()
+        except (IOError, OSError):
+            # Unflushed data can't be written if the worker died
+            pass
+        self.socket.close()
+        self.popen.wait()
+        log.debug('Stopped warm worker %i after %i jobs.', self.popen.pid, self.numJobs)
+
+
+class WarmWorkerJob(object):
+    """
+    A job running in a warm worker. Like :class:`subprocess.Popen` it has a pid, which can be
+    killed to kill the job, and a wait method returning the exit status of the job.
+    """
+
+    def __init__(self, pool, warmWorker):
+        self.pool = pool
+        self.warmWorker = warmWorker
+        self.pid = warmWorker.popen.pid
+
+    def wait(self):
+        try:
+            exitStatus, jobFailed = self.warmWorker.receive()
+        except (EOFError, IOError, OSError, pickle.UnpicklingError):
+            # The worker died while running the job, e.g. because the job was killed
+            self.warmWorker.close()
+            exitStatus = self.warmWorker.popen.returncode or 1
+        else:
+            self.pool._release(self.warmWorker, exitStatus != 0 or jobFailed)
+        return exitStatus
+
+
+def runJob(jobCommand, environment, jobStores):
+    """
+    Run the given worker command in this process, and undo the changes the worker makes to the
+    environment, the module search path and the working directory.
+
+    :param dict jobStores: the job stores resumed by earlier jobs, by locator
+
+    :return: the exit status the worker would have had if it ran in a process of its own, and
+             whether the job failed
+    :rtype: tuple[int,bool]
+    """
+    environ, path, cwd = dict(os.environ), list(sys.path), os.getcwd()
+    os.environ.update(environment)
+    try:
+        jobName, jobStoreLocator, jobStoreID = shlex.split(jobCommand)[1:]
+        try:
+            jobStore = jobStores[jobStoreLocator]
+        except KeyError:
+            jobStore = jobStores[jobStoreLocator] = Toil.resumeJobStore(jobStoreLocator)
+        jobFailed = workerScript(jobStore, jobStore.config, jobName, jobStoreID,
+                                 resultPath=os.environ.pop(workerResultEnvVar, None))
+        return 0, jobFailed
+    except SystemExit as e:
+        return (e.code if isinstance(e.code, int) else int(e.code is not None)), True
+    except:
+        log.exception('The worker failed to run the job.')
+        return 1, True
+    finally:
+        os.environ.clear()
+        os.environ.update(environ)
+        sys.path[:] = path
+        os.chdir(cwd)
+
+
+def main(fd):
+    """
+    Run the jobs sent over the socket with the given file descriptor until it is closed, sending
+    back the result of each, see :func:`runJob`.
+    """
+    sock = socket.fromfd(fd, socket.AF_UNIX, socket.SOCK_STREAM)
+    os.close(fd)
+    channel = sock.makefile('rwb')
+    jobStores = {}
+    while True:
+        try:
+            jobCommand, environment = pickle.load(channel)
+        except EOFError:
+            break
+        pickle.dump(runJob(jobCommand, environment, jobStores), channel, protocol=2)
+        channel.flush()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]))
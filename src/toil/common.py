@@ -27,7 +27,6 @@ import sys
 import tempfile
 import time
 import uuid
-import requests
 from argparse import ArgumentParser
 from six import iteritems
 
@@ -38,11 +37,11 @@ from toil import pickle
 from toil import logProcessContext
 from toil.lib.bioio import addLoggingOptions, getLogLevelString, setLoggingFromOptions
 from toil.realtimeLogger import RealtimeLogger
+from toil.schedulingPolicy import schedulingPolicies
+from toil.fileStores.cacheEvictionPolicy import cacheEvictionPolicies
 from toil.batchSystems.options import addOptions as addBatchOptions
 from toil.batchSystems.options import setDefaultOptions as setDefaultBatchOptions
 from toil.batchSystems.options import setOptions as setBatchOptions
-from toil.provisioners import clusterFactory
-from toil.provisioners.aws import checkValidNodeTypes, zoneToRegion
 from toil import lookupEnvVar
 from toil.version import dockerRegistry, dockerTag
 
@@ -85,7 +84,6 @@ class Config(object):
         # Autoscaling options
         self.provisioner = None
         self.nodeTypes = []
-        checkValidNodeTypes(self.provisioner, self.nodeTypes)
         self.nodeOptions = None
         self.minNodes = None
         self.maxNodes = [10]
@@ -116,10 +114,17 @@ class Config(object):
         self.retryCount = 1
         self.maxJobDuration = sys.maxsize
         self.rescueJobsFrequency = 3600
+        self.leaderStateInterval = 600
+        self.schedulingPolicy = 'priority'
+        self.maxIssuedJobs = sys.maxsize
+        self.maxIssuedJobsPerName = sys.maxsize
 
         # Misc
         self.disableCaching = True
+        self.cacheEvictionPolicy = 'lru'
         self.disableChaining = False
+        self.maxChainedSiblings = 1
+        self.maxWorkerFanOut = 1
         self.maxLogFileSize = 64000
         self.writeLogs = None
         self.writeLogsGzip = None
@@ -127,6 +132,8 @@ class Config(object):
         self.cseKey = None
         self.servicePollingInterval = 60
         self.useAsync = True
+        self.maxParallelUploads = 2
+        self.maxParallelUploadParts = 2
         self.forceDockerAppliance = False
         self.runCwlInternalJobsOnWorkers = False
 
@@ -167,7 +174,7 @@ class Config(object):
 
         def parseJobStore(s):
             name, rest = Toil.parseLocator(s)
-            if name == 'file':
+            if name in ('file', 'sqlite'):
                 # We need to resolve relative paths early, on the leader, because the worker process
                 # may have a different working directory than the leader, e.g. under Mesos.
                 return Toil.buildLocator(name, os.path.abspath(rest))
@@ -262,11 +269,22 @@ class Config(object):
         setOption("retryCount", int, iC(1))
         setOption("maxJobDuration", int, iC(1))
         setOption("rescueJobsFrequency", int, iC(1))
+        setOption("leaderStateInterval", int, iC(0))
+        setOption("schedulingPolicy")
+        setOption("maxIssuedJobs", int, iC(1))
+        setOption("maxIssuedJobsPerName", int, iC(1))
 
         # Misc
         setOption("maxLocalJobs", int)
+        setOption("workerPool")
+        setOption("workerPoolMaxJobs", int, iC(1))
         setOption("disableCaching")
+        setOption("cacheEvictionPolicy")
+        setOption("maxParallelUploads", int, iC(1))
+        setOption("maxParallelUploadParts", int, iC(1))
         setOption("disableChaining")
+        setOption("maxChainedSiblings", int, iC(1))
+        setOption("maxWorkerFanOut", int, iC(1))
         setOption("maxLogFileSize", h2b, iC(1))
         setOption("writeLogs")
         setOption("writeLogsGzip")
@@ -299,6 +317,8 @@ jobStoreLocatorHelp = ("A job store holds persistent information about the jobs
                        "job store implementation, the location should be formatted according to "
                        "one of the following schemes:\n\n"
                        "file:<path> where <path> points to a directory on the file systen\n\n"
+                       "sqlite:<path> where <path> points to a directory on the file system, like "
+                       "file:<path> but with the job records kept in a single SQLite database\n\n"
                        "aws:<region>:<prefix> where <region> is the name of an AWS region like "
                        "us-west-2 and <prefix> will be prepended to the names of any top-level "
                        "AWS resources in use by job store, e.g. S3 buckets.\n\n "
@@ -520,6 +540,28 @@ def _addOptions(addGroupFn, config):
                 help=("Period of time to wait (in seconds) between checking for "
                       "missing/overlong jobs, that is jobs which get lost by the batch "
                       "system. Expert parameter. default=%s" % config.rescueJobsFrequency))
+    addOptionFn("--leaderStateInterval", dest="leaderStateInterval", default=None,
+                help=("Period of time (in seconds) between snapshots of the leader's state "
+                      "written to the job store, which let a restart of the workflow skip "
+                      "rebuilding the state from all jobs. Set to 0 to disable snapshots. "
+                      "default=%s" % config.leaderStateInterval))
+    addOptionFn("--schedulingPolicy", dest="schedulingPolicy", default=None,
+                choices=sorted(schedulingPolicies),
+                help=("The order in which the leader issues jobs that are ready to run at the "
+                      "same time. 'priority' issues them in the order of the priorities given "
+                      "to the jobs. 'criticalPath' also issues jobs whose name is associated "
+                      "with the longest time until all successors are done first, based on the "
+                      "jobs that completed earlier in the workflow. default=%s"
+                      % config.schedulingPolicy))
+    addOptionFn("--maxIssuedJobs", dest="maxIssuedJobs", default=None,
+                help=("The maximum number of jobs, excluding service jobs, that the leader has "
+                      "issued to the batch system at any time. The leader holds the jobs beyond "
+                      "this limit and issues them as issued jobs finish. default=%s"
+                      % config.maxIssuedJobs))
+    addOptionFn("--maxIssuedJobsPerName", dest="maxIssuedJobsPerName", default=None,
+                help=("The maximum number of jobs with the same name, excluding service jobs, "
+                      "that the leader has issued to the batch system at any time. "
+                      "default=%s" % config.maxIssuedJobsPerName))
 
     #
     # Misc options
@@ -530,9 +572,35 @@ def _addOptions(addGroupFn, config):
                 help='Disables caching in the file store. This flag must be set to use '
                      'a batch system that does not support caching such as Grid Engine, Parasol, '
                      'LSF, or Slurm')
+    addOptionFn("--cacheEvictionPolicy", dest="cacheEvictionPolicy", default=None,
+                choices=sorted(cacheEvictionPolicies),
+                help=("The order in which the caching file store evicts the cached files no job "
+                      "is using, when it needs room for a job. 'lru' evicts the least recently "
+                      "used files first, 'lfu' the least frequently used files, and 'size' the "
+                      "files read the least often per byte. default=%s"
+                      % config.cacheEvictionPolicy))
+    addOptionFn("--maxParallelUploads", dest="maxParallelUploads", default=None,
+                help=("The largest number of files written by the jobs that the caching file "
+                      "store of a worker uploads to the job store at the same time, in the "
+                      "background. default=%s" % config.maxParallelUploads))
+    addOptionFn("--maxParallelUploadParts", dest="maxParallelUploadParts", default=None,
+                help=("The largest number of parts of a file that are uploaded at the same time, "
+                      "with job stores that upload large files in parts, i.e. the AWS job store. "
+                      "Each part being uploaded from a stream is held in memory. "
+                      "default=%s" % config.maxParallelUploadParts))
     addOptionFn('--disableChaining', dest='disableChaining', action='store_true', default=False,
                 help="Disables chaining of jobs (chaining uses one job's resource allocation "
                 "for its successor job if possible).")
+    addOptionFn("--maxChainedSiblings", dest="maxChainedSiblings", default=None,
+                help=("The largest number of jobs that are ready to run at the same time, e.g. "
+                      "the children of a job, that a worker may run one after the other when "
+                      "they fit within its resource allocation, instead of returning them to the "
+                      "leader to be run in parallel. default=%s" % config.maxChainedSiblings))
+    addOptionFn("--maxWorkerFanOut", dest="maxWorkerFanOut", default=None,
+                help=("The largest number of jobs that are ready to run at the same time, e.g. "
+                      "the children of a job, that a worker may run in parallel, each in a "
+                      "process of its own, when their requirements add up to no more than its "
+                      "resource allocation. default=%s" % config.maxWorkerFanOut))
     addOptionFn("--maxLogFileSize", dest="maxLogFileSize", default=None,
                 help=("The maximum size of a job log file to keep (in bytes), log files "
                       "larger than this will be truncated to the last X bytes. Setting "
@@ -666,6 +734,13 @@ class Toil(object):
     and its configuration.
     """
 
+    # The name of the shared file in the job store holding the snapshot of the leader's state
+    leaderStateFileName = 'leaderState'
+
+    # The name of the shared file in the job store holding the generation of the snapshots of
+    # the leader's state that are valid, see toil.leader.Leader.writeStateSnapshot
+    leaderGenerationFileName = 'leaderGeneration'
+
     def __init__(self, options):
         """
         Initialize a Toil object from the given options. Note that this is very light-weight and
@@ -807,17 +882,65 @@ class Toil(object):
         try:
             self._setBatchSystemEnvVars()
             self._serialiseEnv()
-            self._cacheAllJobs()
-            self._setProvisioner()
-            rootJobGraph = self._jobStore.clean(jobCache=self._jobCache)
-            return self._runMainLoop(rootJobGraph)
+            leaderState = self._loadLeaderState()
+            # Nothing may restore the snapshot after the job store changes, not even this leader
+            # if it fails before writing a snapshot of its own
+            self._invalidateLeaderState()
+            if leaderState is None:
+                self._cacheAllJobs()
+                self._setProvisioner()
+                rootJobGraph = self._jobStore.clean(jobCache=self._jobCache)
+            else:
+                # The leader state replaces cleaning the job store, apart from the jobs the
+                # previous leader was working on, which are repaired as the state is restored.
+                self._setProvisioner()
+                self._jobStore.discardStatsAndLogging()
+                rootJobGraph = self._jobStore.loadRootJob()
+            return self._runMainLoop(rootJobGraph, leaderState=leaderState)
         finally:
             self._shutdownBatchSystem()
 
+    def _loadLeaderState(self):
+        """
+        Load the snapshot of the leader's state written by a previous leader of this workflow.
+
+        :return: the snapshot, or None if there is none or snapshots are disabled
+        :rtype: dict|None
+        """
+        if not self.config.leaderStateInterval:
+            return None
+        from toil.jobStores.abstractJobStore import NoSuchFileException
+        try:
+            with self._jobStore.readSharedFileStream(self.leaderStateFileName) as f:
+                leaderState = safeUnpickleFromStream(f)
+            with self._jobStore.readSharedFileStream(self.leaderGenerationFileName) as f:
+                generation = f.read().decode('utf-8')
+        except NoSuchFileException:
+            logger.info('No snapshot of the leader state found, rebuilding it from the job store.')
+            return None
+        if leaderState['workflowID'] != self.config.workflowID:
+            logger.warning('Ignoring the snapshot of the leader state of a different workflow.')
+            return None
+        if leaderState.get('generation') != generation:
+            # A later leader ran, or the snapshot became invalid before the leader stopped
+            logger.info('The snapshot of the leader state is out of date, rebuilding the state '
+                        'from the job store.')
+            return None
+        return leaderState['state']
+
+    def _invalidateLeaderState(self):
+        """
+        Invalidate any snapshot of the leader's state in the job store by recording a new
+        generation of snapshots, see :meth:`_loadLeaderState`.
+        """
+        with self._jobStore.writeSharedFileStream(self.leaderGenerationFileName) as f:
+            f.write(str(uuid.uuid4()).encode('utf-8'))
+
     def _setProvisioner(self):
         if self.config.provisioner is None:
             self._provisioner = None
         else:
+            from toil.provisioners import clusterFactory
             self._provisioner = clusterFactory(provisioner=self.config.provisioner,
                                                clusterName=None,
                                                zone=None, # read from instance meta-data
@@ -839,6 +962,9 @@ class Toil(object):
         if name == 'file':
             from toil.jobStores.fileJobStore import FileJobStore
             return FileJobStore(rest)
+        elif name == 'sqlite':
+            from toil.jobStores.sqliteJobStore import SQLiteJobStore
+            return SQLiteJobStore(rest)
         elif name == 'aws':
             from toil.jobStores.aws.jobStore import AWSJobStore
             return AWSJobStore(rest)
@@ -902,6 +1028,9 @@ class Toil(object):
             raise RuntimeError('%s currently does not support shared caching.  Set the '
                                '--disableCaching flag if you want to '
                                'use this batch system.' % config.batchSystem)
+        if config.workerPool and not batchSystemClass.supportsWorkerPool():
+            logger.warning('%s does not support warm worker processes, ignoring --workerPool.',
+                           config.batchSystem)
         logger.debug('Using the %s' %
                     re.sub("([a-z])([A-Z])", "\g<1> \g<2>", batchSystemClass.__name__).lower())
 
@@ -1034,10 +1163,11 @@ class Toil(object):
             logger.debug('Created the workflow directory at %s' % workflowDir)
         return workflowDir
 
-    def _runMainLoop(self, rootJob):
+    def _runMainLoop(self, rootJob, leaderState=None):
         """
         Runs the main loop with the given job.
         :param toil.job.Job rootJob: The root job for the workflow.
+        :param dict leaderState: A snapshot of the state of the previous leader to restore.
         :rtype: Any
         """
         logProcessContext(self.config)
@@ -1051,7 +1181,8 @@ class Toil(object):
                           provisioner=self._provisioner,
                           jobStore=self._jobStore,
                           rootJob=rootJob,
-                          jobCache=self._jobCache).run()
+                          jobCache=self._jobCache,
+                          leaderState=leaderState).run()
 
     def _shutdownBatchSystem(self):
         """
@@ -1100,6 +1231,7 @@ class ToilMetrics:
             clusterName = provisioner.clusterName
             if provisioner._zone is not None:
                 if provisioner.cloud == 'aws':
+                    from toil.provisioners.aws import zoneToRegion
                     # Remove AZ name
                     region = zoneToRegion(provisioner._zone)
                 else:
@@ -1197,6 +1329,8 @@ class ToilMetrics:
             return
 
         # Add prometheus data source
+        import requests
+
         def requestPredicate(e):
             if isinstance(e, requests.exceptions.ConnectionError):
                 return True
@@ -1230,6 +1364,9 @@ class ToilMetrics:
     def logQueueSize(self, queueSize):
         self.log("queue_size %i" % queueSize)
 
+    def logHeldJobs(self, heldJobs):
+        self.log("held_jobs %i" % heldJobs)
+
     def logIssuedJob(self, jobType):
         self.log("issued_job %s" % jobType)
 
@@ -1239,6 +1376,12 @@ class ToilMetrics:
     def logCompletedJob(self, jobType):
         self.log("completed_job %s" % jobType)
 
+    def logLeaderLoopLatency(self, latency):
+        self.log("leader_loop_latency %f" % latency)
+
+    def logJobsProcessedPerSecond(self, jobsPerSecond):
+        self.log("jobs_processed_per_second %f" % jobsPerSecond)
+
     def shutdown(self):
         if self.mtailProc:
             self.mtailProc.kill()
@@ -28,7 +28,6 @@ from threading import Thread, Semaphore, Event
 from future.utils import with_metaclass
 from six.moves.queue import Empty, Queue
 import base64
-import dill
 import errno
 import logging
 import os
@@ -76,14 +75,32 @@ class AbstractFileStore(with_metaclass(ABCMeta, object)):
     def __init__(self, jobStore, jobGraph, localTempDir, inputBlockFn):
         self.jobStore = jobStore
         self.jobGraph = jobGraph
-        self.localTempDir = os.path.abspath(localTempDir)
+        # The worker directory. The directory of each job is created in it by open().
+        self.workerTempDir = os.path.abspath(localTempDir)
+        self.localTempDir = self.workerTempDir
         self.workFlowDir = os.path.dirname(self.localTempDir)
-        self.jobName = self.jobGraph.command.split()[1]
+        self.jobName = str(self.jobGraph)
         self.inputBlockFn = inputBlockFn
         self.loggingMessages = []
         self.filesToDelete = set()
         self.jobsToDelete = set()
 
+    def _setJobGraph(self, jobGraph):
+        """
+        Make this file store serve the given job, discarding the state of the job it served
+        before. A worker running a chain of jobs uses a single file store for all of them, and
+        calls this before running each job after the first, or before updating the job graph
+        without running a job.
+
+        :param toil.jobGraph.JobGraph jobGraph: the job to serve
+        """
+        self.jobGraph = jobGraph
+        self.jobName = str(jobGraph)
+        self.localTempDir = self.workerTempDir
+        self.loggingMessages = []
+        self.filesToDelete = set()
+        self.jobsToDelete = set()
+
     @staticmethod
     def createFileStore(jobStore, jobGraph, localTempDir, inputBlockFn, caching):
         # Defer these imports until runtime, since these classes depend on us
@@ -294,55 +311,6 @@ class AbstractFileStore(with_metaclass(ABCMeta, object)):
         else:
             return os.path.join(self.localTempDir, filePath)
 
-    class _StateFile(object):
-        """
-        Utility class to read and write dill-ed state dictionaries from/to a file into a namespace.
-        """
-        def __init__(self, stateDict):
-            assert isinstance(stateDict, dict)
-            self.__dict__.update(stateDict)
-
-        @abstractclassmethod
-        @contextmanager
-        def open(cls, outer=None):
-            """
-            This is a context manager that state file and reads it into an object that is returned
-            to the user in the yield.
-
-            :param outer: Instance of the calling class (to use outer methods).
-            """
-            raise NotImplementedError()
-
-        @classmethod
-        def _load(cls, fileName):
-            """
-            Load the state of the cache from the state file
-
-            :param str fileName: Path to the cache state file.
-            :return: An instance of the state as a namespace.
-            :rtype: _StateFile
-            """
-            # Read the value from the cache state file then initialize and instance of
-            # _CacheState with it.
-            with open(fileName, 'rb') as fH:
-                infoDict = dill.load(fH)
-            return cls(infoDict)
-
-        def write(self, fileName):
-            """
-            Write the current state into a temporary file then atomically rename it to the main
-            state file.
-
-            :param str fileName: Path to the state file.
-            """
-            with open(fileName + '.tmp', 'wb') as fH:
-                # Based on answer by user "Mark" at:
-                # http://stackoverflow.com/questions/2709800/how-to-pickle-yourself
-                # We can't pickle nested classes. So we have to pickle the variables of the class
-                # If we ever change this, we need to ensure it doesn't break FileID
-                dill.dump(self.__dict__, fH)
-            os.rename(fileName + '.tmp', fileName)
-
     @abstractclassmethod
     def findAndHandleDeadJobs(cls, nodeInfo, batchSystemShutdown=False):
         """
@@ -370,7 +338,9 @@ class AbstractFileStore(with_metaclass(ABCMeta, object)):
     @abstractmethod
     def _updateJobWhenDone(self):
         """
-        Update the status of the job on the disk.
+        Update the status of the job on the disk. Changes made to the job graph, and the
+        files and jobs to delete, after this returns must not affect the update, so that the
+        worker can go on to change them for the next job.
         """
         raise NotImplementedError()
 
@@ -383,6 +353,31 @@ class AbstractFileStore(with_metaclass(ABCMeta, object)):
         """
         raise NotImplementedError()
 
+    def _prefetch(self, fileStoreIDs, jobDisk):
+        """
+        Start downloading the files the next job will read in the background, so that
+        readGlobalFile only has to wait for the downloads that are still in progress. File
+        stores without a cache to download the files into ignore this.
+
+        :param list[toil.fileStores.FileID] fileStoreIDs: the IDs of the files
+        :param int jobDisk: the disk requirement of the job, in bytes, which the files must
+               leave room for
+        """
+        pass
+
+    def _getUploadStats(self):
+        """
+        Returns the statistics of the files uploaded in the background so far, to be reported
+        with the stats of the worker: the number of files, their total size in bytes, the time
+        spent uploading them in seconds, the resulting throughput in bytes per second, and the
+        largest number of files that were waiting to be uploaded at once.
+
+        :return: the statistics by name, or None if this file store doesn't upload in the
+                 background
+        :rtype: dict|None
+        """
+        return None
+
     # Utility function used to identify if a pid is still running on the node.
     @staticmethod
     def _pidExists(pid):
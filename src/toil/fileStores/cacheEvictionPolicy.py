@@ -0,0 +1,50 @@
+# Copyright (C) 2015-2019 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+The orders in which the caching file store evicts the cached files that no job is using, when it
+needs room for a job.
+
+A policy is an SQL ordering term over the columns of the table of cached files in the cache
+index of a node, see :class:`toil.fileStores.cachingFileStore.CachingFileStore._CacheIndex`:
+
+- fileSize: the size of the file in bytes,
+- lastAccess: the time, in seconds since the epoch, the file was last added to or read from
+  the cache,
+- accessCount: the number of times the file was added to or read from the cache.
+
+The files that sort first are evicted first. The cache index keeps an SQL index for the term,
+so finding the next file to evict doesn't take longer as the cache fills up.
+"""
+from __future__ import absolute_import
+
+# The eviction policies that can be selected with --cacheEvictionPolicy, by name
+cacheEvictionPolicies = {
+    # Least recently used first
+    'lru': 'lastAccess',
+    # Least frequently used first, and least recently used among those used equally often
+    'lfu': 'accessCount, lastAccess',
+    # Least frequently used per byte first, i.e. the larger of two files used equally often
+    'size': 'CAST(accessCount AS REAL) / (fileSize + 1), lastAccess'}
+
+
+def addCacheEvictionPolicy(name, orderBy):
+    """
+    Make a custom cache eviction policy available under the given name. The policy must be
+    added in the workers too, e.g. by adding it in the module defining the jobs.
+
+    :param str name: the name of the policy, as passed to --cacheEvictionPolicy
+    :param str orderBy: an SQL ordering term over the columns fileSize, lastAccess and
+           accessCount, by which the files to evict first sort first
+    """
+    cacheEvictionPolicies[name] = orderBy
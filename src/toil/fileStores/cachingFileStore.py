@@ -20,31 +20,31 @@ from builtins import str
 from builtins import range
 from builtins import object
 from abc import abstractmethod, ABCMeta
-from collections import namedtuple, defaultdict
+from collections import namedtuple
 from contextlib import contextmanager
-from fcntl import flock, LOCK_EX, LOCK_UN
-from functools import partial
 from hashlib import sha1
-from threading import Thread, Semaphore, Event
+from threading import Thread, Event, Condition, local
 from future.utils import with_metaclass
 from six.moves.queue import Empty, Queue
 import base64
-import dill
 import errno
 import logging
 import os
 import shutil
+import sqlite3
 import stat
 import tempfile
 import time
 import uuid
 
 from toil.lib.objects import abstractclassmethod
+from toil.lib.singleFlight import SingleFlight
 from toil.lib.humanize import bytes2human
 from toil.common import cacheDirName, getDirSizeRecursively, getFileSystemSize
 from toil.lib.bioio import makePublicDir
 from toil.resource import ModuleDescriptor
 from toil.fileStores.abstractFileStore import AbstractFileStore
+from toil.fileStores.cacheEvictionPolicy import cacheEvictionPolicies
 from toil.fileStores import FileID
 
 logger = logging.getLogger(__name__)
@@ -107,13 +107,26 @@ class CachingFileStore(AbstractFileStore):
     def __init__(self, jobStore, jobGraph, localTempDir, inputBlockFn):
         super(CachingFileStore, self).__init__(jobStore, jobGraph, localTempDir, inputBlockFn)
         
-        # Variables related to asynchronous writes.
-        self.workerNumber = 2
-        self.queue = Queue()
-        self.updateSemaphore = Semaphore()
-        self.workers = [Thread(target=self.asyncWrite) for i in range(self.workerNumber)]
-        for worker in self.workers:
-            worker.start()
+        # Variables related to asynchronous writes. The writing threads are only started once
+        # the current job writes a file asynchronously, and they are stopped by the update of
+        # the job.
+        self.workerNumber = self.jobStore.config.maxParallelUploads
+        self.queue = None
+        self.workers = []
+        # The files waiting to be uploaded are held on the local disk until they are, see
+        # _waitForRoomToUpload. The condition guards the number of bytes they take up, and the
+        # statistics of the uploads reported with those of the worker, see _getUploadStats.
+        self._uploadCondition = Condition()
+        self._pendingUploadBytes = 0
+        self._activeUploads = 0
+        self._uploadsBusySince = None
+        self._uploadStats = dict(files=0, bytes=0, time=0.0, maxQueueDepth=0)
+        # The thread running the latest update of a job, see _updateJobWhenDone.
+        self.updateThread = None
+        # The thread downloading the files the current job will read ahead of time, and the
+        # queue of those files, see _prefetch.
+        self._prefetchQueue = None
+        self._prefetchThread = None
         # Variables related to caching
         # Decide where the cache directory will be. We put it next to the
         # local temp dirs for all of the jobs run on this machine.
@@ -121,8 +134,8 @@ class CachingFileStore(AbstractFileStore):
         # localTempDir is the worker directory, not the job directory.
         self.localCacheDir = os.path.join(os.path.dirname(localTempDir),
                                           cacheDirName(self.jobStore.config.workflowID))
-        self.cacheLockFile = os.path.join(self.localCacheDir, '.cacheLock')
-        self.cacheStateFile = os.path.join(self.localCacheDir, '_cacheState')
+        self.cacheIndexFile = os.path.join(self.localCacheDir, self._CacheIndex.fileName)
+        self.cacheIndex = None
         # Since each worker has it's own unique CachingFileStore instance, and only one Job can run
         # at a time on a worker, we can bookkeep the job's file store operated files in a
         # dictionary.
@@ -142,6 +155,13 @@ class CachingFileStore(AbstractFileStore):
         # job if required.
         self._setupCache()
 
+    def _setJobGraph(self, jobGraph):
+        super(CachingFileStore, self)._setJobGraph(jobGraph)
+        self.jobSpecificFiles = {}
+        self.jobID = sha1(self.jobName.encode('utf-8')).hexdigest()
+        logger.debug('Starting job (%s) with ID (%s).', self.jobName, self.jobID)
+        self.cleanupInProgress = False
+
     @contextmanager
     def open(self, job):
         """
@@ -152,18 +172,18 @@ class CachingFileStore(AbstractFileStore):
         startingDir = os.getcwd()
         self.localTempDir = makePublicDir(os.path.join(self.localTempDir, str(uuid.uuid4())))
         # Check the status of all jobs on this node. If there are jobs that started and died before
-        # cleaning up their presence from the cache state file, restore the cache file to a state
+        # cleaning up their presence from the cache index, restore the cache index to a state
         # where the jobs don't exist.
-        with self._CacheState.open(self) as cacheInfo:
-            self.findAndHandleDeadJobs(cacheInfo)
-            # While we have a lock on the cache file, run a naive check to see if jobs on this node
-            # have greatly gone over their requested limits.
-            if cacheInfo.sigmaJob < 0:
+        with self.cacheLock():
+            self.findAndHandleDeadJobs(self.cacheIndex)
+            # While we have a lock on the cache index, run a naive check to see if jobs on this
+            # node have greatly gone over their requested limits.
+            if self.cacheIndex.getState().sigmaJob < 0:
                 logger.warning('Detecting that one or more jobs on this node have used more '
                                'resources than requested.  Turn on debug logs to see more'
                                'information on cache usage.')
         # Get the requirements for the job and clean the cache if necessary. cleanCache will
-        # ensure that the requirements for this job are stored in the state file.
+        # ensure that the requirements for this job are stored in the cache index.
         jobReqs = job.disk
         # Cleanup the cache to free up enough space for this job (if needed)
         self.cleanCache(jobReqs)
@@ -171,6 +191,8 @@ class CachingFileStore(AbstractFileStore):
             os.chdir(self.localTempDir)
             yield
         finally:
+            # Files the job didn't read by now aren't worth downloading for it
+            self._stopPrefetching()
             diskUsed = getDirSizeRecursively(self.localTempDir)
             logString = ("Job {jobName} used {percent:.2f}% ({humanDisk}B [{disk}B] used, "
                          "{humanRequestedDisk}B [{requestedDisk}B] requested) at the end of "
@@ -182,6 +204,9 @@ class CachingFileStore(AbstractFileStore):
                                            humanRequestedDisk=bytes2human(jobReqs),
                                            requestedDisk=jobReqs))
             self.logToMaster(logString, level=logging.DEBUG)
+            cacheInfo = self.cacheIndex.getState()
+            self.logToMaster('CACHE: %i hits and %i misses on this node so far.'
+                             % (cacheInfo.hits, cacheInfo.misses), level=logging.DEBUG)
             if diskUsed > jobReqs:
                 self.logToMaster("Job used more disk than requested. Please reconsider modifying "
                                  "the user script to avoid the chance  of failure due to "
@@ -191,9 +216,8 @@ class CachingFileStore(AbstractFileStore):
             self.cleanupInProgress = True
             # Delete all the job specific files and return sizes to jobReqs
             self.returnJobReqs(jobReqs)
-            with self._CacheState.open(self) as cacheInfo:
-                # Finally delete the job from the cache state file
-                cacheInfo.jobState.pop(self.jobID)
+            # Finally delete the job from the cache index
+            self.cacheIndex.removeJob(self.jobID)
 
     # Functions related to reading, writing and removing files to/from the job store
     def writeGlobalFile(self, localFileName, cleanup=False):
@@ -213,8 +237,7 @@ class CachingFileStore(AbstractFileStore):
             # from the file store. In that case, you want to copy to the file store so that
             # the two have distinct nlink counts.
             # Can read without a lock because we're only reading job-specific info.
-            jobSpecificFiles = list(self._CacheState._load(self.cacheStateFile).jobState[
-                self.jobID]['filesToFSIDs'].keys())
+            jobSpecificFiles = self.cacheIndex.getJobFilePaths(self.jobID)
             # Saying nlink is 2 implicitly means we are using the job file store, and it is on
             # the same device as the work dir.
             if self.nlinkThreshold == 2 and absLocalFileName not in jobSpecificFiles:
@@ -240,12 +263,17 @@ class CachingFileStore(AbstractFileStore):
                 harbingerFile = self.HarbingerFile(self, fileStoreID=jobStoreFileID)
                 harbingerFile.write()
                 fileHandle = open(absLocalFileName, 'rb')
+                self._waitForRoomToUpload(os.fstat(fileHandle.fileno()).st_size)
                 with self._pendingFileWritesLock:
                     self._pendingFileWrites.add(jobStoreFileID)
                 # A file handle added to the queue allows the asyncWrite threads to remove their
                 # jobID from _pendingFileWrites. Therefore, a file should only be added after
                 # its fileID is added to _pendingFileWrites
-                self.queue.put((fileHandle, jobStoreFileID))
+                self._startAsyncWrites()
+                self.queue.put((fileHandle, harbingerFile))
+                with self._uploadCondition:
+                    self._uploadStats['maxQueueDepth'] = max(self._uploadStats['maxQueueDepth'],
+                                                             self.queue.qsize())
             # Else write directly to the job store.
             else:
                 jobStoreFileID = self.jobStore.writeFile(absLocalFileName, creatorID, cleanup)
@@ -254,14 +282,13 @@ class CachingFileStore(AbstractFileStore):
             if absLocalFileName not in jobSpecificFiles:
                 self.addToCache(absLocalFileName, jobStoreFileID, 'write')
             else:
-                self._JobState.updateJobSpecificFiles(self, jobStoreFileID, absLocalFileName,
-                                                      0.0, False)
+                self.cacheIndex.addJobFile(self.jobID, jobStoreFileID, absLocalFileName,
+                                           0.0, False)
         # Else write directly to the job store.
         else:
             jobStoreFileID = self.jobStore.writeFile(absLocalFileName, creatorID, cleanup)
             # Non local files are NOT cached by default, but they are tracked as local files.
-            self._JobState.updateJobSpecificFiles(self, jobStoreFileID, None,
-                                                  0.0, False)
+            self.cacheIndex.addJobFile(self.jobID, jobStoreFileID, None, 0.0, False)
         return FileID.forPath(jobStoreFileID, absLocalFileName)
 
     def writeGlobalFileStream(self, cleanup=False):
@@ -308,46 +335,41 @@ class CachingFileStore(AbstractFileStore):
             fileIsLocal = True
         # First check whether the file is in cache.  If it is, then hardlink the file to
         # userPath. Cache operations can only occur on local files.
-        with self.cacheLock() as lockFileHandle:
+        with self.cacheLock() as lock:
             if fileIsLocal and self._fileIsCached(fileStoreID):
                 logger.debug('CACHE: Cache hit on file with ID \'%s\'.' % fileStoreID)
+                self.cacheIndex.recordHit(fileStoreID)
                 assert not os.path.exists(localFilePath)
                 if mutable:
                     shutil.copyfile(cachedFileName, localFilePath)
-                    cacheInfo = self._CacheState._load(self.cacheStateFile)
-                    jobState = self._JobState(cacheInfo.jobState[self.jobID])
-                    jobState.addToJobSpecFiles(fileStoreID, localFilePath, -1, None)
-                    cacheInfo.jobState[self.jobID] = jobState.__dict__
-                    cacheInfo.write(self.cacheStateFile)
+                    self.cacheIndex.addJobFile(self.jobID, fileStoreID, localFilePath, -1, None)
                 else:
                     os.link(cachedFileName, localFilePath)
-                    self.returnFileSize(fileStoreID, localFilePath, lockFileHandle,
-                                        fileAlreadyCached=True)
-            # If the file is not in cache, check whether the .harbinger file for the given
-            # FileStoreID exists.  If it does, the wait and periodically check for the removal
-            # of the file and the addition of the completed download into cache of the file by
-            # the other job. Then we link to it.
+                    self.returnFileSize(fileStoreID, localFilePath, fileAlreadyCached=True)
+            # If the file is not in cache, check whether another job is downloading it.  If
+            # it is, block until it is done, without holding the cache lock, and then link to
+            # the file the other job added to the cache.
             elif fileIsLocal and harbingerFile.exists():
-                harbingerFile.waitOnDownload(lockFileHandle)
-                # If the code reaches here, the harbinger file has been removed. This means
+                lock.release()
+                harbingerFile.waitOnDownload()
+                # If the code reaches here, the other job is done with the file. This means
                 # either the file was successfully downloaded and added to cache, or something
                 # failed. To prevent code duplication, we recursively call readGlobalFile.
-                flock(lockFileHandle, LOCK_UN)
                 return self.readGlobalFile(fileStoreID, userPath=userPath, cache=cache,
                                            mutable=mutable)
             # If the file is not in cache, then download it to the userPath and then add to
             # cache if specified.
             else:
                 logger.debug('CACHE: Cache miss on file with ID \'%s\'.' % fileStoreID)
+                self.cacheIndex.recordMiss()
                 if fileIsLocal and cache:
                     # If caching of the downloaded file is desired, First create the harbinger
-                    # file so other jobs know not to redundantly download the same file.  Write
-                    # the PID of this process into the file so other jobs know who is carrying
-                    # out the download.
+                    # file so other jobs know not to redundantly download the same file but
+                    # wait for this job to download it.
                     harbingerFile.write()
-                    # Now release the file lock while the file is downloaded as download could
+                    # Now release the cache lock while the file is downloaded as download could
                     # take a while.
-                    flock(lockFileHandle, LOCK_UN)
+                    lock.release()
                     # Use try:finally: so that the .harbinger file is removed whether the
                     # download succeeds or not.
                     try:
@@ -360,7 +382,7 @@ class CachingFileStore(AbstractFileStore):
                         raise
                     else:
                         # If the download succeded, officially add the file to cache (by
-                        # recording it in the cache lock file) if possible.
+                        # recording it in the cache index) if possible.
                         if os.path.exists('/.'.join(os.path.split(cachedFileName))):
                             os.rename('/.'.join(os.path.split(cachedFileName)), cachedFileName)
                             # If this is not true we get into trouble in our internal reference counting.
@@ -373,7 +395,7 @@ class CachingFileStore(AbstractFileStore):
                         harbingerFile.delete()
                 else:
                     # Release the cache lock since the remaining stuff is not cache related.
-                    flock(lockFileHandle, LOCK_UN)
+                    lock.release()
                     self.jobStore.readFile(fileStoreID, localFilePath, symlink=False)
                     # Make sure we got a file with the number of links we expect.
                     # If this is not true we get into trouble in our internal reference counting.
@@ -390,21 +412,21 @@ class CachingFileStore(AbstractFileStore):
                             # file handle linked from the job store.
                             shutil.copyfile(localFilePath, localFilePath + '.tmp')
                             os.rename(localFilePath + '.tmp', localFilePath)
-                        self._JobState.updateJobSpecificFiles(self, fileStoreID, localFilePath,
-                                                              -1, False)
+                        self.cacheIndex.addJobFile(self.jobID, fileStoreID, localFilePath,
+                                                   -1, False)
                     # If it was immutable
                     else:
                         if self.nlinkThreshold == 2:
                             self._accountForNlinkEquals2(localFilePath)
-                        self._JobState.updateJobSpecificFiles(self, fileStoreID, localFilePath,
-                                                              0.0, False)
+                        self.cacheIndex.addJobFile(self.jobID, fileStoreID, localFilePath,
+                                                   0.0, False)
         return localFilePath
 
     def exportFile(self, jobStoreFileID, dstUrl):
-        while jobStoreFileID in self._pendingFileWrites:
-            # The file is still being writting to the job store - wait for this process to finish prior to
-            # exporting it
-            time.sleep(1)
+        if jobStoreFileID in self._pendingFileWrites:
+            # The file is still being written to the job store - wait for the writing thread to
+            # finish prior to exporting it
+            self.HarbingerFile(self, fileStoreID=jobStoreFileID).waitOnDownload()
         self.jobStore.exportFile(jobStoreFileID, dstUrl)
 
     def readGlobalFileStream(self, fileStoreID):
@@ -412,43 +434,44 @@ class CachingFileStore(AbstractFileStore):
             raise RuntimeError(
                 "Trying to access a file in the jobStore you've deleted: %s" % fileStoreID)
 
+        # If another job is transferring the file, wait for it rather than streaming the file
+        # from the job store in parallel
+        harbingerFile = self.HarbingerFile(self, fileStoreID=fileStoreID)
+        if not self._fileIsCached(fileStoreID) and harbingerFile.exists():
+            harbingerFile.waitOnDownload()
         # If fileStoreID is in the cache provide a handle from the local cache
         if self._fileIsCached(fileStoreID):
             logger.debug('CACHE: Cache hit on file with ID \'%s\'.' % fileStoreID)
+            self.cacheIndex.recordHit(fileStoreID)
             return open(self.encodedFileID(fileStoreID), 'rb')
         else:
             logger.debug('CACHE: Cache miss on file with ID \'%s\'.' % fileStoreID)
+            self.cacheIndex.recordMiss()
             return self.jobStore.readFileStream(fileStoreID)
 
     def deleteLocalFile(self, fileStoreID):
         # The local file may or may not have been cached. If it was, we need to do some
         # bookkeeping. If it wasn't, we just delete the file and continue with no might need
         # some bookkeeping if the file store and cache live on the same filesystem. We can know
-        # if a file was cached or not based on the value held in the third tuple value for the
-        # dict item having key = fileStoreID. If it was cached, it holds the value True else
-        # False.
-        with self._CacheState.open(self) as cacheInfo:
-            jobState = self._JobState(cacheInfo.jobState[self.jobID])
-            if fileStoreID not in list(jobState.jobSpecificFiles.keys()):
+        # if a file was cached or not based on the size recorded for the file in the cache
+        # index. If it was cached, it holds the size of the file else 0 or -1.
+        with self.cacheLock():
+            filesToDelete = self.cacheIndex.getJobFiles(self.jobID, fileStoreID)
+            if not filesToDelete:
                 # EOENT indicates that the file did not exist
                 raise OSError(errno.ENOENT, "Attempting to delete a non-local file")
-            # filesToDelete is a dictionary of file: fileSize
-            filesToDelete = jobState.jobSpecificFiles[fileStoreID]
-            allOwnedFiles = jobState.filesToFSIDs
-            for (fileToDelete, fileSize) in list(filesToDelete.items()):
+            for (fileToDelete, fileSize) in filesToDelete:
                 # Handle the case where a file not in the local temp dir was written to
                 # filestore
                 if fileToDelete is None:
-                    filesToDelete.pop(fileToDelete)
-                    allOwnedFiles[fileToDelete].remove(fileStoreID)
-                    cacheInfo.jobState[self.jobID] = jobState.__dict__
-                    cacheInfo.write(self.cacheStateFile)
+                    self.cacheIndex.removeJobFile(self.jobID, fileStoreID, fileToDelete)
                     continue
+                # Only remove the file if there is only one FSID associated with it.
+                fileIsShared = self.cacheIndex.countJobFileIDs(self.jobID, fileToDelete) > 1
                 # If the file size is zero (copied into the local temp dir) or -1 (mutable), we
                 # can safely delete without any bookkeeping
                 if fileSize in (0, -1):
-                    # Only remove the file if there is only one FSID associated with it.
-                    if len(allOwnedFiles[fileToDelete]) == 1:
+                    if not fileIsShared:
                         try:
                             os.remove(fileToDelete)
                         except OSError as err:
@@ -457,10 +480,7 @@ class CachingFileStore(AbstractFileStore):
                                              fileToDelete)
                             else:
                                 raise IllegalDeletionCacheError(fileToDelete)
-                    allOwnedFiles[fileToDelete].remove(fileStoreID)
-                    filesToDelete.pop(fileToDelete)
-                    cacheInfo.jobState[self.jobID] = jobState.__dict__
-                    cacheInfo.write(self.cacheStateFile)
+                    self.cacheIndex.removeJobFile(self.jobID, fileStoreID, fileToDelete)
                     continue
                 # If not, we need to do bookkeeping
                 # Get the size of the file to be deleted, and the number of jobs using the file
@@ -472,13 +492,11 @@ class CachingFileStore(AbstractFileStore):
                     logger.warn("the size on record differed from the real size by " +
                                 "%s bytes" % str(fileSize - fileStats.st_size))
                 # Remove the file and return file size to the job
-                if len(allOwnedFiles[fileToDelete]) == 1:
+                if not fileIsShared:
                     os.remove(fileToDelete)
-                cacheInfo.sigmaJob += fileSize
-                filesToDelete.pop(fileToDelete)
-                allOwnedFiles[fileToDelete].remove(fileStoreID)
-                jobState.updateJobReqs(fileSize, 'remove')
-                cacheInfo.jobState[self.jobID] = jobState.__dict__
+                self.cacheIndex.adjust(sigmaJob=fileSize)
+                self.cacheIndex.removeJobFile(self.jobID, fileStoreID, fileToDelete)
+                self.cacheIndex.adjustJobReqs(self.jobID, fileSize)
             # If the job is not in the process of cleaning up, then we may need to remove the
             # cached copy of the file as well.
             if not self.cleanupInProgress:
@@ -487,22 +505,21 @@ class CachingFileStore(AbstractFileStore):
                 # don't remove it from cache.
                 if self._fileIsCached(fileStoreID):
                     cachedFile = self.encodedFileID(fileStoreID)
-                    jobsUsingFile = os.stat(cachedFile).st_nlink
-                    if not cacheInfo.isBalanced() and jobsUsingFile == self.nlinkThreshold:
+                    cachedFileStats = os.stat(cachedFile)
+                    jobsUsingFile = cachedFileStats.st_nlink
+                    if (not self.cacheIndex.getState().isBalanced() and
+                            jobsUsingFile == self.nlinkThreshold):
                         os.remove(cachedFile)
-                        cacheInfo.cached -= fileSize
+                        self.cacheIndex.removeCachedFiles([fileStoreID])
+                        if self.nlinkThreshold != 2:
+                            self.cacheIndex.adjust(cached=-cachedFileStats.st_size)
                 self.logToMaster('Successfully deleted cached copy of file with ID '
                                  '\'%s\'.' % fileStoreID, level=logging.DEBUG)
             self.logToMaster('Successfully deleted local copies of file with ID '
                              '\'%s\'.' % fileStoreID, level=logging.DEBUG)
 
     def deleteGlobalFile(self, fileStoreID):
-        jobStateIsPopulated = False
-        with self._CacheState.open(self) as cacheInfo:
-            if self.jobID in cacheInfo.jobState:
-                jobState = self._JobState(cacheInfo.jobState[self.jobID])
-                jobStateIsPopulated = True
-        if jobStateIsPopulated and fileStoreID in list(jobState.jobSpecificFiles.keys()):
+        if self.cacheIndex.getJobFiles(self.jobID, fileStoreID):
             # Use deleteLocalFile in the backend to delete the local copy of the file.
             self.deleteLocalFile(fileStoreID)
             # At this point, the local file has been deleted, and possibly the cached copy. If
@@ -521,24 +538,14 @@ class CachingFileStore(AbstractFileStore):
                          ' globally deleted.', level=logging.DEBUG)
 
     # Cache related methods
-    @contextmanager
     def cacheLock(self):
         """
-        This is a context manager to acquire a lock on the Lock file that will be used to
-        prevent synchronous cache operations between workers.
-        :yields: File descriptor for cache lock file in w mode
+        Returns the lock that prevents concurrent cache operations between workers, to be used
+        as a context manager. Holding it means holding the write lock of the cache index, so all
+        changes made to the index while holding it are applied atomically.
+        :rtype: CachingFileStore._CacheLock
         """
-        cacheLockFile = open(self.cacheLockFile, 'w')
-        try:
-            flock(cacheLockFile, LOCK_EX)
-            logger.debug("CACHE: Obtained lock on file %s" % self.cacheLockFile)
-            yield cacheLockFile
-        except IOError:
-            logger.critical('CACHE: Unable to acquire lock on %s' % self.cacheLockFile)
-            raise
-        finally:
-            cacheLockFile.close()
-            logger.debug("CACHE: Released lock")
+        return self._CacheLock(self.cacheIndex)
 
     def _setupCache(self):
         """
@@ -551,7 +558,7 @@ class CachingFileStore(AbstractFileStore):
             personalCacheDir = ''.join([os.path.dirname(self.localCacheDir), '/.ctmp-',
                                         str(uuid.uuid4())])
             os.mkdir(personalCacheDir, 0o755)
-            self._createCacheLockFile(personalCacheDir)
+            self._createCacheIndex(personalCacheDir)
             try:
                 os.rename(personalCacheDir, self.localCacheDir)
             except OSError as err:
@@ -565,27 +572,33 @@ class CachingFileStore(AbstractFileStore):
                 else:
                     raise
         # You can't reach here unless a local cache directory has been created successfully
-        with self._CacheState.open(self) as cacheInfo:
+        self.cacheIndex = self._CacheIndex(self.cacheIndexFile)
+        with self.cacheLock():
+            cacheInfo = self.cacheIndex.getState()
             # Ensure this cache is from the correct attempt at the workflow!  If it isn't, we
-            # need to reset the cache lock file
+            # need to reset the cache index
             if cacheInfo.attemptNumber != self.workflowAttemptNumber:
+                allCachedFiles = [os.path.join(self.localCacheDir, x)
+                                  for x in os.listdir(self.localCacheDir)
+                                  if not self._isHidden(x)]
+                allCachedFiles = [(cachedFile, os.stat(cachedFile))
+                                  for cachedFile in allCachedFiles]
+                self.cacheIndex.setCachedFiles([(self.decodedFileID(cachedFile),
+                                                 inode.st_size, inode.st_mtime)
+                                                for cachedFile, inode in allCachedFiles])
                 if cacheInfo.nlink == 2:
-                    cacheInfo.cached = 0  # cached file sizes are accounted for by job store
+                    cached = 0  # cached file sizes are accounted for by job store
                 else:
-                    allCachedFiles = [os.path.join(self.localCacheDir, x)
-                                      for x in os.listdir(self.localCacheDir)
-                                      if not self._isHidden(x)]
-                    cacheInfo.cached = sum([os.stat(cachedFile).st_size
-                                            for cachedFile in allCachedFiles])
+                    cached = sum([inode.st_size for _, inode in allCachedFiles])
                     # TODO: Delete the working directories
-                cacheInfo.sigmaJob = 0
-                cacheInfo.attemptNumber = self.workflowAttemptNumber
+                self.cacheIndex.setProperties(cached=cached, sigmaJob=0,
+                                              attemptNumber=self.workflowAttemptNumber)
             self.nlinkThreshold = cacheInfo.nlink
 
-    def _createCacheLockFile(self, tempCacheDir):
+    def _createCacheIndex(self, tempCacheDir):
         """
-        Create the cache lock file file to contain the state of the cache on the node.
-        :param str tempCacheDir: Temporary directory to use for setting up a cache lock file the
+        Create the cache index to contain the state of the cache on the node.
+        :param str tempCacheDir: Temporary directory to use for setting up a cache index the
                first time.
         """
         # The nlink threshold is setup along with the first instance of the cache class on the
@@ -593,21 +606,11 @@ class CachingFileStore(AbstractFileStore):
         self.setNlinkThreshold(tempCacheDir)
         # Get the free space on the device
         freeSpace, _ = getFileSystemSize(tempCacheDir)
-        # Create the cache lock file.
-        open(os.path.join(tempCacheDir, os.path.basename(self.cacheLockFile)), 'w').close()
-        # Setup the cache state file
-        personalCacheStateFile = os.path.join(tempCacheDir,
-                                              os.path.basename(self.cacheStateFile))
-        # Setup the initial values for the cache state file in a dict
-        cacheInfo = self._CacheState({
-            'nlink': self.nlinkThreshold,
-            'attemptNumber': self.workflowAttemptNumber,
-            'total': freeSpace,
-            'cached': 0,
-            'sigmaJob': 0,
-            'cacheDir': self.localCacheDir,
-            'jobState': {}})
-        cacheInfo.write(personalCacheStateFile)
+        # Setup the initial values for the cache index
+        self._CacheIndex.create(os.path.join(tempCacheDir, self._CacheIndex.fileName),
+                                nlink=self.nlinkThreshold,
+                                attemptNumber=self.workflowAttemptNumber,
+                                total=freeSpace)
 
     def encodedFileID(self, jobStoreFileID):
         """
@@ -660,7 +663,7 @@ class CachingFileStore(AbstractFileStore):
         :param bool mutable: See modifiable in readGlobalFile
         """
         assert callingFunc in ('read', 'write')
-        with self.cacheLock() as lockFileHandle:
+        with self.cacheLock():
             cachedFile = self.encodedFileID(jobStoreFileID)
             # The file to be cached MUST originate in the environment of the TOIL temp directory
             if (os.stat(self.localCacheDir).st_dev !=
@@ -674,21 +677,19 @@ class CachingFileStore(AbstractFileStore):
             if callingFunc == 'read' and mutable:
                 shutil.copyfile(cachedFile, localFilePath)
                 fileSize = os.stat(cachedFile).st_size
-                cacheInfo = self._CacheState._load(self.cacheStateFile)
-                cacheInfo.cached += fileSize if cacheInfo.nlink != 2 else 0
-                if not cacheInfo.isBalanced():
+                cacheInfo = self.cacheIndex.getState()
+                cachedSize = fileSize if cacheInfo.nlink != 2 else 0
+                if not cacheInfo._replace(cached=cacheInfo.cached + cachedSize).isBalanced():
                     os.remove(cachedFile)
-                    cacheInfo.cached -= fileSize if cacheInfo.nlink != 2 else 0
                     logger.debug('Could not download both download ' +
                                  '%s as mutable and add to ' % os.path.basename(localFilePath) +
                                  'cache. Hence only mutable copy retained.')
                 else:
+                    self.cacheIndex.adjust(cached=cachedSize)
+                    self.cacheIndex.addCachedFile(jobStoreFileID, fileSize)
                     logger.debug('CACHE: Added file with ID \'%s\' to the cache.' %
                                 jobStoreFileID)
-                jobState = self._JobState(cacheInfo.jobState[self.jobID])
-                jobState.addToJobSpecFiles(jobStoreFileID, localFilePath, -1, False)
-                cacheInfo.jobState[self.jobID] = jobState.__dict__
-                cacheInfo.write(self.cacheStateFile)
+                self.cacheIndex.addJobFile(self.jobID, jobStoreFileID, localFilePath, -1, False)
             else:
                 # There are two possibilities, read and immutable, and write. both cases do
                 # almost the same thing except for the direction of the os.link hence we're
@@ -714,11 +715,11 @@ class CachingFileStore(AbstractFileStore):
                 else:
                     # Chmod the cached file. Cached files can never be modified.
                     os.chmod(cachedFile, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                    self.cacheIndex.addCachedFile(jobStoreFileID, os.stat(cachedFile).st_size)
                     # Return the filesize of cachedFile to the job and increase the cached size
                     # The values passed here don't matter since rFS looks at the file only for
                     # the stat
-                    self.returnFileSize(jobStoreFileID, localFilePath, lockFileHandle,
-                                        fileAlreadyCached=False)
+                    self.returnFileSize(jobStoreFileID, localFilePath, fileAlreadyCached=False)
                 if callingFunc == 'read':
                     logger.debug('CACHE: Read file with ID \'%s\' from the cache.' %
                                  jobStoreFileID)
@@ -726,8 +727,7 @@ class CachingFileStore(AbstractFileStore):
                     logger.debug('CACHE: Added file with ID \'%s\' to the cache.' %
                                  jobStoreFileID)
 
-    def returnFileSize(self, fileStoreID, cachedFileSource, lockFileHandle,
-                       fileAlreadyCached=False):
+    def returnFileSize(self, fileStoreID, cachedFileSource, fileAlreadyCached=False):
         """
         Returns the fileSize of the file described by fileStoreID to the job requirements pool
         if the file was recently added to, or read from cache (A job that reads n bytes from
@@ -735,26 +735,22 @@ class CachingFileStore(AbstractFileStore):
         accounting for that disk space).
         :param fileStoreID: fileStore ID of the file bein added to cache
         :param str cachedFileSource: File being added to cache
-        :param file lockFileHandle: Open file handle to the cache lock file
         :param bool fileAlreadyCached: A flag to indicate whether the file was already cached or
                not. If it was, then it means that you don't need to add the filesize to cache again.
         """
         fileSize = os.stat(cachedFileSource).st_size
-        cacheInfo = self._CacheState._load(self.cacheStateFile)
         # If the file isn't cached, add the size of the file to the cache pool. However, if the
         # nlink threshold is not 1 -  i.e. it is 2 (it can only be 1 or 2), then don't do this
         # since the size of the file is accounted for by the file store copy.
         if not fileAlreadyCached and self.nlinkThreshold == 1:
-            cacheInfo.cached += fileSize
-        cacheInfo.sigmaJob -= fileSize
-        if not cacheInfo.isBalanced():
+            self.cacheIndex.adjust(cached=fileSize, sigmaJob=-fileSize)
+        else:
+            self.cacheIndex.adjust(sigmaJob=-fileSize)
+        if not self.cacheIndex.getState().isBalanced():
             self.logToMaster('CACHE: The cache was not balanced on returning file size',
                              logging.WARN)
         # Add the info to the job specific cache info
-        jobState = self._JobState(cacheInfo.jobState[self.jobID])
-        jobState.addToJobSpecFiles(fileStoreID, cachedFileSource, fileSize, True)
-        cacheInfo.jobState[self.jobID] = jobState.__dict__
-        cacheInfo.write(self.cacheStateFile)
+        self.cacheIndex.addJobFile(self.jobID, fileStoreID, cachedFileSource, fileSize, True)
 
     @staticmethod
     def _isHidden(filePath):
@@ -775,39 +771,20 @@ class CachingFileStore(AbstractFileStore):
         for use.
         :param float newJobReqs: the total number of bytes of files allowed in the cache.
         """
-        with self._CacheState.open(self) as cacheInfo:
+        with self.cacheLock():
             # Add the new job's disk requirements to the sigmaJobDisk variable
-            cacheInfo.sigmaJob += newJobReqs
-            # Initialize the job state here. we use a partial in the jobSpecificFiles call so
-            # that this entire thing is pickleable. Based on answer by user Nathaniel Gentile at
-            # http://stackoverflow.com/questions/2600790
-            assert self.jobID not in cacheInfo.jobState
-            cacheInfo.jobState[self.jobID] = {
-                'jobName': self.jobName,
-                'jobReqs': newJobReqs,
-                'jobDir': self.localTempDir,
-                'jobSpecificFiles': defaultdict(partial(defaultdict,int)),
-                'filesToFSIDs': defaultdict(set),
-                'pid': os.getpid()}
+            self.cacheIndex.adjust(sigmaJob=newJobReqs)
+            # Initialize the job state here.
+            self.cacheIndex.addJob(self._JobState(jobID=self.jobID,
+                                                  jobName=self.jobName,
+                                                  jobReqs=newJobReqs,
+                                                  jobDir=self.localTempDir,
+                                                  pid=os.getpid()))
+            cacheInfo = self.cacheIndex.getState()
             # If the caching equation is balanced, do nothing.
             if cacheInfo.isBalanced():
                 return None
 
-            # List of deletable cached files.  A deletable cache file is one
-            #  that is not in use by any other worker (identified by the number of symlinks to
-            # the file)
-            allCacheFiles = [os.path.join(self.localCacheDir, x)
-                             for x in os.listdir(self.localCacheDir)
-                             if not self._isHidden(x)]
-            allCacheFiles = [(path, os.stat(path)) for path in allCacheFiles]
-            # TODO mtime vs ctime
-            deletableCacheFiles = {(path, inode.st_mtime, inode.st_size)
-                                   for path, inode in allCacheFiles
-                                   if inode.st_nlink == self.nlinkThreshold}
-
-            # Sort in descending order of mtime so the first items to be popped from the list
-            # are the least recently created.
-            deletableCacheFiles = sorted(deletableCacheFiles, key=lambda x: (-x[1], -x[2]))
             logger.debug('CACHE: Need %s bytes for new job. Detecting an estimated %s (out of a '
                          'total %s) bytes available for running the new job. The size of the cache '
                          'is %s bytes.', newJobReqs,
@@ -815,16 +792,40 @@ class CachingFileStore(AbstractFileStore):
                          cacheInfo.total, cacheInfo.cached)
             logger.debug('CACHE: Evicting files to make room for the new job.')
 
-            # Now do the actual file removal
+            # Now do the actual file removal, in the order of the eviction policy. A deletable cache
+            # file is one that is not in use by any other worker (identified by the number of
+            # hard links to the file).
+            orderBy = cacheEvictionPolicies[self.jobStore.config.cacheEvictionPolicy]
+            evictedFiles = []
             totalEvicted = 0
-            while not cacheInfo.isBalanced() and len(deletableCacheFiles) > 0:
-                cachedFile, fileCreateTime, cachedFileSize = deletableCacheFiles.pop()
+            cachedEvicted = 0
+            candidates = self.cacheIndex.getEvictionCandidates(orderBy)
+            for jobStoreFileID, _ in candidates:
+                if cacheInfo._replace(cached=cacheInfo.cached - cachedEvicted).isBalanced():
+                    break
+                cachedFile = self.encodedFileID(jobStoreFileID)
+                try:
+                    cachedFileStats = os.stat(cachedFile)
+                except OSError as err:
+                    if err.errno != errno.ENOENT:
+                        raise
+                    # Forget about files that aren't in the cache any more
+                    evictedFiles.append(jobStoreFileID)
+                    continue
+                if cachedFileStats.st_nlink != self.nlinkThreshold:
+                    continue
                 os.remove(cachedFile)
-                cacheInfo.cached -= cachedFileSize if self.nlinkThreshold != 2 else 0
-                totalEvicted += cachedFileSize
-                assert cacheInfo.cached >= 0
+                evictedFiles.append(jobStoreFileID)
+                if self.nlinkThreshold != 2:
+                    cachedEvicted += cachedFileStats.st_size
+                totalEvicted += cachedFileStats.st_size
                 logger.debug('CACHE: Evicted  file with ID \'%s\' (%s bytes)' %
-                             (self.decodedFileID(cachedFile), cachedFileSize))
+                             (jobStoreFileID, cachedFileStats.st_size))
+            candidates.close()
+            self.cacheIndex.removeCachedFiles(evictedFiles)
+            self.cacheIndex.adjust(cached=-cachedEvicted)
+            cacheInfo = cacheInfo._replace(cached=cacheInfo.cached - cachedEvicted)
+            assert cacheInfo.cached >= 0
             logger.debug('CACHE: Evicted a total of %s bytes. Available space is now %s bytes.',
                          totalEvicted,
                          (cacheInfo.total - (cacheInfo.cached + cacheInfo.sigmaJob - newJobReqs)))
@@ -835,7 +836,7 @@ class CachingFileStore(AbstractFileStore):
         """
         Removes a single file described by the fileStoreID from the cache forcibly.
         """
-        with self._CacheState.open(self) as cacheInfo:
+        with self.cacheLock():
             cachedFile = self.encodedFileID(fileStoreID)
             cachedFileStats = os.stat(cachedFile)
             # We know the file exists because this function was called in the if block.  So we
@@ -848,9 +849,10 @@ class CachingFileStore(AbstractFileStore):
             # Remove the file size from the cached file size if the jobstore is not fileJobStore
             # and then delete the file
             os.remove(cachedFile)
+            self.cacheIndex.removeCachedFiles([fileStoreID])
             if self.nlinkThreshold != 2:
-                cacheInfo.cached -= cachedFileStats.st_size
-            if not cacheInfo.isBalanced():
+                self.cacheIndex.adjust(cached=-cachedFileStats.st_size)
+            if not self.cacheIndex.getState().isBalanced():
                 self.logToMaster('CACHE: The cache was not balanced on removing single file',
                                  logging.WARN)
             self.logToMaster('CACHE: Successfully removed file with ID \'%s\'.' % fileStoreID)
@@ -899,10 +901,7 @@ class CachingFileStore(AbstractFileStore):
         """
         fileStats = os.stat(localFilePath)
         assert fileStats.st_nlink >= self.nlinkThreshold
-        with self._CacheState.open(self) as cacheInfo:
-            cacheInfo.sigmaJob -= fileStats.st_size
-            jobState = self._JobState(cacheInfo.jobState[self.jobID])
-            jobState.updateJobReqs(fileStats.st_size, 'remove')
+        self.cacheIndex.adjust(sigmaJob=-fileStats.st_size)
 
     def returnJobReqs(self, jobReqs):
         """
@@ -910,34 +909,22 @@ class CachingFileStore(AbstractFileStore):
         completes. It also deletes the local copies of files with the cache lock held.
         :param float jobReqs: Original size requirement of the job
         """
-        # Since we are only reading this job's specific values from the state file, we don't
+        # Since we are only reading this job's specific values from the cache index, we don't
         # need a lock
-        jobState = self._JobState(self._CacheState._load(self.cacheStateFile
-                                                         ).jobState[self.jobID])
-        for x in list(jobState.jobSpecificFiles.keys()):
+        for x in self.cacheIndex.getJobFileIDs(self.jobID):
             self.deleteLocalFile(x)
-        with self._CacheState.open(self) as cacheInfo:
-            cacheInfo.sigmaJob -= jobReqs
-            # assert cacheInfo.isBalanced() # commenting this out for now. God speed
+        self.cacheIndex.adjust(sigmaJob=-jobReqs)
+        # assert self.cacheIndex.getState().isBalanced() # commenting this out for now. God speed
 
-    class _CacheState(AbstractFileStore._StateFile):
+    class _CacheState(namedtuple('_CacheState', 'nlink attemptNumber total cached sigmaJob '
+                                                'hits misses')):
         """
-        Utility class to read and write the cache lock file. Also for checking whether the
-        caching equation is balanced or not.  It extends the _StateFile class to add other cache
-        related functions.
+        A snapshot of the state of the cache on the node, as read from the cache index. Also for
+        checking whether the caching equation is balanced or not. The hits and misses count the
+        reads of files from the file store that found the file in the cache, and those that
+        didn't.
         """
-        @classmethod
-        @contextmanager
-        def open(cls, outer=None):
-            """
-            This is a context manager that opens the cache state file and reads it into an object
-            that is returned to the user in the yield
-            """
-            assert outer is not None
-            with outer.cacheLock():
-                cacheInfo = cls._load(outer.cacheStateFile)
-                yield cacheInfo
-                cacheInfo.write(outer.cacheStateFile)
+        __slots__ = ()
 
         def isBalanced(self):
             """
@@ -962,102 +949,369 @@ class CachingFileStore(AbstractFileStore):
             # totalFree = totalStats.f_bavail * totalStats.f_frsize
             # return totalFree < jobReqs
 
-    @classmethod
-    def findAndHandleDeadJobs(cls, nodeInfo, batchSystemShutdown=False):
-        """
-        :param toil.fileStores.CachingFileStore._CacheState nodeInfo: The state of the node cache as
-               a _CacheState object
-        """
-        # A list of tuples of (hashed job id, pid or process running job)
-        registeredJobs = [(jid, state['pid']) for jid, state in list(nodeInfo.jobState.items())]
-        for jobID, jobPID in registeredJobs:
-            if not cls._pidExists(jobPID):
-                jobState = CachingFileStore._JobState(nodeInfo.jobState[jobID])
-                logger.warning('Detected that job (%s) prematurely terminated.  Fixing the state '
-                               'of the cache.', jobState.jobName)
-                if not batchSystemShutdown:
-                    logger.debug("Returning dead job's used disk to cache.")
-                    # Delete the old work directory if it still exists, to remove unwanted nlinks.
-                    # Do this only during the life of the program and dont' do it during the
-                    # batch system cleanup.  Leave that to the batch system cleanup code.
-                    if os.path.exists(jobState.jobDir):
-                        shutil.rmtree(jobState.jobDir)
-                    nodeInfo.sigmaJob -= jobState.jobReqs
-                # Remove job from the cache state file
-                nodeInfo.jobState.pop(jobID)
+    # The state of a job in terms of it's current disk requirements and working directory, as
+    # recorded in the cache index. The job specific files are recorded separately, see
+    # _CacheIndex.addJobFile.
+    _JobState = namedtuple('_JobState', 'jobID jobName jobReqs jobDir pid')
 
-    class _JobState(object):
+    class _CacheIndex(object):
         """
-        This is a utility class to handle the state of a job in terms of it's current disk
-        requirements, working directory, and job specific files.
+        The state of the cache on the node, shared by all workers on the node.
+
+        It is kept in an SQLite database in the cache directory. Each change updates only the
+        rows it affects, in a transaction of its own or in that of the cache lock, so its cost
+        doesn't grow with the number of jobs and files on the node. In write-ahead logging mode,
+        reads see a consistent snapshot of the index and don't wait on the worker holding the
+        cache lock.
+
+        The totals of the caching equation, and the attempt number and nlink threshold the cache
+        was set up with, are in the properties table. Each job running on the node has a row in
+        the jobs table, and each local copy of a file it read or wrote has a row in the
+        jobFiles table. Each cached file has a row in the cachedFiles table, which records when
+        and how often it was used, in the order of the eviction policies, see
+        toil.fileStores.cacheEvictionPolicy.
+
+        Each thread uses a connection of its own.
         """
+        fileName = '.cacheIndex'
+
+        # How long, in seconds, to wait for another worker to release the cache lock
+        timeout = 3600
+
+        schema = """
+            CREATE TABLE properties (name TEXT PRIMARY KEY, value NUMERIC NOT NULL);
+            CREATE TABLE jobs (jobID TEXT PRIMARY KEY, jobName TEXT NOT NULL,
+                               jobReqs NUMERIC NOT NULL, jobDir TEXT NOT NULL,
+                               pid INTEGER NOT NULL);
+            CREATE TABLE jobFiles (jobID TEXT NOT NULL, fileStoreID TEXT NOT NULL,
+                                   filePath TEXT, fileSize NUMERIC NOT NULL);
+            CREATE INDEX jobFilesByID ON jobFiles (jobID, fileStoreID);
+            CREATE INDEX jobFilesByPath ON jobFiles (jobID, filePath);
+            CREATE TABLE cachedFiles (fileStoreID TEXT PRIMARY KEY, fileSize INTEGER NOT NULL,
+                                      lastAccess REAL NOT NULL, accessCount INTEGER NOT NULL);
+            """
 
-        def __init__(self, dictObj):
-            assert isinstance(dictObj, dict)
-            self.__dict__.update(dictObj)
+        def __init__(self, path):
+            """
+            :param str path: Path to the database of an index made with create.
+            """
+            self.path = path
+            self._local = local()
 
         @classmethod
-        def updateJobSpecificFiles(cls, outer, jobStoreFileID, filePath, fileSize, cached):
+        def create(cls, path, nlink, attemptNumber, total):
+            """
+            Creates the database of an empty cache index.
+
+            :param str path: Path to the database to create.
+            :param int nlink: The nlink threshold of the cache.
+            :param int attemptNumber: The workflow attempt number the cache is set up for.
+            :param int total: The space available for caching and running jobs, in bytes.
+            """
+            connection = sqlite3.connect(path, isolation_level=None)
+            try:
+                # The journal mode is persistent, so it is set once for all connections
+                connection.execute('PRAGMA journal_mode=WAL')
+                connection.executescript(cls.schema)
+                connection.executemany('INSERT INTO properties VALUES (?, ?)',
+                                       [('nlink', nlink),
+                                        ('attemptNumber', attemptNumber),
+                                        ('total', total),
+                                        ('cached', 0),
+                                        ('sigmaJob', 0),
+                                        ('hits', 0),
+                                        ('misses', 0)])
+            finally:
+                connection.close()
+
+        @property
+        def connection(self):
             """
-            This method will update the job specifc files in the job state object. It deals with
-            opening a cache lock file, etc.
-            :param toil.fileStores.CachingFileStore outer: An instance of CachingFileStore
-            :param str jobStoreFileID: job store Identifier for the file
-            :param str filePath: The path to the file
-            :param float fileSize: The size of the file (may be deprecated soon)
-            :param bool cached: T : F : None :: cached : not cached : mutably read
+            The connection of the current thread to the database.
             """
-            with outer._CacheState.open(outer) as cacheInfo:
-                jobState = cls(cacheInfo.jobState[outer.jobID])
-                jobState.addToJobSpecFiles(jobStoreFileID, filePath, fileSize, cached)
-                cacheInfo.jobState[outer.jobID] = jobState.__dict__
+            try:
+                return self._local.connection
+            except AttributeError:
+                connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                             isolation_level=None)
+                # The index doesn't outlive the node, so there is no point in syncing each
+                # transaction to the disk. In write-ahead logging mode, this can't corrupt it.
+                connection.execute('PRAGMA synchronous=NORMAL')
+                self._local.connection = connection
+                return connection
+
+        def close(self):
+            """
+            Close the connection of the current thread, if any.
+            """
+            connection = self._local.__dict__.pop('connection', None)
+            if connection is not None:
+                self._local.inTransaction = False
+                connection.close()
+
+        def begin(self):
+            """
+            Begin a transaction, waiting for any other worker to finish its own.
+            """
+            # An immediate transaction takes the write lock up front, so that it can't fail
+            # halfway through because another transaction started writing first.
+            self.connection.execute('BEGIN IMMEDIATE')
+            self._local.inTransaction = True
+
+        def commit(self):
+            self._local.inTransaction = False
+            self.connection.execute('COMMIT')
+
+        def rollback(self):
+            self._local.inTransaction = False
+            self.connection.execute('ROLLBACK')
+
+        @contextmanager
+        def transaction(self):
+            """
+            A context manager that applies the changes made in its scope atomically. A
+            transaction in the scope of another one, or of the cache lock, is part of it.
+            """
+            if getattr(self._local, 'inTransaction', False):
+                yield
+            else:
+                self.begin()
+                try:
+                    yield
+                except:
+                    self.rollback()
+                    raise
+                else:
+                    self.commit()
+
+        def getState(self):
+            """
+            :rtype: CachingFileStore._CacheState
+            """
+            return CachingFileStore._CacheState(
+                **dict(self.connection.execute('SELECT name, value FROM properties')))
+
+        def setProperties(self, **values):
+            """
+            Set the given properties of the cache, see CachingFileStore._CacheState.
+            """
+            with self.transaction():
+                self.connection.executemany('UPDATE properties SET value = ? WHERE name = ?',
+                                            [(value, name) for name, value in values.items()])
 
-        def addToJobSpecFiles(self, jobStoreFileID, filePath, fileSize, cached):
+        def adjust(self, **deltas):
             """
-            This is the real method that actually does the updations.
+            Add the given amounts to the given properties of the cache, e.g. adjust(cached=-10).
+            """
+            with self.transaction():
+                self.connection.executemany('UPDATE properties SET value = value + ? '
+                                            'WHERE name = ?',
+                                            [(delta, name) for name, delta in deltas.items()])
+
+        def addJob(self, jobState):
+            """
+            :param CachingFileStore._JobState jobState: The state of the new job.
+            """
+            self.connection.execute('INSERT INTO jobs VALUES (?, ?, ?, ?, ?)', jobState)
+
+        def removeJob(self, jobID):
+            """
+            Remove the job and its files from the index.
+            """
+            with self.transaction():
+                self.connection.execute('DELETE FROM jobFiles WHERE jobID = ?', (jobID,))
+                self.connection.execute('DELETE FROM jobs WHERE jobID = ?', (jobID,))
+
+        def getJobs(self):
+            """
+            :rtype: list[CachingFileStore._JobState]
+            """
+            return [CachingFileStore._JobState(*row)
+                    for row in self.connection.execute('SELECT * FROM jobs')]
+
+        def adjustJobReqs(self, jobID, delta):
+            """
+            Add the given amount to the disk requirements of the job.
+            """
+            self.connection.execute('UPDATE jobs SET jobReqs = jobReqs + ? WHERE jobID = ?',
+                                    (delta, jobID))
+
+        def addJobFile(self, jobID, jobStoreFileID, filePath, fileSize, cached):
+            """
+            Record a local copy of a file read or written by the job.
+            :param jobID: The ID of the job
             :param jobStoreFileID: job store Identifier for the file
-            :param filePath: The path to the file
+            :param filePath: The path to the file, None if it is not local
             :param fileSize: The size of the file (may be deprecated soon)
             :param cached: T : F : None :: cached : not cached : mutably read
             """
-            # If there is no entry for the jsfID, make one. self.jobSpecificFiles is a default
-            # dict of default dicts and the absence of a key will return an empty dict
-            # (equivalent to a None for the if)
-            if not self.jobSpecificFiles[jobStoreFileID]:
-                self.jobSpecificFiles[jobStoreFileID][filePath] = fileSize
-            else:
-                # If there's no entry for the filepath, create one
-                if not self.jobSpecificFiles[jobStoreFileID][filePath]:
-                    self.jobSpecificFiles[jobStoreFileID][filePath] = fileSize
-                # This should never happen
-                else:
-                    raise RuntimeError()
-            # Now add the file to the reverse mapper. This will speed up cleanup and local file
-            # deletion.
-            self.filesToFSIDs[filePath].add(jobStoreFileID)
-            if cached:
-                self.updateJobReqs(fileSize, 'add')
-
-        def updateJobReqs(self, fileSize, actions):
+            with self.transaction():
+                self.connection.execute('INSERT INTO jobFiles VALUES (?, ?, ?, ?)',
+                                        (jobID, jobStoreFileID, filePath, fileSize))
+                # If the file was added to the cache, the value is subtracted from the
+                # requirements of the job.
+                if cached:
+                    self.adjustJobReqs(jobID, -fileSize)
+
+        def removeJobFile(self, jobID, jobStoreFileID, filePath):
+            self.connection.execute('DELETE FROM jobFiles WHERE jobID = ? AND fileStoreID = ? '
+                                    'AND filePath IS ?', (jobID, jobStoreFileID, filePath))
+
+        def getJobFiles(self, jobID, jobStoreFileID):
+            """
+            :return: The path and size of each local copy of the file held by the job.
+            :rtype: list[(str,int)]
+            """
+            return self.connection.execute('SELECT filePath, fileSize FROM jobFiles '
+                                           'WHERE jobID = ? AND fileStoreID = ?',
+                                           (jobID, jobStoreFileID)).fetchall()
+
+        def getJobFileIDs(self, jobID):
+            """
+            :return: The IDs of the files the job holds local copies of.
+            :rtype: list[str]
+            """
+            return [fileStoreID for fileStoreID, in self.connection.execute(
+                'SELECT DISTINCT fileStoreID FROM jobFiles WHERE jobID = ?', (jobID,))]
+
+        def getJobFilePaths(self, jobID):
+            """
+            :return: The paths of the local copies of files held by the job.
+            :rtype: set[str]
+            """
+            return {filePath for filePath, in self.connection.execute(
+                'SELECT filePath FROM jobFiles WHERE jobID = ?', (jobID,))}
+
+        def countJobFileIDs(self, jobID, filePath):
+            """
+            :return: The number of job store IDs the job associated with the given local file.
+            :rtype: int
+            """
+            return self.connection.execute('SELECT COUNT(*) FROM jobFiles '
+                                           'WHERE jobID = ? AND filePath = ?',
+                                           (jobID, filePath)).fetchone()[0]
+
+        def addCachedFile(self, jobStoreFileID, fileSize):
+            """
+            Record that the file was added to the cache.
+            """
+            self.connection.execute('INSERT OR REPLACE INTO cachedFiles VALUES (?, ?, ?, 1)',
+                                    (jobStoreFileID, fileSize, time.time()))
+
+        def removeCachedFiles(self, jobStoreFileIDs):
+            """
+            Record that the files were removed from the cache.
+            """
+            self.connection.executemany('DELETE FROM cachedFiles WHERE fileStoreID = ?',
+                                        [(jobStoreFileID,) for jobStoreFileID in jobStoreFileIDs])
+
+        def setCachedFiles(self, cachedFiles):
+            """
+            Replace the record of the cached files, e.g. with what is actually in the cache.
+            :param list[(str,int,float)] cachedFiles: The ID, size and modification time of each
+                   cached file.
+            """
+            with self.transaction():
+                self.connection.execute('DELETE FROM cachedFiles')
+                self.connection.executemany('INSERT INTO cachedFiles VALUES (?, ?, ?, 1)',
+                                            cachedFiles)
+
+        def recordHit(self, jobStoreFileID):
+            """
+            Record a read of a file that was found in the cache.
+            """
+            with self.transaction():
+                self.connection.execute('UPDATE cachedFiles SET lastAccess = ?, '
+                                        'accessCount = accessCount + 1 WHERE fileStoreID = ?',
+                                        (time.time(), jobStoreFileID))
+                self.adjust(hits=1)
+
+        def recordMiss(self):
+            """
+            Record a read of a file that wasn't found in the cache.
+            """
+            self.adjust(misses=1)
+
+        def getEvictionCandidates(self, orderBy):
             """
-            This method will update the current state of the disk required by the job after the
-            most recent cache operation.
-            :param fileSize: Size of the last file added/removed from the cache
-            :param actions: 'add' or 'remove'
+            Generates the cached files in the order they should be evicted in. The index must
+            not be changed before the generator is exhausted or closed.
+            :param str orderBy: An eviction policy, see toil.fileStores.cacheEvictionPolicy
+            :return: The ID and size of each cached file
+            :rtype: collections.Iterator[(str,int)]
             """
-            assert actions in ('add', 'remove')
-            multiplier = 1 if actions == 'add' else -1
-            # If the file was added to the cache, the value is subtracted from the requirements,
-            # and it is added if the file was removed form the cache.
-            self.jobReqs -= (fileSize * multiplier)
+            # Keep an index for the policy, so that the next candidate is found in logarithmic time
+            indexName = 'cachedFilesBy' + sha1(orderBy.encode('utf-8')).hexdigest()
+            self.connection.execute('CREATE INDEX IF NOT EXISTS %s ON cachedFiles (%s)'
+                                    % (indexName, orderBy))
+            cursor = self.connection.execute('SELECT fileStoreID, fileSize FROM cachedFiles '
+                                             'ORDER BY %s' % orderBy)
+            try:
+                for row in cursor:
+                    yield row
+            finally:
+                cursor.close()
+
+    class _CacheLock(object):
+        """
+        The lock serializing the cache operations of the workers on a node, see cacheLock. It can
+        be released before the end of the with statement, and acquired again.
+        """
+
+        def __init__(self, cacheIndex):
+            self.cacheIndex = cacheIndex
+            self.held = False
+
+        def acquire(self):
+            self.cacheIndex.begin()
+            self.held = True
+            logger.debug("CACHE: Obtained lock on %s" % self.cacheIndex.path)
+
+        def release(self):
+            self.cacheIndex.commit()
+            self.held = False
+            logger.debug("CACHE: Released lock")
+
+        def __enter__(self):
+            self.acquire()
+            return self
+
+        def __exit__(self, exc_type, exc_val, exc_tb):
+            if self.held:
+                if exc_type is None:
+                    self.release()
+                else:
+                    # Discard the changes of the failed operation
+                    self.held = False
+                    self.cacheIndex.rollback()
+                    logger.debug("CACHE: Released lock")
 
-        def isPopulated(self):
-            return self.__dict__ != {}
+    @classmethod
+    def findAndHandleDeadJobs(cls, nodeInfo, batchSystemShutdown=False):
+        """
+        :param toil.fileStores.CachingFileStore._CacheIndex nodeInfo: The index of the node cache
+        """
+        for jobState in nodeInfo.getJobs():
+            if not cls._pidExists(jobState.pid):
+                logger.warning('Detected that job (%s) prematurely terminated.  Fixing the state '
+                               'of the cache.', jobState.jobName)
+                if not batchSystemShutdown:
+                    logger.debug("Returning dead job's used disk to cache.")
+                    # Delete the old work directory if it still exists, to remove unwanted nlinks.
+                    # Do this only during the life of the program and dont' do it during the
+                    # batch system cleanup.  Leave that to the batch system cleanup code.
+                    if os.path.exists(jobState.jobDir):
+                        shutil.rmtree(jobState.jobDir)
+                    nodeInfo.adjust(sigmaJob=-jobState.jobReqs)
+                # Remove job from the cache index
+                nodeInfo.removeJob(jobState.jobID)
 
     class HarbingerFile(object):
         """
         Represents the placeholder file that harbinges the arrival of a local copy of a file in
-        the job store.
+        the job store. The process transferring the file holds a :class:`SingleFlight` on the
+        harbinger, so the other processes that need the file block on it until the transfer is
+        done instead of downloading the file redundantly, and don't wait for a process that died.
         """
 
         def __init__(self, fileStore, fileStoreID=None, cachedFileName=None):
@@ -1076,72 +1330,165 @@ class CachingFileStore(AbstractFileStore):
                 self.fileStoreID = fileStore.decodedFileID(cachedFileName)
             self.fileStore = fileStore
             self.harbingerFileName = '/.'.join(os.path.split(cachedFileName)) + '.harbinger'
+            self.flight = SingleFlight(self.harbingerFileName)
 
         def write(self):
+            """
+            Announce that this process is transferring the file. The caller must hold the cache
+            lock, or otherwise know that no other process is transferring the file.
+            """
             self.fileStore.logToMaster('CACHE: Creating a harbinger file for (%s). '
                                        % self.fileStoreID, logging.DEBUG)
-            with open(self.harbingerFileName + '.tmp', 'w') as harbingerFile:
-                harbingerFile.write(str(os.getpid()))
-            # Make this File read only to prevent overwrites
-            os.chmod(self.harbingerFileName + '.tmp', 0o444)
-            os.rename(self.harbingerFileName + '.tmp', self.harbingerFileName)
+            if not self.flight.take(blocking=False):
+                raise RuntimeError('File with ID %s is already being transferred.'
+                                   % self.fileStoreID)
 
-        def waitOnDownload(self, lockFileHandle):
+        def waitOnDownload(self):
             """
             This method is called when a readGlobalFile process is waiting on another process to
-            write a file to the cache.
-            :param lockFileHandle: The open handle to the cache lock file
+            write a file to the cache. It blocks until the other process is done, or dies. The
+            caller must not hold the cache lock.
             """
-            while self.exists():
-                logger.debug('CACHE: Waiting for another worker to download file with ID %s.'
-                            % self.fileStoreID)
-                # Ensure that the process downloading the file is still alive.  The PID will
-                # be in the harbinger file.
-                pid = self.read()
-                if AbstractFileStore._pidExists(pid):
-                    # Release the file lock and then wait for a bit before repeating.
-                    flock(lockFileHandle, LOCK_UN)
-                    time.sleep(20)
-                    # Grab the file lock before repeating.
-                    flock(lockFileHandle, LOCK_EX)
-                else:
-                    # The process that was supposed to download the file has died so we need
-                    # to remove the harbinger.
-                    self._delete()
-
-        def read(self):
-            return int(open(self.harbingerFileName).read())
+            logger.debug('CACHE: Waiting for another worker to download file with ID %s.'
+                         % self.fileStoreID)
+            self.flight.wait()
 
         def exists(self):
-            return os.path.exists(self.harbingerFileName)
-
-        def delete(self):
             """
-            Acquires the cache lock then attempts to delete the harbinger file.
+            :return: whether a process is transferring the file
+            :rtype: bool
             """
-            with self.fileStore.cacheLock():
-                self._delete()
+            return self.flight.inFlight()
 
-        def _delete(self):
+        def delete(self):
             """
-            This function assumes you already have the cache lock!
+            Announce that this process is done transferring the file, waking up the processes
+            waiting for it.
             """
-            assert self.exists()
             self.fileStore.logToMaster('CACHE: Deleting the harbinger file for (%s)' %
                                        self.fileStoreID, logging.DEBUG)
-            os.remove(self.harbingerFileName)
+            self.flight.land()
+
+    # Functions related to downloading files ahead of time
+    def _prefetch(self, fileStoreIDs, jobDisk):
+        """
+        Start downloading the given files into the cache, one after the other, in a thread of
+        their own. A file being downloaded has a harbinger like any other, so readGlobalFile
+        waits for the download to finish instead of downloading the file again. Files that are
+        cached or being downloaded already, whose size isn't known, or that don't fit into the
+        cache next to the job are left for readGlobalFile to handle.
+        """
+        fileStoreIDs = [fileStoreID for fileStoreID in fileStoreIDs
+                        if getattr(fileStoreID, 'size', None) is not None]
+        if not fileStoreIDs:
+            return
+        if self._prefetchThread is None:
+            self._prefetchQueue = Queue()
+            self._prefetchThread = Thread(target=self._prefetchFiles, args=(self._prefetchQueue,))
+            # Don't keep a failed worker from exiting
+            self._prefetchThread.daemon = True
+            self._prefetchThread.start()
+        for fileStoreID in fileStoreIDs:
+            self._prefetchQueue.put((fileStoreID, jobDisk))
+
+    def _stopPrefetching(self):
+        """
+        Drop the files that are still to be downloaded ahead of time and wait for the download in
+        progress, if any, to finish.
+        """
+        if self._prefetchThread is not None:
+            queue, thread = self._prefetchQueue, self._prefetchThread
+            self._prefetchQueue, self._prefetchThread = None, None
+            try:
+                while True:
+                    queue.get_nowait()
+            except Empty:
+                pass
+            queue.put(None)
+            thread.join()
+
+    def _prefetchFiles(self, queue):
+        """
+        Download the files taken from the given queue into the cache, until None.
+
+        :param Queue queue: the queue to take the file IDs and the disk requirements of the job
+               from
+        """
+        while True:
+            args = queue.get()
+            if args is None:
+                break
+            fileStoreID, jobDisk = args
+            try:
+                self._prefetchFile(fileStoreID, jobDisk)
+            except Exception:
+                # The job will download the file itself if it reads it
+                logger.warning('Failed to download file with ID %s ahead of time.', fileStoreID,
+                               exc_info=True)
+
+    def _prefetchFile(self, fileStoreID, jobDisk):
+        cachedFileName = self.encodedFileID(fileStoreID)
+        partialFileName = '/.'.join(os.path.split(cachedFileName))
+        harbingerFile = self.HarbingerFile(self, cachedFileName=cachedFileName)
+        with self.cacheLock():
+            if self._fileIsCached(fileStoreID) or harbingerFile.exists():
+                return
+            # Leave room for the job. If the job is registered already, its disk requirement is
+            # counted twice, which errs on the side of not downloading the file.
+            cacheInfo = self.cacheIndex.getState()
+            cachedSize = fileStoreID.size if self.nlinkThreshold == 1 else 0
+            if not cacheInfo._replace(cached=cacheInfo.cached + cachedSize,
+                                      sigmaJob=cacheInfo.sigmaJob + jobDisk).isBalanced():
+                logger.debug('CACHE: No room to download file with ID \'%s\' ahead of time.'
+                             % fileStoreID)
+                return
+            logger.debug('CACHE: Downloading file with ID \'%s\' ahead of time.' % fileStoreID)
+            self.cacheIndex.recordMiss()
+            harbingerFile.write()
+        try:
+            self.jobStore.readFile(fileStoreID, partialFileName, symlink=False)
+            with self.cacheLock():
+                os.rename(partialFileName, cachedFileName)
+                # If this is not true we get into trouble in our internal reference counting.
+                assert os.stat(cachedFileName).st_nlink == self.nlinkThreshold
+                os.chmod(cachedFileName, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                fileSize = os.stat(cachedFileName).st_size
+                self.cacheIndex.addCachedFile(fileStoreID, fileSize)
+                # No job uses the file yet, see returnFileSize
+                if self.nlinkThreshold == 1:
+                    self.cacheIndex.adjust(cached=fileSize)
+        except:
+            if os.path.exists(partialFileName):
+                os.remove(partialFileName)
+            raise
+        finally:
+            harbingerFile.delete()
 
     # Functions related to async updates
-    def asyncWrite(self):
+    def _startAsyncWrites(self):
+        """
+        Start the threads writing the files of the current job asynchronously, unless they are
+        running already.
+        """
+        if not self.workers:
+            self.queue = Queue()
+            self.workers = [Thread(target=self.asyncWrite, args=(self.queue,))
+                            for i in range(self.workerNumber)]
+            for worker in self.workers:
+                worker.start()
+
+    def asyncWrite(self, queue):
         """
         A function to write files asynchronously to the job store such that subsequent jobs are
         not delayed by a long write operation.
+
+        :param Queue queue: the queue to take the open files and their harbingers from, until None
         """
         try:
             while True:
                 try:
                     # Block for up to two seconds waiting for a file
-                    args = self.queue.get(timeout=2)
+                    args = queue.get(timeout=2)
                 except Empty:
                     # Check if termination event is signaled
                     # (set in the event of an exception in the worker)
@@ -1151,21 +1498,19 @@ class CachingFileStore(AbstractFileStore):
                 # Normal termination condition is getting None from queue
                 if args is None:
                     break
-                inputFileHandle, jobStoreFileID = args
-                cachedFileName = self.encodedFileID(jobStoreFileID)
-                # Ensure that the harbinger exists in the cache directory and that the PID
-                # matches that of this writing thread.
-                # If asyncWrite is ported to subprocesses instead of threads in the future,
-                # insert logic here to securely overwrite the harbinger file.
-                harbingerFile = self.HarbingerFile(self, cachedFileName=cachedFileName)
-                assert harbingerFile.exists()
-                assert harbingerFile.read() == int(os.getpid())
+                # The harbinger was written by the job writing the file, and is held until the
+                # file is in the job store.
+                inputFileHandle, harbingerFile = args
+                jobStoreFileID = harbingerFile.fileStoreID
+                fileSize = os.fstat(inputFileHandle.fileno()).st_size
+                self._uploadStarted()
                 # We pass in a fileHandle, rather than the file-name, in case
                 # the file itself is deleted. The fileHandle itself should persist
                 # while we maintain the open file handle
                 with self.jobStore.updateFileStream(jobStoreFileID) as outputFileHandle:
                     shutil.copyfileobj(inputFileHandle, outputFileHandle)
                 inputFileHandle.close()
+                self._uploadFinished(fileSize)
                 # Remove the file from the lock files
                 with self._pendingFileWritesLock:
                     self._pendingFileWrites.remove(jobStoreFileID)
@@ -1175,25 +1520,80 @@ class CachingFileStore(AbstractFileStore):
             self._terminateEvent.set()
             raise
 
+    def _waitForRoomToUpload(self, fileSize):
+        """
+        Wait until the files waiting to be uploaded take up no more room than is left free on the
+        local disk, including the given file, and then count the given file in. A deleted file
+        still takes up room until it is uploaded, since it is uploaded from an open file handle.
+        Files are never held back while nothing else is waiting to be uploaded.
+
+        :param int fileSize: the size of the file to upload, in bytes
+        """
+        with self._uploadCondition:
+            while (self._pendingUploadBytes > 0 and
+                   self._pendingUploadBytes + fileSize > getFileSystemSize(self.localCacheDir)[0]):
+                logger.debug('Waiting for %s of files to be uploaded before writing more.',
+                             bytes2human(self._pendingUploadBytes))
+                # Time out to notice a failed upload, or room freed by other jobs on the node
+                self._uploadCondition.wait(2)
+                if self._terminateEvent.isSet():
+                    raise RuntimeError("The termination flag is set, exiting")
+            self._pendingUploadBytes += fileSize
+
+    def _uploadStarted(self):
+        with self._uploadCondition:
+            if self._activeUploads == 0:
+                self._uploadsBusySince = time.time()
+            self._activeUploads += 1
+
+    def _uploadFinished(self, fileSize):
+        with self._uploadCondition:
+            self._activeUploads -= 1
+            if self._activeUploads == 0:
+                self._uploadStats['time'] += time.time() - self._uploadsBusySince
+            self._uploadStats['files'] += 1
+            self._uploadStats['bytes'] += fileSize
+            self._pendingUploadBytes -= fileSize
+            self._uploadCondition.notify_all()
+
+    def _getUploadStats(self):
+        with self._uploadCondition:
+            stats = dict(self._uploadStats)
+        # The time is the time during which at least one file was being uploaded
+        stats['throughput'] = stats['bytes'] / stats['time'] if stats['time'] else 0.0
+        return {name: str(value) for name, value in stats.items()}
+
     def _updateJobWhenDone(self):
         """
         Asynchronously update the status of the job on the disk, first waiting \
-        until the writing threads have finished and the input blockFn has stopped \
-        blocking.
+        until the writing threads have finished and the previous update, or the \
+        input blockFn, has stopped blocking.
+
+        The update works on a snapshot of the job and of the files and jobs to delete, so that
+        this file store can serve the next job right away, see _setJobGraph.
         """
+        jobGraph = self.jobGraph.snapshot()
+        filesToDelete = list(self.filesToDelete)
+        jobsToDelete = list(self.jobsToDelete)
+        queue, workers = self.queue, self.workers
+        self.queue, self.workers = None, []
+        previousUpdateThread = self.updateThread
 
         def asyncUpdate():
             try:
                 # Wait till all file writes have completed
-                for i in range(len(self.workers)):
-                    self.queue.put(None)
+                for i in range(len(workers)):
+                    queue.put(None)
 
-                for thread in self.workers:
+                for thread in workers:
                     thread.join()
 
-                # Wait till input block-fn returns - in the event of an exception
-                # this will eventually terminate
-                self.inputBlockFn()
+                # Wait till the update of the previous job, or the input block-fn, returns - in
+                # the event of an exception this will eventually terminate
+                if previousUpdateThread is None:
+                    self.inputBlockFn()
+                else:
+                    previousUpdateThread.join()
 
                 # Check the terminate event, if set we can not guarantee
                 # that the workers ended correctly, therefore we exit without
@@ -1203,55 +1603,43 @@ class CachingFileStore(AbstractFileStore):
 
                 # Indicate any files that should be deleted once the update of
                 # the job wrapper is completed.
-                self.jobGraph.filesToDelete = list(self.filesToDelete)
+                jobGraph.filesToDelete = filesToDelete
 
                 # Complete the job
-                self.jobStore.update(self.jobGraph)
+                self.jobStore.update(jobGraph)
 
                 # Delete any remnant jobs
-                list(map(self.jobStore.delete, self.jobsToDelete))
+                list(map(self.jobStore.delete, jobsToDelete))
 
                 # Delete any remnant files
-                list(map(self.jobStore.deleteFile, self.filesToDelete))
+                list(map(self.jobStore.deleteFile, filesToDelete))
 
                 # Remove the files to delete list, having successfully removed the files
-                if len(self.filesToDelete) > 0:
-                    self.jobGraph.filesToDelete = []
+                if len(filesToDelete) > 0:
+                    jobGraph.filesToDelete = []
                     # Update, removing emptying files to delete
-                    self.jobStore.update(self.jobGraph)
+                    self.jobStore.update(jobGraph)
             except:
                 self._terminateEvent.set()
                 raise
-            finally:
-                # Indicate that _blockFn can return
-                # This code will always run
-                self.updateSemaphore.release()
 
-        # The update semaphore is held while the job is written to the job store
-        try:
-            self.updateSemaphore.acquire()
-            t = Thread(target=asyncUpdate)
-            t.start()
-        except:
-            # This is to ensure that the semaphore is released in a crash to stop a deadlock
-            # scenario
-            self.updateSemaphore.release()
-            raise
+        self.updateThread = Thread(target=asyncUpdate)
+        self.updateThread.start()
 
     def _blockFn(self):
-        self.updateSemaphore.acquire()
-        self.updateSemaphore.release()  # Release so that the block function can be recalled
-        # This works, because once acquired the semaphore will not be acquired
-        # by _updateJobWhenDone again.
+        # Each update waits for the previous one, so waiting for the latest update is enough
+        if self.updateThread is not None:
+            self.updateThread.join()
         return
 
     @classmethod
     def shutdown(cls, dir_):
         """
-        :param dir_: The directory that will contain the cache state file.
+        :param dir_: The directory that will contain the cache index.
         """
-        cacheInfo = cls._CacheState._load(os.path.join(dir_, '_cacheState'))
-        cls.findAndHandleDeadJobs(cacheInfo, batchSystemShutdown=True)
+        cacheIndex = cls._CacheIndex(os.path.join(dir_, cls._CacheIndex.fileName))
+        cls.findAndHandleDeadJobs(cacheIndex, batchSystemShutdown=True)
+        cacheIndex.close()
         shutil.rmtree(dir_)
 
     def __del__(self):
@@ -1259,10 +1647,9 @@ class CachingFileStore(AbstractFileStore):
         Cleanup function that is run when destroying the class instance that ensures that all the
         file writing threads exit.
         """
-        self.updateSemaphore.acquire()
+        self._blockFn()
         for i in range(len(self.workers)):
             self.queue.put(None)
         for thread in self.workers:
             thread.join()
-        self.updateSemaphore.release()
 
@@ -61,6 +61,11 @@ class NonCachingFileStore(AbstractFileStore):
         self.jobStateFile = None
         self.localFileMap = defaultdict(list)
 
+    def _setJobGraph(self, jobGraph):
+        super(NonCachingFileStore, self)._setJobGraph(jobGraph)
+        self.jobStateFile = None
+        self.localFileMap = defaultdict(list)
+
     @contextmanager
     def open(self, job):
         jobReqs = job.disk
@@ -43,12 +43,14 @@ from io import BytesIO
 
 # Python 3 compatibility imports
 from six import iteritems, string_types
+from six.moves import intern
 
 from toil.lib.expando import Expando
 from toil.lib.humanize import human2bytes
 
 from toil.common import Toil, addOptions, safeUnpickleFromStream
 from toil.deferred import DeferredFunction
+from toil.fileStores import FileID
 from toil.lib.bioio import (setLoggingFromOptions,
                             getTotalCpuTimeAndMemoryUsage,
                             getTotalCpuTime)
@@ -58,14 +60,53 @@ from future.utils import with_metaclass
 logger = logging.getLogger( __name__ )
 
 
+def _intern(value):
+    """
+    Intern the given string so that all jobs with the same name share a single copy of it. Values
+    that can't be interned, e.g. None, are returned as is.
+    """
+    try:
+        return intern(value)
+    except TypeError:
+        return value
+
+
+_slotNamesCache = {}
+
+
+def _slotNames(cls):
+    """
+    Return the names of all slots declared by the given class and its bases.
+    """
+    try:
+        return _slotNamesCache[cls]
+    except KeyError:
+        names = tuple(name
+                      for base in cls.__mro__
+                      for name in base.__dict__.get('__slots__', ())
+                      if name not in ('__dict__', '__weakref__'))
+        _slotNamesCache[cls] = names
+        return names
+
+
 class BaseJob(object):
     """
     Inherit from this class to add job properties to an object.
 
     If the object doesn't specify explicit requirements, these properties will fall back
     to the configured defaults. If the value cannot be determined, an AttributeError is raised.
+
+    The attributes are held in slots rather than an instance dictionary since the leader keeps a
+    JobNode or JobGraph around for every job in the workflow. For the same reason the names,
+    which are typically shared by many jobs, are interned.
     """
-    def __init__(self, requirements, unitName, displayName=None, jobName=None):
+    __slots__ = ('unitName', 'displayName', 'jobName',
+                 '_cores', '_memory', '_disk', '_preemptable', '_config', 'priority')
+
+    # The attributes whose string values are interned
+    _internedAttributes = ('unitName', 'displayName', 'jobName')
+
+    def __init__(self, requirements, unitName, displayName=None, jobName=None, priority=None):
         cores = requirements.get('cores')
         memory = requirements.get('memory')
         disk = requirements.get('disk')
@@ -74,14 +115,41 @@ class BaseJob(object):
             assert isinstance(unitName, (str, bytes))
         if jobName:
             assert isinstance(jobName, (str, bytes))
-        self.unitName = unitName
-        self.displayName = displayName if displayName else self.__class__.__name__
-        self.jobName = jobName if jobName else self.__class__.__name__
+        self.unitName = _intern(unitName)
+        self.displayName = _intern(displayName if displayName else self.__class__.__name__)
+        self.jobName = _intern(jobName if jobName else self.__class__.__name__)
         self._cores = self._parseResource('cores', cores)
         self._memory = self._parseResource('memory', memory)
         self._disk = self._parseResource('disk', disk)
         self._preemptable = preemptable
         self._config = None
+        # The order in which the leader issues jobs that are ready at the same time, see
+        # toil.schedulingPolicy
+        self.priority = priority
+
+    def __getstate__(self):
+        """
+        Return a dictionary of this object's attributes, including those held in slots.
+        """
+        state = dict(getattr(self, '__dict__', ()))
+        for name in _slotNames(type(self)):
+            try:
+                state[name] = getattr(self, name)
+            except AttributeError:
+                pass
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restore the attributes from a dictionary created by :meth:`__getstate__` or, for objects
+        pickled before the attributes were moved to slots, from the instance dictionary.
+        """
+        # Objects pickled before jobs had a priority don't have one
+        self.priority = None
+        for name, value in iteritems(state):
+            if name in self._internedAttributes:
+                value = _intern(value)
+            setattr(self, name, value)
 
     @property
     def disk(self):
@@ -196,9 +264,12 @@ class JobNode(BaseJob):
     """
     This object bridges the job graph, job, and batchsystem classes
     """
+    __slots__ = ('jobStoreID', 'predecessorNumber', 'command')
+
     def __init__(self, requirements, jobName, unitName, jobStoreID,
-                 command, displayName=None, predecessorNumber=1):
-        super().__init__(requirements=requirements, displayName=displayName, unitName=unitName, jobName=jobName)
+                 command, displayName=None, predecessorNumber=1, priority=None):
+        super().__init__(requirements=requirements, displayName=displayName, unitName=unitName,
+                         jobName=jobName, priority=priority)
         self.jobStoreID = jobStoreID
         self.predecessorNumber = predecessorNumber
         self.command = command
@@ -211,7 +282,7 @@ class JobNode(BaseJob):
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            return self.__dict__ == other.__dict__
+            return self.__getstate__() == other.__getstate__()
         return NotImplemented
 
     def __ne__(self, other):
@@ -220,7 +291,7 @@ class JobNode(BaseJob):
         return NotImplemented
 
     def __repr__(self):
-        return '%s( **%r )' % (self.__class__.__name__, self.__dict__)
+        return '%s( **%r )' % (self.__class__.__name__, self.__getstate__())
 
     @classmethod
     def fromJobGraph(cls, jobGraph):
@@ -236,7 +307,8 @@ class JobNode(BaseJob):
                    jobName=jobGraph.jobName,
                    unitName=jobGraph.unitName,
                    displayName=jobGraph.displayName,
-                   predecessorNumber=jobGraph.predecessorNumber)
+                   predecessorNumber=jobGraph.predecessorNumber,
+                   priority=jobGraph.priority)
 
     @classmethod
     def fromJob(cls, job, command, predecessorNumber):
@@ -255,14 +327,15 @@ class JobNode(BaseJob):
                    jobName=job.jobName,
                    unitName=job.unitName,
                    displayName=job.displayName,
-                   predecessorNumber=predecessorNumber)
+                   predecessorNumber=predecessorNumber,
+                   priority=job.priority)
 
 class Job(BaseJob):
     """
     Class represents a unit of work in toil.
     """
     def __init__(self, memory=None, cores=None, disk=None, preemptable=None,
-                       unitName=None, checkpoint=False, displayName=None):
+                       unitName=None, checkpoint=False, displayName=None, priority=None):
         """
         This method must be called by any overriding constructor.
 
@@ -274,15 +347,20 @@ class Job(BaseJob):
             exhausting all their retries, remove any successor jobs and rerun this job to restart the
             subtree. Job must be a leaf vertex in the job graph when initially defined, see
             :func:`toil.job.Job.checkNewCheckpointsAreCutVertices`.
+        :param priority: jobs that are ready to run at the same time are issued to the batch
+            system in the order of their priorities, highest first. Jobs without a priority have
+            priority 0. See the --schedulingPolicy option.
         :type cores: int or string convertable by toil.lib.humanize.human2bytes to an int
         :type disk: int or string convertable by toil.lib.humanize.human2bytes to an int
         :type preemptable: bool
         :type cache: int or string convertable by toil.lib.humanize.human2bytes to an int
         :type memory: int or string convertable by toil.lib.humanize.human2bytes to an int
+        :type priority: int or float
         """
         requirements = {'memory': memory, 'cores': cores, 'disk': disk,
                         'preemptable': preemptable}
-        super().__init__(requirements=requirements, unitName=unitName, displayName=displayName)
+        super().__init__(requirements=requirements, unitName=unitName, displayName=displayName,
+                         priority=priority)
         self.checkpoint = checkpoint
         self.displayName = displayName if displayName is not None else self.__class__.__name__
 
@@ -312,6 +390,8 @@ class Job(BaseJob):
         self._defer = None
         self._tempDir = None
         self._succeeded = True
+        # See Job.addInputFiles
+        self._inputFileIDs = []
 
     def run(self, fileStore):
         """
@@ -411,6 +491,53 @@ class Job(BaseJob):
             self._services.append(jobService)
             return jobService.rv()
 
+    def addInputFiles(self, *fileIDs):
+        """
+        Declare files in the file store that the job will read, so that the worker running the
+        job can start downloading them into the cache before the job runs, see
+        :func:`toil.fileStores.abstractFileStore.AbstractFileStore.readGlobalFile`. The
+        :class:`toil.fileStores.FileID` instances among the arguments of a job, and among the
+        values of the promises passed to it, don't need to be declared.
+
+        :param toil.fileStores.FileID fileIDs: the IDs of the files, as returned by
+               writeGlobalFile or importFile. Only files whose size is known are downloaded
+               ahead of time.
+        """
+        self._inputFileIDs.extend(fileIDs)
+
+    def _getInputFileIDs(self):
+        """
+        Returns the files the job declared it will read, followed by the
+        :class:`toil.fileStores.FileID` instances found in the attributes of the job, including
+        the arguments of a job wrapping a function. Lists, tuples, sets and dictionaries are
+        searched, other objects are not.
+
+        :rtype: list[toil.fileStores.FileID]
+        """
+        fileIDs = []
+        seen = set()
+        for fileID in self._inputFileIDs:
+            if fileID not in seen:
+                seen.add(fileID)
+                fileIDs.append(fileID)
+        searched = set()
+        values = collections.deque(vars(self).values())
+        while values:
+            value = values.popleft()
+            if isinstance(value, FileID):
+                if value not in seen:
+                    seen.add(value)
+                    fileIDs.append(value)
+            elif isinstance(value, (list, tuple, set, frozenset, dict)):
+                if id(value) not in searched:
+                    searched.add(id(value))
+                    if isinstance(value, dict):
+                        values.extend(value.keys())
+                        values.extend(value.values())
+                    else:
+                        values.extend(value)
+        return fileIDs
+
     ##Convenience functions for creating jobs
 
     def addChildFn(self, fn, *args, **kwargs):
@@ -475,6 +602,34 @@ class Job(BaseJob):
         else:
             return self.addFollowOn(JobFunctionWrappingJob(fn, *args, **kwargs))
 
+    def addChildMap(self, fn, items, *args, **kwargs):
+        """
+        Adds a job applying a function to each item of a list as a child job. See
+        :class:`toil.job.MapJob`.
+
+        :param fn: Function to be called with each item of ``items``, followed by ``*args`` and
+               ``**kwargs``, as arguments. See toil.job.MapJob for reserved keyword arguments
+               used to specify the size of the chunks and their resource requirements.
+        :param list items: The items, or a promise of them.
+        :return: The new child job that maps fn over the items.
+        :rtype: toil.job.MapJob
+        """
+        return self.addChild(MapJob(fn, items, *args, **kwargs))
+
+    def addFollowOnMap(self, fn, items, *args, **kwargs):
+        """
+        Adds a job applying a function to each item of a list as a follow-on job. See
+        :class:`toil.job.MapJob`.
+
+        :param fn: Function to be called with each item of ``items``, followed by ``*args`` and
+               ``**kwargs``, as arguments. See toil.job.MapJob for reserved keyword arguments
+               used to specify the size of the chunks and their resource requirements.
+        :param list items: The items, or a promise of them.
+        :return: The new follow-on job that maps fn over the items.
+        :rtype: toil.job.MapJob
+        """
+        return self.addFollowOn(MapJob(fn, items, *args, **kwargs))
+
     @property
     def tempDir(self):
         """
@@ -527,6 +682,21 @@ class Job(BaseJob):
         else:
             return JobFunctionWrappingJob(fn, *args, **kwargs)
 
+    @staticmethod
+    def wrapMap(fn, items, *args, **kwargs):
+        """
+        Makes a Job applying a function to each item of a list. \
+        Convenience function for constructor of :class:`toil.job.MapJob`.
+
+        :param fn: Function to be called with each item of ``items``, followed by ``*args`` and
+               ``**kwargs``, as arguments. See toil.job.MapJob for reserved keyword arguments
+               used to specify the size of the chunks and their resource requirements.
+        :param list items: The items, or a promise of them.
+        :return: The new job that maps fn over the items.
+        :rtype: toil.job.MapJob
+        """
+        return MapJob(fn, items, *args, **kwargs)
+
     def encapsulate(self):
         """
         Encapsulates the job, see :class:`toil.job.EncapsulatedJob`.
@@ -1160,6 +1330,11 @@ class Job(BaseJob):
         # filter_main() in _unpickle( ) do its job of resolving any user-defined type or function.
         userScript = self.getUserScript().globalize()
         jobsToJobGraphs[self].command = ' '.join(('_toil', fileStoreID) + userScript.toCommand())
+        jobsToJobGraphs[self].isCheckpoint = bool(self.checkpoint)
+        inputFileIDs = [(str(fileID), fileID.size) for fileID in self._getInputFileIDs()
+                        if isinstance(fileID, FileID)]
+        if inputFileIDs:
+            jobsToJobGraphs[self].inputFileIDs = inputFileIDs
         #Update the status of the jobGraph on disk
         jobStore.update(jobsToJobGraphs[self])
 
@@ -1470,7 +1645,8 @@ class FunctionWrappingJob(Job):
                      disk=resolve('disk', dehumanize=True),
                      preemptable=resolve('preemptable'),
                      checkpoint=resolve('checkpoint', default=False),
-                     unitName=resolve('name', default=None))
+                     unitName=resolve('name', default=None),
+                     priority=resolve('priority'))
 
         self.userFunctionModule = ModuleDescriptor.forModule(userFunction.__module__).globalize()
         self.userFunctionName = str(userFunction.__name__)
@@ -1611,8 +1787,9 @@ class EncapsulatedJob(Job):
         """
         :param toil.job.Job job: the job to encapsulate.
         """
-        # Giving the root of the subgraph the same resources as the first job in the subgraph.
-        Job.__init__(self, **job._requirements)
+        # Giving the root of the subgraph the same resources and priority as the first job in
+        # the subgraph.
+        Job.__init__(self, priority=job.priority, **job._requirements)
         # Ensure that the encapsulated job has the same direct predecessors as the job
         # being encapsulated.
         if job._directPredecessors:
@@ -1645,7 +1822,101 @@ class EncapsulatedJob(Job):
         return self.encapsulatedJob.getUserScript()
 
 
+class MapJob(FunctionWrappingJob):
+    """
+    Job applying a function to each item of a list, for workflows that would otherwise add a
+    child job for each item. The items are processed in chunks, each by a child job of its own,
+    so that there are a lot fewer jobs for the leader, the batch system and the job store to
+    handle::
+
+        squares = job.addChildMap(square, range(10000), chunkSize=1000, memory='1G')
+
+    The return value of a map job (as accessed by the :func:`toil.job.Job.rv` function) is the
+    list of the values the function returned for the items, in the order of the items. Like that
+    of any other job, it can be passed to the successors of the map job.
+
+    Besides the keywords reserved by :class:`toil.job.FunctionWrappingJob`, which specify the
+    resource requirements of each chunk, the keyword ``chunkSize`` is reserved to specify the
+    number of items in a chunk, :attr:`defaultChunkSize` by default. The map job itself only
+    splits the items into chunks when it is run, so the items can be a promise.
+    """
+    defaultChunkSize = 100
+
+    # The keywords reserved by FunctionWrappingJob that are passed on to the chunks. The map job
+    # itself may be a checkpoint.
+    _chunkKeywords = ('memory', 'cores', 'disk', 'preemptable', 'name', 'priority')
+
+    # The requirements of the jobs splitting the items and gathering the results
+    _helperRequirements = dict(disk='100M', memory='512M', cores=0.1)
+
+    def __init__(self, userFunction, items, *args, **kwargs):
+        """
+        :param callable userFunction: The function to apply. It will be called with each item,
+               followed by ``*args`` and ``**kwargs``, as arguments.
+        :param list items: The items to apply the function to.
+        """
+        chunkSize = kwargs.pop('chunkSize', None)
+        self._chunkSize = self.defaultChunkSize if chunkSize is None else chunkSize
+        if self._chunkSize < 1:
+            raise ValueError('The chunk size of a map job must be positive, not %s' % chunkSize)
+        self._chunkKwargs = {key: kwargs.pop(key) for key in self._chunkKeywords if key in kwargs}
+        kwargs.update(self._helperRequirements)
+        super().__init__(userFunction, *args, **kwargs)
+        self._items = items
+
+    def run(self, fileStore):
+        userFunction = self._getUserFunction()
+        items = list(self._items)
+        kwargs = dict(self._kwargs, **self._chunkKwargs)
+        # The chunks and the job gathering their results are successors of a child, so that the
+        # results are ready by the time the follow-ons of the map job run
+        parentJob = self.addChild(Job(**self._helperRequirements))
+        chunkJobs = [parentJob.addChild(MapChunkJob(userFunction, items[i:i + self._chunkSize],
+                                                    *self._args, **kwargs))
+                     for i in range(0, len(items), self._chunkSize)]
+        gatherJob = MapGatherJob([chunkJob.rv() for chunkJob in chunkJobs],
+                                 self.getUserScript(), **self._helperRequirements)
+        return parentJob.addFollowOn(gatherJob).rv()
+
+
+class MapChunkJob(FunctionWrappingJob):
+    """
+    Job applying a function to each item of a chunk of the items of a :class:`toil.job.MapJob`,
+    returning the list of the results.
+    """
+    def __init__(self, userFunction, items, *args, **kwargs):
+        super().__init__(userFunction, *args, **kwargs)
+        self._items = items
+
+    def run(self, fileStore):
+        userFunction = self._getUserFunction()
+        return [userFunction(item, *self._args, **self._kwargs) for item in self._items]
+
+
+class MapGatherJob(Job):
+    """
+    Job concatenating the results of the chunks of a :class:`toil.job.MapJob`.
+    """
+    def __init__(self, chunkResults, userScript, **requirements):
+        """
+        :param list chunkResults: the promised results of each chunk
+        :param toil.resource.ModuleDescriptor userScript: the module of the mapped function,
+               which is needed to load its results
+        """
+        super().__init__(**requirements)
+        self._chunkResults = chunkResults
+        self._userScript = userScript
+
+    def run(self, fileStore):
+        return [result for results in self._chunkResults for result in results]
+
+    def getUserScript(self):
+        return self._userScript
+
+
 class ServiceJobNode(JobNode):
+    __slots__ = ('startJobStoreID', 'terminateJobStoreID', 'errorJobStoreID')
+
     def __init__(self, jobStoreID, memory, cores, disk, preemptable, startJobStoreID, terminateJobStoreID,
                  errorJobStoreID, unitName, jobName, command, predecessorNumber):
         requirements = dict(memory=memory, cores=cores, disk=disk, preemptable=preemptable)
@@ -12,12 +12,91 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 from __future__ import absolute_import
+import copy
 import logging
+import marshal
+from operator import attrgetter
 
-from toil.job import JobNode
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from toil.job import JobNode, ServiceJobNode
 
 logger = logging.getLogger(__name__)
 
+# The attributes of a JobNode in the order they are stored in an encoded record. The trailing
+# attributes of a ServiceJobNode are appended to these.
+_jobNodeFields = ('unitName', 'displayName', 'jobName', '_cores', '_memory', '_disk',
+                  '_preemptable', 'jobStoreID', 'predecessorNumber', 'command')
+_serviceJobNodeFields = _jobNodeFields + ('startJobStoreID', 'terminateJobStoreID',
+                                          'errorJobStoreID')
+# The attributes a JobGraph adds to those of a JobNode, in the order they are stored. Attributes
+# that hold JobNodes or sets are converted separately, see JobGraph.serialize().
+_jobGraphFields = _jobNodeFields + ('remainingRetryCount', 'filesToDelete', 'logJobStoreFileID',
+                                    'terminateJobStoreID', 'startJobStoreID', 'errorJobStoreID',
+                                    'checkpoint', 'checkpointFilesToDelete', 'chainedJobs')
+_jobGraphFieldSet = frozenset(_jobGraphFields)
+# Attributes that are handled explicitly or deliberately not persisted
+_specialFields = frozenset(('stack', 'services', 'predecessorsFinished', '_config'))
+# Records are written with marshal, which is implemented in C and only handles plain values, so
+# unlike pickle it never imports or instantiates arbitrary classes. Version 4 of its format is the
+# most compact but requires Python 3.4 or newer. Older versions are always accepted when reading.
+# Marshal also preserves the interning of the names, see BaseJob.
+_marshalVersion = min(marshal.version, 4)
+
+
+def _newInstance(cls, fields, values):
+    """
+    Create an instance of the given class without calling its constructor and populate the given
+    attributes from the given values.
+    """
+    obj = cls.__new__(cls)
+    obj.priority = None
+    for field, value in zip(fields, values):
+        setattr(obj, field, value)
+    obj._config = None
+    return obj
+
+
+_getJobNodeFields = attrgetter(*_jobNodeFields)
+_getServiceJobNodeFields = attrgetter(*_serviceJobNodeFields)
+_getJobGraphFields = attrgetter(*_jobGraphFields)
+
+
+def _jobNodeToRecord(jobNode):
+    if type(jobNode) is ServiceJobNode:
+        record = (1,) + _getServiceJobNodeFields(jobNode)
+    elif type(jobNode) is JobNode:
+        record = (0,) + _getJobNodeFields(jobNode)
+    else:
+        raise TypeError("Cannot encode successor of type %s" % type(jobNode))
+    # The priority is rarely set, so it is only appended to the record if it is
+    if jobNode.priority is not None:
+        record += (jobNode.priority,)
+    return record
+
+
+def _jobNodesToRecords(levels):
+    """
+    Convert a list of lists of JobNodes, i.e. a stack of successors or services, to records.
+    """
+    if type(levels) is not list or not all(type(jobs) is list for jobs in levels):
+        raise TypeError("Successors must be stored as a list of lists")
+    return [[_jobNodeToRecord(jobNode) for jobNode in jobs] for jobs in levels]
+
+
+def _jobNodeFromRecord(record):
+    if record[0] == 1:
+        cls, fields = ServiceJobNode, _serviceJobNodeFields
+    else:
+        cls, fields = JobNode, _jobNodeFields
+    jobNode = _newInstance(cls, fields, record[1:])
+    if len(record) > len(fields) + 1:
+        jobNode.priority = record[-1]
+    return jobNode
+
 
 class JobGraph(JobNode):
     """
@@ -26,6 +105,27 @@ class JobGraph(JobNode):
     scripts is persisted separately since it may be much bigger than the state managed by this
     class and should therefore only be held in memory for brief periods of time.
     """
+    # Unlike JobNode, a JobGraph may carry additional attributes, which are persisted along with
+    # it, so it keeps an instance dictionary. It is only allocated if actually used.
+    __slots__ = ('__dict__', 'remainingRetryCount', 'filesToDelete', 'predecessorsFinished',
+                 'stack', 'logJobStoreFileID', 'services', 'terminateJobStoreID',
+                 'startJobStoreID', 'errorJobStoreID', 'checkpoint', 'checkpointFilesToDelete',
+                 'chainedJobs')
+
+    # Whether the job is a checkpoint, see toil.job.Job. It is recorded when the job is created,
+    # so that it is known without loading the job itself. None for jobs that were written without
+    # it.
+    isCheckpoint = None
+
+    # The IDs and sizes of the files the job will read, see toil.job.Job.addInputFiles. They are
+    # recorded when the job is created, so that the worker can start downloading them before
+    # loading the job itself.
+    inputFileIDs = ()
+
+    # The IDs of the successors in the top level of the stack that the worker of this job has
+    # already run, see toil.worker. The leader processes them rather than issue them again.
+    ranSuccessorJobStoreIDs = ()
+
     def __init__(self, command, memory, cores, disk, unitName, jobName, preemptable,
                  jobStoreID,
                  remainingRetryCount,
@@ -40,14 +140,16 @@ class JobGraph(JobNode):
                  logJobStoreFileID=None,
                  checkpoint=None,
                  checkpointFilesToDelete=None,
-                 chainedJobs=None):
+                 chainedJobs=None,
+                 priority=None):
         requirements = {'memory': memory, 'cores': cores, 'disk': disk,
                         'preemptable': preemptable}
         super(JobGraph, self).__init__(command=command,
                                        requirements=requirements,
                                        unitName=unitName, jobName=jobName,
                                        jobStoreID=jobStoreID,
-                                       predecessorNumber=predecessorNumber)
+                                       predecessorNumber=predecessorNumber,
+                                       priority=priority)
 
         # The number of times the job should be retried if it fails This number is reduced by
         # retries until it is zero and then no further retries are made
@@ -100,9 +202,84 @@ class JobGraph(JobNode):
         # this job
         self.chainedJobs = chainedJobs
 
+    # Prefix of a serialized JobGraph. It is followed by a single byte holding the version of the
+    # encoding and then the record itself.
+    encodingMagic = b'TJG'
+    encodingVersion = 1
+
     def __hash__(self):
         return hash(self.jobStoreID)
 
+    def snapshot(self):
+        """
+        Returns a copy of this job graph that later changes to it don't affect, so that it can be
+        written to the job store asynchronously while the worker goes on changing the original.
+        Unlike a deep copy, the copy shares the job nodes in the stack and the services with the
+        original, which are replaced, but never modified, once the job graph is created.
+
+        :rtype: toil.jobGraph.JobGraph
+        """
+        snapshot = copy.copy(self)
+        snapshot.stack = [list(jobs) for jobs in self.stack]
+        snapshot.services = [list(jobs) for jobs in self.services]
+        snapshot.filesToDelete = list(self.filesToDelete)
+        snapshot.predecessorsFinished = set(self.predecessorsFinished)
+        return snapshot
+
+    def serialize(self):
+        """
+        Encode this job graph for storage in a job store. Instead of pickling the object, its
+        attributes are stored positionally as a tuple of plain values, omitting attribute and
+        class names. The result is both smaller and faster to encode and decode than a pickle.
+        Job graphs whose attributes don't fit that layout, e.g. because a successor isn't a plain
+        JobNode, are pickled instead.
+
+        :rtype: bytes
+        """
+        try:
+            # Preserve any attributes that aren't part of the fixed layout, e.g. those of a
+            # subclass, and the priority, which is rarely set
+            extras = {field: value for field, value in getattr(self, '__dict__', {}).items()
+                      if field not in _jobGraphFieldSet and field not in _specialFields}
+            if self.priority is not None:
+                extras['priority'] = self.priority
+            record = (_getJobGraphFields(self)
+                      + (self.predecessorsFinished,
+                         _jobNodesToRecords(self.stack),
+                         _jobNodesToRecords(self.services),
+                         extras))
+            return (self.encodingMagic + bytearray((self.encodingVersion,))
+                    + marshal.dumps(record, _marshalVersion))
+        except (TypeError, ValueError):
+            return pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def deserialize(cls, data):
+        """
+        Decode a job graph serialized with :meth:`serialize`. For backwards compatibility with
+        existing job stores, pickled job graphs are also accepted.
+
+        :param bytes data: the serialized job graph
+        :rtype: toil.jobGraph.JobGraph
+        """
+        if not data.startswith(cls.encodingMagic):
+            return pickle.loads(data)
+        headerSize = len(cls.encodingMagic) + 1
+        version = bytearray(data[headerSize - 1:headerSize])[0]
+        if version > cls.encodingVersion:
+            raise ValueError("Job graph was encoded with version %i of the format, but only "
+                             "versions up to %i are supported" % (version, cls.encodingVersion))
+        record = marshal.loads(data[headerSize:])
+        numFields = len(_jobGraphFields)
+        jobGraph = _newInstance(cls, _jobGraphFields, record)
+        predecessorsFinished, stack, services, extras = record[numFields:]
+        jobGraph.predecessorsFinished = predecessorsFinished
+        jobGraph.stack = [[_jobNodeFromRecord(r) for r in jobs] for jobs in stack]
+        jobGraph.services = [[_jobNodeFromRecord(r) for r in jobs] for jobs in services]
+        for field, value in extras.items():
+            setattr(jobGraph, field, value)
+        return jobGraph
+
     def setupJobAfterFailure(self, config):
         """
         Reduce the remainingRetryCount if greater than zero and set the memory
@@ -192,6 +369,7 @@ class JobGraph(JobNode):
                    remainingRetryCount=tryCount,
                    predecessorNumber=jobNode.predecessorNumber,
                    unitName=jobNode.unitName, jobName=jobNode.jobName,
+                   priority=jobNode.priority,
                    **jobNode._requirements)
 
     def __eq__(self, other):
@@ -545,108 +545,132 @@ class AbstractJobStore(with_metaclass(ABCMeta, object)):
         # Clean up jobs that are in reachable from the root
         for jobGraph in jobGraphsReachableFromRoot.values():
             # jobGraphs here are necessarily in reachable from root.
+            self.cleanJob(jobGraph, getJob=getJob)
 
-            changed = [False]  # This is a flag to indicate the jobGraph state has
-            # changed
+        # Remove any crufty stats/logging files from the previous run
+        self.discardStatsAndLogging()
 
-            # If the job has files to delete delete them.
-            if len(jobGraph.filesToDelete) != 0:
-                # Delete any files that should already be deleted
-                for fileID in jobGraph.filesToDelete:
-                    logger.critical("Removing file in job store: %s that was "
-                                    "marked for deletion but not previously removed" % fileID)
-                    self.deleteFile(fileID)
-                jobGraph.filesToDelete = []
-                changed[0] = True
+        logger.debug("Job store is clean")
+        # TODO: reloading of the rootJob may be redundant here
+        return self.loadRootJob()
 
-            # For a job whose command is already executed, remove jobs from the stack that are
-            # already deleted. This cleans up the case that the jobGraph had successors to run,
-            # but had not been updated to reflect this.
-            if jobGraph.command is None:
-                stackSizeFn = lambda: sum(map(len, jobGraph.stack))
-                startStackSize = stackSizeFn()
-                # Remove deleted jobs
-                jobGraph.stack = [[y for y in x if self.exists(y.jobStoreID)] for x in jobGraph.stack]
-                # Remove empty stuff from the stack
-                jobGraph.stack = [x for x in jobGraph.stack if len(x) > 0]
-                # Check if anything got removed
-                if stackSizeFn() != startStackSize:
-                    changed[0] = True
-
-            # Cleanup any services that have already been finished.
-            # Filter out deleted services and update the flags for services that exist
-            # If there are services then renew
-            # the start and terminate flags if they have been removed
-            def subFlagFile(jobStoreID, jobStoreFileID, flag):
-                if self.fileExists(jobStoreFileID):
-                    return jobStoreFileID
-
-                # Make a new flag
-                newFlag = self.getEmptyFileStoreID(jobStoreID, cleanup=False)
-
-                # Load the jobGraph for the service and initialise the link
-                serviceJobGraph = getJob(jobStoreID)
-
-                if flag == 1:
-                    logger.debug("Recreating a start service flag for job: %s, flag: %s",
-                                 jobStoreID, newFlag)
-                    serviceJobGraph.startJobStoreID = newFlag
-                elif flag == 2:
-                    logger.debug("Recreating a terminate service flag for job: %s, flag: %s",
-                                 jobStoreID, newFlag)
-                    serviceJobGraph.terminateJobStoreID = newFlag
-                else:
-                    logger.debug("Recreating a error service flag for job: %s, flag: %s",
-                                 jobStoreID, newFlag)
-                    assert flag == 3
-                    serviceJobGraph.errorJobStoreID = newFlag
+    def cleanJob(self, jobGraph, getJob=None):
+        """
+        Repair a single job after a restart, as part of :meth:`clean`. Deletes files the job
+        marked for deletion, removes finished successors and services from the job, recreates
+        missing service flag files, resets the job's retry count and removes its log file. The
+        job is written back to the job store if any of that changed it.
+
+        :param toil.jobGraph.JobGraph jobGraph: the job to repair
+        :param getJob: a function returning the JobGraph for a job ID, defaults to :meth:`load`
+        """
+        if getJob is None:
+            getJob = self.load
 
-                # Update the service job on disk
-                self.update(serviceJobGraph)
+        changed = [False]  # This is a flag to indicate the jobGraph state has
+        # changed
 
+        # If the job has files to delete delete them.
+        if len(jobGraph.filesToDelete) != 0:
+            # Delete any files that should already be deleted
+            for fileID in jobGraph.filesToDelete:
+                logger.critical("Removing file in job store: %s that was "
+                                "marked for deletion but not previously removed" % fileID)
+                self.deleteFile(fileID)
+            jobGraph.filesToDelete = []
+            changed[0] = True
+
+        # For a job whose command is already executed, remove jobs from the stack that are
+        # already deleted. This cleans up the case that the jobGraph had successors to run,
+        # but had not been updated to reflect this.
+        if jobGraph.command is None:
+            stackSizeFn = lambda: sum(map(len, jobGraph.stack))
+            startStackSize = stackSizeFn()
+            # Remove deleted jobs
+            jobGraph.stack = [[y for y in x if self.exists(y.jobStoreID)] for x in jobGraph.stack]
+            # Remove empty stuff from the stack
+            jobGraph.stack = [x for x in jobGraph.stack if len(x) > 0]
+            # Check if anything got removed
+            if stackSizeFn() != startStackSize:
                 changed[0] = True
 
-                return newFlag
+        # Cleanup any services that have already been finished.
+        # Filter out deleted services and update the flags for services that exist
+        # If there are services then renew
+        # the start and terminate flags if they have been removed
+        def subFlagFile(jobStoreID, jobStoreFileID, flag):
+            if self.fileExists(jobStoreFileID):
+                return jobStoreFileID
+
+            # Make a new flag
+            newFlag = self.getEmptyFileStoreID(jobStoreID, cleanup=False)
+
+            # Load the jobGraph for the service and initialise the link
+            serviceJobGraph = getJob(jobStoreID)
+
+            if flag == 1:
+                logger.debug("Recreating a start service flag for job: %s, flag: %s",
+                             jobStoreID, newFlag)
+                serviceJobGraph.startJobStoreID = newFlag
+            elif flag == 2:
+                logger.debug("Recreating a terminate service flag for job: %s, flag: %s",
+                             jobStoreID, newFlag)
+                serviceJobGraph.terminateJobStoreID = newFlag
+            else:
+                logger.debug("Recreating a error service flag for job: %s, flag: %s",
+                             jobStoreID, newFlag)
+                assert flag == 3
+                serviceJobGraph.errorJobStoreID = newFlag
+
+            # Update the service job on disk
+            self.update(serviceJobGraph)
 
-            servicesSizeFn = lambda: sum(map(len, jobGraph.services))
-            startServicesSize = servicesSizeFn()
+            changed[0] = True
 
-            def replaceFlagsIfNeeded(serviceJobNode):
-                serviceJobNode.startJobStoreID = subFlagFile(serviceJobNode.jobStoreID, serviceJobNode.startJobStoreID, 1)
-                serviceJobNode.terminateJobStoreID = subFlagFile(serviceJobNode.jobStoreID, serviceJobNode.terminateJobStoreID, 2)
-                serviceJobNode.errorJobStoreID = subFlagFile(serviceJobNode.jobStoreID, serviceJobNode.errorJobStoreID, 3)
+            return newFlag
 
-            # jobGraph.services is a list of lists containing serviceNodes
-            # remove all services that no longer exist
-            services = jobGraph.services
-            jobGraph.services = []
-            for serviceList in services:
-                existingServices = [service for service in serviceList if self.exists(service.jobStoreID)]
-                if existingServices:
-                    jobGraph.services.append(existingServices)
+        servicesSizeFn = lambda: sum(map(len, jobGraph.services))
+        startServicesSize = servicesSizeFn()
 
-            list(map(lambda serviceList: list(map(replaceFlagsIfNeeded, serviceList)), jobGraph.services))
+        def replaceFlagsIfNeeded(serviceJobNode):
+            serviceJobNode.startJobStoreID = subFlagFile(serviceJobNode.jobStoreID, serviceJobNode.startJobStoreID, 1)
+            serviceJobNode.terminateJobStoreID = subFlagFile(serviceJobNode.jobStoreID, serviceJobNode.terminateJobStoreID, 2)
+            serviceJobNode.errorJobStoreID = subFlagFile(serviceJobNode.jobStoreID, serviceJobNode.errorJobStoreID, 3)
 
-            if servicesSizeFn() != startServicesSize:
-                changed[0] = True
+        # jobGraph.services is a list of lists containing serviceNodes
+        # remove all services that no longer exist
+        services = jobGraph.services
+        jobGraph.services = []
+        for serviceList in services:
+            existingServices = [service for service in serviceList if self.exists(service.jobStoreID)]
+            if existingServices:
+                jobGraph.services.append(existingServices)
 
-            # Reset the retry count of the jobGraph
-            if jobGraph.remainingRetryCount != self._defaultTryCount():
-                jobGraph.remainingRetryCount = self._defaultTryCount()
-                changed[0] = True
+        list(map(lambda serviceList: list(map(replaceFlagsIfNeeded, serviceList)), jobGraph.services))
 
-            # This cleans the old log file which may
-            # have been left if the jobGraph is being retried after a jobGraph failure.
-            if jobGraph.logJobStoreFileID != None:
-                self.deleteFile(jobGraph.logJobStoreFileID)
-                jobGraph.logJobStoreFileID = None
-                changed[0] = True
+        if servicesSizeFn() != startServicesSize:
+            changed[0] = True
 
-            if changed[0]:  # Update, but only if a change has occurred
-                logger.critical("Repairing job: %s" % jobGraph.jobStoreID)
-                self.update(jobGraph)
+        # Reset the retry count of the jobGraph
+        if jobGraph.remainingRetryCount != self._defaultTryCount():
+            jobGraph.remainingRetryCount = self._defaultTryCount()
+            changed[0] = True
 
-        # Remove any crufty stats/logging files from the previous run
+        # This cleans the old log file which may
+        # have been left if the jobGraph is being retried after a jobGraph failure.
+        if jobGraph.logJobStoreFileID != None:
+            self.deleteFile(jobGraph.logJobStoreFileID)
+            jobGraph.logJobStoreFileID = None
+            changed[0] = True
+
+        if changed[0]:  # Update, but only if a change has occurred
+            logger.critical("Repairing job: %s" % jobGraph.jobStoreID)
+            self.update(jobGraph)
+
+    def discardStatsAndLogging(self):
+        """
+        Remove any stats and logging messages left behind by a previous run.
+        """
         logger.debug("Discarding old statistics and logs...")
         # We have to manually discard the stream to avoid getting
         # stuck on a blocking write from the job store.
@@ -656,10 +680,6 @@ class AbstractJobStore(with_metaclass(ABCMeta, object)):
                 pass
         self.readStatsAndLogging(discardStream)
 
-        logger.debug("Job store is clean")
-        # TODO: reloading of the rootJob may be redundant here
-        return self.loadRootJob()
-
     ##########################################
     # The following methods deal with creating/loading/updating/writing/checking for the
     # existence of jobs
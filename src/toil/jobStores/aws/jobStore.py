@@ -21,16 +21,11 @@ from builtins import range
 from contextlib import contextmanager, closing
 import logging
 
-try:
-    import cPickle as pickle
-except ImportError:
-    import pickle
-
 import re
 import uuid
 import base64
 import hashlib
-import itertools
+from functools import partial
 import urllib.parse
 import urllib.request, urllib.parse, urllib.error
 
@@ -61,7 +56,8 @@ from toil.jobStores.aws.utils import (SDBHelper,
                                       retry_s3,
                                       bucket_location_to_region,
                                       region_to_bucket_location, copyKeyMultipart,
-                                      uploadFromPath, chunkedFileUpload, fileSizeAndTime)
+                                      uploadFromPath, uploadParts, chunkedFileUpload,
+                                      fileSizeAndTime)
 from toil.jobStores.utils import WritablePipe, ReadablePipe
 from toil.jobGraph import JobGraph
 import toil.lib.encryption as encryption
@@ -73,7 +69,7 @@ class AWSJobStore(AbstractJobStore):
     """
     A job store that uses Amazon's S3 for file storage and SimpleDB for storing job info and
     enforcing strong consistency on the S3 file storage. There will be SDB domains for jobs and
-    files and a versioned S3 bucket for file contents. Job objects are pickled, compressed,
+    files and a versioned S3 bucket for file contents. Job objects are serialized, compressed,
     partitioned into chunks of 1024 bytes and each chunk is stored as a an attribute of the SDB
     item representing the job. UUIDs are used to identify jobs and files.
     """
@@ -250,11 +246,11 @@ class AWSJobStore(AbstractJobStore):
         else:
             binary,_ = SDBHelper.attributesToBinary(item)
             assert binary is not None
-        job = pickle.loads(binary)
+        job = JobGraph.deserialize(binary)
         return job
 
     def _awsJobToItem(self, job):
-        binary = pickle.dumps(job, protocol=pickle.HIGHEST_PROTOCOL)
+        binary = job.serialize()
         if len(binary) > SDBHelper.maxBinarySize(extraReservedChunks=1):
             #Store as an overlarge job in S3
             with self.writeFileStream() as (writable, fileID):
@@ -1025,7 +1021,8 @@ class AWSJobStore(AbstractJobStore):
                 headers = self._s3EncryptionHeaders()
                 self.version = uploadFromPath(localFilePath, partSize=self.outer.partSize,
                                               bucket=self.outer.filesBucket, fileID=bytes(self.fileID),
-                                              headers=headers)
+                                              headers=headers,
+                                              parallelism=self.outer.config.maxParallelUploadParts)
 
         @contextmanager
         def uploadStream(self, multipart=True, allowInlining=True):
@@ -1044,20 +1041,20 @@ class AWSJobStore(AbstractJobStore):
                                 upload = store.filesBucket.initiate_multipart_upload(
                                     key_name=bytes(info.fileID),
                                     headers=headers)
-                        try:
-                            for part_num in itertools.count():
-                                # There must be at least one part, even if the file is empty.
-                                if len(buf) == 0 and part_num > 0:
-                                    break
-                                for attempt in retry_s3():
-                                    with attempt:
-                                        upload.upload_part_from_file(fp=StringIO(buf),
-                                                                     # part numbers are 1-based
-                                                                     part_num=part_num + 1,
-                                                                     headers=headers)
+                        def parts(buf):
+                            # There must be at least one part, even if the file is empty.
+                            while True:
+                                yield None, partial(StringIO, buf)
                                 if len(buf) == 0:
                                     break
                                 buf = readable.read(info.outer.partSize)
+                                if len(buf) == 0:
+                                    break
+
+                        try:
+                            uploadParts(upload, parts(buf),
+                                        parallelism=store.config.maxParallelUploadParts,
+                                        headers=headers)
                         except:
                             with panic(log=log):
                                 for attempt in retry_s3():
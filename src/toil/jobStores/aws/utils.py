@@ -24,17 +24,24 @@ import base64
 import bz2
 import os
 import socket
+import sys
 import logging
 import types
 
 import errno
+from contextlib import closing
+from functools import partial
 from ssl import SSLError
+from threading import Event
 
 # Python 3 compatibility imports
 import itertools
 
 
+from future.utils import raise_
+
 from toil.lib.exceptions import panic
+from toil.lib.threading import ExceptionalThread, BoundedSemaphore
 from six import iteritems
 
 from toil.lib.retry import retry
@@ -191,7 +198,7 @@ def fileSizeAndTime(localFilePath):
     return file_size, file_time
 
 
-def uploadFromPath(localFilePath, partSize, bucket, fileID, headers):
+def uploadFromPath(localFilePath, partSize, bucket, fileID, headers, parallelism=1):
     """
     Uploads a file to s3, using multipart uploading if applicable
 
@@ -200,6 +207,7 @@ def uploadFromPath(localFilePath, partSize, bucket, fileID, headers):
     :param boto.s3.Bucket bucket: the s3 bucket to upload to
     :param str fileID: the name of the file to upload to
     :param headers: http headers to use when uploading - generally used for encryption purposes
+    :param int parallelism: the largest number of parts to upload at the same time
     :return: version of the newly uploaded file
     """
     file_size, file_time = fileSizeAndTime(localFilePath)
@@ -211,8 +219,29 @@ def uploadFromPath(localFilePath, partSize, bucket, fileID, headers):
                 key.set_contents_from_filename(localFilePath, headers=headers)
         version = key.version_id
     else:
-        with open(localFilePath, 'rb') as f:
-            version = chunkedFileUpload(f, bucket, fileID, file_size, headers, partSize)
+        def openPart(start):
+            f = open(localFilePath, 'rb')
+            f.seek(start)
+            return f
+
+        # Each part is read from a file handle of its own, so they can be uploaded in parallel
+        parts = ((min(partSize, file_size - start), partial(openPart, start))
+                 for start in range(0, file_size, partSize))
+        for attempt in retry_s3():
+            with attempt:
+                upload = bucket.initiate_multipart_upload(key_name=bytes(fileID),
+                                                          headers=headers)
+        try:
+            uploadParts(upload, parts, parallelism, headers=headers)
+        except:
+            with panic(log=log):
+                for attempt in retry_s3():
+                    with attempt:
+                        upload.cancel_upload()
+        else:
+            for attempt in retry_s3():
+                with attempt:
+                    version = upload.complete_upload().version_id
     for attempt in retry_s3():
         with attempt:
             key = bucket.get_key(bytes(fileID),
@@ -256,6 +285,71 @@ def chunkedFileUpload(readable, bucket, fileID, file_size, headers=None, partSiz
     return version
 
 
+def uploadParts(upload, parts, parallelism, headers=None):
+    """
+    Uploads the parts of a multipart upload, up to the given number of parts at the same time.
+
+    :param boto.s3.multipart.MultiPartUpload upload: the multipart upload
+    :param parts: the parts of the upload, in order, as pairs of the size of a part, or None to
+           upload to the end of the file-like object, and a function returning a new file-like
+           object positioned at the start of the part. The next part is only taken from the
+           iterable once there is room to upload it, so parts read from a stream are only held
+           in memory while they are uploaded.
+    :param int parallelism: the largest number of parts to upload at the same time
+    :param headers: http headers to use when uploading - generally used for encryption purposes
+    """
+    slots = BoundedSemaphore(parallelism)
+    failed = Event()
+    threads = []
+
+    def uploadPart(partNum, size, openPart):
+        try:
+            for attempt in retry_s3():
+                with attempt:
+                    with closing(openPart()) as fp:
+                        upload.upload_part_from_file(fp=fp, part_num=partNum, size=size,
+                                                     headers=headers)
+        except:
+            failed.set()
+            raise
+        finally:
+            slots.release()
+
+    def waitForParts():
+        # Wait for every part, even after one of them failed, so that the caller doesn't cancel
+        # the upload while parts are still being uploaded
+        failure = None
+        for thread in threads:
+            try:
+                thread.join()
+            except:
+                if failure is None:
+                    failure = sys.exc_info()
+        # Re-raise the exception of the first part that failed
+        if failure is not None:
+            raise_(*failure)
+
+    parts = iter(parts)
+    try:
+        # part numbers are 1-based
+        for partNum in itertools.count(1):
+            # Wait for room before taking the part, which may read it into memory
+            slots.acquire()
+            part = None if failed.is_set() else next(parts, None)
+            if part is None:
+                slots.release()
+                break
+            size, openPart = part
+            thread = ExceptionalThread(target=uploadPart, args=(partNum, size, openPart))
+            thread.start()
+            threads.append(thread)
+    except:
+        with panic(log):
+            waitForParts()
+    else:
+        waitForParts()
+
+
 def copyKeyMultipart(srcBucketName, srcKeyName, srcKeyVersion, dstBucketName, dstKeyName, sseAlgorithm=None, sseKey=None,
                      copySourceSseAlgorithm=None, copySourceSseKey=None):
     """
@@ -29,11 +29,6 @@ from collections import namedtuple
 from contextlib import contextmanager
 from datetime import datetime, timedelta
 
-try:
-    import cPickle as pickle
-except ImportError:
-    import pickle
-
 # Python 3 compatibility imports
 from six.moves.http_client import HTTPException
 from six.moves.configparser import RawConfigParser, NoOptionError
@@ -748,7 +743,7 @@ class AzureJob(JobGraph):
             wholeJobString = chunkedJob[0][1].value
         else:
             wholeJobString = ''.join(item[1].value for item in chunkedJob)
-        return pickle.loads(bz2.decompress(wholeJobString))
+        return cls.deserialize(bz2.decompress(wholeJobString))
 
     def toEntity(self, chunkSize=maxAzureTablePropertySize):
         """
@@ -758,7 +753,7 @@ class AzureJob(JobGraph):
         """
         assert chunkSize <= maxAzureTablePropertySize
         item = {}
-        serializedAndEncodedJob = bz2.compress(pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL))
+        serializedAndEncodedJob = bz2.compress(self.serialize())
         jobChunks = [serializedAndEncodedJob[i:i + chunkSize]
                      for i in range(0, len(serializedAndEncodedJob), chunkSize)]
         for attributeOrder, chunk in enumerate(jobChunks):
@@ -27,12 +27,11 @@ import tempfile
 import stat
 import errno
 import time
-try:
-    import cPickle as pickle
-except ImportError:
-    import pickle
+import threading
+from multiprocessing.pool import ThreadPool
 
 # toil dependencies
+from toil.common import getNodeID
 from toil.fileStores import FileID
 from toil.lib.bioio import absSymPath
 from toil.lib.misc import mkdir_p
@@ -45,6 +44,9 @@ from toil.jobGraph import JobGraph
 
 logger = logging.getLogger( __name__ )
 
+# Serializes the appends of the threads of a process to its log of the job index
+_jobIndexLock = threading.Lock()
+
 
 class FileJobStore(AbstractJobStore):
     """
@@ -68,6 +70,16 @@ class FileJobStore(AbstractJobStore):
     # 10Mb RAM chunks when reading/writing files
     BUFFER_SIZE = 10485760 # 10Mb
 
+    # Maximum number of threads writing the jobs created in a batch
+    batchWriteThreads = 16
+
+    # Number of threads loading jobs when enumerating all jobs
+    jobsLoadThreads = 16
+
+    # A record in a log of the index of the jobs in the store, see _indexJobs()
+    jobIndexRecord = re.compile(r'([+-])(%s[A-Za-z0-9._-]+(?:/[%s])*/%s[A-Za-z0-9_]+)$' %
+                                (JOB_NAME_DIR_PREFIX, validDirs, JOB_DIR_PREFIX))
+
     def __init__(self, path, fanOut=1000):
         """
         :param str path: Path to directory holding the job store
@@ -90,6 +102,13 @@ class FileJobStore(AbstractJobStore):
         self.jobFilesDir = os.path.join(self.jobStoreDir, 'files/for-job')
         # Directory where shared files go
         self.sharedFilesDir = os.path.join(self.jobStoreDir, 'files/shared')
+        # Directory where the logs of the jobs created and deleted go, see _indexJobs()
+        self.jobIndexDir = os.path.join(self.jobStoreDir, 'jobs-index')
+        # Whether the job store has an index of its jobs. Job stores created by older versions
+        # of Toil have none until they are cleaned on restart.
+        self._jobIndexed = False
+        # The ID of the process and the path of the log it appends to the index, see _indexJobs()
+        self._jobIndexLog = None
 
         self.fanOut = fanOut
 
@@ -111,12 +130,15 @@ class FileJobStore(AbstractJobStore):
         mkdir_p(self.filesDir)
         mkdir_p(self.jobFilesDir)
         mkdir_p(self.sharedFilesDir)
+        mkdir_p(self.jobIndexDir)
+        self._jobIndexed = True
         self.linkImports = config.linkImports
         super(FileJobStore, self).initialize(config)
 
     def resume(self):
         if not os.path.isdir(self.jobStoreDir):
             raise NoSuchJobStoreException(self.jobStoreDir)
+        self._jobIndexed = os.path.isdir(self.jobIndexDir)
         super(FileJobStore, self).resume()
 
     def robust_rmtree(self, path, max_retries=3):
@@ -166,7 +188,7 @@ class FileJobStore(AbstractJobStore):
         # Make a unique temp directory under a directory for this job name,
         # possibly sprayed across multiple levels of subdirectories.
         absJobDir = tempfile.mkdtemp(prefix=self.JOB_DIR_PREFIX,
-                                     dir=self._getArbitraryJobsDirForName(usefulFilename))
+                                     dir=self._getJobsDirForName(usefulFilename))
         # Make the job to save
         job = JobGraph.fromJobNode(jobNode, jobStoreID=self._getJobIdFromDir(absJobDir),
                                    tryCount=self._defaultTryCount())
@@ -174,17 +196,42 @@ class FileJobStore(AbstractJobStore):
             # Save it later
             self._batchedJobGraphs.append(job)
         else:
-            # Save it now
+            # Save it now. The job is indexed first so that it can't exist without being listed.
+            self._indexJobs(created=[job.jobStoreID])
             self.update(job)
         return job
 
     @contextmanager
     def batch(self):
         self._batchedJobGraphs = []
+        self._batchedJobDirs = {}
         yield
-        for jobGraph in self._batchedJobGraphs:
-            self.update(jobGraph)
+        self._indexJobs(created=[job.jobStoreID for job in self._batchedJobGraphs])
+        self._updateAll(self._batchedJobGraphs)
         self._batchedJobGraphs = None
+        self._batchedJobDirs = None
+
+    def _updateAll(self, jobs):
+        """
+        Write the given jobs as a group. The jobs are all serialised first, and then their job
+        files are written on a pool of threads, so that the round trips to the file system,
+        which dominate on network file systems, overlap. Each job file is written atomically,
+        just like when the job is written on its own.
+
+        :param list[toil.jobGraph.JobGraph] jobs: the jobs to write
+        """
+        jobFiles = [(job.jobStoreID, job.serialize()) for job in jobs]
+        if len(jobFiles) < 2:
+            for jobStoreID, data in jobFiles:
+                self._writeJobFile(jobStoreID, data)
+        else:
+            pool = ThreadPool(min(self.batchWriteThreads, len(jobFiles)))
+            try:
+                # Re-raises the first failure, if any
+                pool.map(lambda jobFile: self._writeJobFile(*jobFile), jobFiles)
+            finally:
+                pool.close()
+                pool.join()
 
     def waitForExists(self, jobStoreID, maxTries=35, sleepTime=1):
         """Spin-wait and block for a file to appear before returning False if it does not.
@@ -231,10 +278,18 @@ class FileJobStore(AbstractJobStore):
 
     def load(self, jobStoreID):
         self._checkJobStoreId(jobStoreID)
+        return self._loadJob(jobStoreID)
+
+    def _loadJob(self, jobStoreID):
+        """
+        Load the job with the given ID without checking whether it exists first.
+
+        :raise IOError: if the job file does not exist
+        """
         # Load a valid version of the job
         jobFile = self._getJobFileName(jobStoreID)
         with open(jobFile, 'rb') as fileHandle:
-            job = pickle.load(fileHandle)
+            job = JobGraph.deserialize(fileHandle.read())
         # The following cleans up any issues resulting from the failure of the
         # job during writing by the batch system.
         if os.path.isfile(jobFile + ".new"):
@@ -244,14 +299,24 @@ class FileJobStore(AbstractJobStore):
         return job
 
     def update(self, job):
+        self._writeJobFile(job.jobStoreID, job.serialize())
+
+    def _writeJobFile(self, jobStoreID, data):
+        """
+        Atomically write the given serialised job to the job file of the given job.
+
+        :param str jobStoreID: the ID of the job
+        :param bytes data: the serialised job
+        """
         # The job is serialised to a file suffixed by ".new"
         # The file is then moved to its correct path.
         # Atomicity guarantees use the fact the underlying file systems "move"
         # function is atomic.
-        with open(self._getJobFileName(job.jobStoreID) + ".new", 'wb') as f:
-            pickle.dump(job, f)
+        jobFile = self._getJobFileName(jobStoreID)
+        with open(jobFile + ".new", 'wb') as f:
+            f.write(data)
         # This should be atomic for the file system
-        os.rename(self._getJobFileName(job.jobStoreID) + ".new", self._getJobFileName(job.jobStoreID))
+        os.rename(jobFile + ".new", jobFile)
 
     def delete(self, jobStoreID):
         # The jobStoreID is the relative path to the directory containing the job,
@@ -262,22 +327,179 @@ class FileJobStore(AbstractJobStore):
             self.robust_rmtree(self._getJobFilesCleanupDir(jobStoreID))
             # Remove the job's directory itself.
             self.robust_rmtree(self._getJobDirFromId(jobStoreID))
+            self._indexJobs(deleted=[jobStoreID])
 
     def jobs(self):
-        # Walk through list of temporary directories searching for jobs.
-        # Jobs are files that start with 'job'.
-        # Note that this also catches jobWhatever.new which exists if an update
-        # is in progress.
+        # Every job is read from its own file, so load them on a pool of threads while the
+        # directories are still being walked.
+        pool = ThreadPool(self.jobsLoadThreads)
+        try:
+            for job in pool.imap_unordered(self._loadJobIfExists, self._jobIDs(), chunksize=16):
+                if job is not None:
+                    yield job
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def clean(self, jobCache=None):
+        rootJobGraph = super(FileJobStore, self).clean(jobCache=jobCache)
+        # No worker is running, so the index can be rewritten
+        jobStoreIDs = self._readJobIndex() if self._jobIndexed else None
+        if jobStoreIDs is not None:
+            self._compactJobIndex(jobStoreIDs)
+        else:
+            logger.info('Indexing the jobs of the job store.')
+            self._buildJobIndex()
+        return rootJobGraph
+
+    def _jobIDs(self):
+        """
+        List the IDs of the jobs in the store, from the index if there is one. Some of the jobs
+        may not have a job file.
+
+        :rtype: Iterator[str]
+        """
+        jobStoreIDs = self._readJobIndex() if self._jobIndexed else None
+        if jobStoreIDs is None:
+            jobStoreIDs = self._walkJobIDs()
+        for jobStoreID in jobStoreIDs:
+            yield jobStoreID
+
+    def _walkJobIDs(self):
+        """
+        Walk through the list of temporary directories searching for job instance directories.
+
+        :rtype: Iterator[str]
+        """
         for tempDir in self._jobDirectories():
             for i in os.listdir(tempDir):
-                logger.warning('Job Dir: %s' % i)
                 if i.startswith(self.JOB_DIR_PREFIX):
-                    # This is a job instance directory 
-                    try:
-                        yield self.load(self._getJobIdFromDir(os.path.join(tempDir, i)))
-                    except NoSuchJobException:
-                        # An orphaned job may leave an empty or incomplete job file which we can safely ignore
-                        pass
+                    # This is a job instance directory
+                    yield self._getJobIdFromDir(os.path.join(tempDir, i))
+
+    def _loadJobIfExists(self, jobStoreID):
+        """
+        Load the job with the given ID, or return None if it has no job file.
+
+        :rtype: toil.jobGraph.JobGraph|None
+        """
+        try:
+            return self._loadJob(jobStoreID)
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                # An orphaned job may leave a directory without a job file which we can safely
+                # ignore. There is no point in waiting for it to appear like load() does.
+                return None
+            else:
+                raise
+
+    def _indexJobs(self, created=(), deleted=()):
+        """
+        Record the creation or deletion of the given jobs in the index of the jobs in the store,
+        which lets jobs() list them without walking the job directories, which is slow on
+        network file systems.
+
+        The index is a set of append-only logs, one for each process that created or deleted
+        jobs, so that no two processes append to the same log, which isn't atomic on NFS. Each
+        record is a line holding a '+' for a created job or a '-' for a deleted one, followed by
+        the job's ID. The logs are compacted by clean().
+
+        :param list[str] created: the IDs of the jobs created, to be recorded before their job
+               files are written
+        :param list[str] deleted: the IDs of the jobs deleted, to be recorded after their job
+               directories were removed
+        """
+        if not self._jobIndexed:
+            return
+        records = [sign + jobStoreID + '\n'
+                   for sign, jobStoreIDs in (('+', created), ('-', deleted))
+                   for jobStoreID in jobStoreIDs]
+        if not records:
+            return
+        data = ''.join(records).encode('utf-8')
+        # The threads of a process share its log
+        with _jobIndexLock:
+            fd = os.open(self._getJobIndexLog(), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                while data:
+                    data = data[os.write(fd, data):]
+            finally:
+                os.close(fd)
+
+    def _getJobIndexLog(self):
+        """
+        :return: the path of the log of the job index the current process appends its records to
+        :rtype: str
+        """
+        pid = os.getpid()
+        if self._jobIndexLog is None or self._jobIndexLog[0] != pid:
+            logName = '%s-%i.log' % (getNodeID(), pid)
+            self._jobIndexLog = pid, os.path.join(self.jobIndexDir, logName)
+        return self._jobIndexLog[1]
+
+    def _readJobIndex(self):
+        """
+        Replay the logs of the job index. A job is in the store if it was recorded as created
+        more often than as deleted, whatever the order of the logs.
+
+        :return: the IDs of the jobs in the store, or None if the index holds a malformed
+                 record and can't be trusted
+        :rtype: set[str]|None
+        """
+        counts = {}
+        for logName in os.listdir(self.jobIndexDir):
+            if not logName.endswith('.log'):
+                continue
+            with open(os.path.join(self.jobIndexDir, logName), 'rb') as f:
+                lines = f.read().decode('utf-8').split('\n')
+            # Skip the last line, which is empty unless a write is in progress
+            for line in lines[:-1]:
+                match = self.jobIndexRecord.match(line)
+                if match is None:
+                    logger.warning('Ignoring the index of the jobs in the store, which holds the '
+                                   'malformed record %r.', line)
+                    return None
+                sign, jobStoreID = match.groups()
+                counts[jobStoreID] = counts.get(jobStoreID, 0) + (1 if sign == '+' else -1)
+        return set(jobStoreID for jobStoreID, count in counts.items() if count > 0)
+
+    def _compactJobIndex(self, jobStoreIDs):
+        """
+        Replace the logs of the job index with one holding a single record for each job in the
+        store. No other process may modify the index meanwhile.
+
+        :param set[str] jobStoreIDs: the IDs of the jobs in the store, see _readJobIndex()
+        """
+        logPath = self._getJobIndexLog()
+        self._writeJobIndexLog(logPath, jobStoreIDs)
+        for logName in os.listdir(self.jobIndexDir):
+            if os.path.join(self.jobIndexDir, logName) != logPath:
+                os.unlink(os.path.join(self.jobIndexDir, logName))
+
+    def _buildJobIndex(self):
+        """
+        Create the index of the jobs in the store by walking its job directories, replacing the
+        index there is, if any. No other process may create or delete jobs meanwhile.
+        """
+        jobStoreIDs = set(self._walkJobIDs())
+        # Build the index next to where it goes so an interrupted build leaves no partial index
+        tempDir = tempfile.mkdtemp(prefix='jobs-index', dir=self.jobStoreDir)
+        logName = os.path.basename(self._getJobIndexLog())
+        self._writeJobIndexLog(os.path.join(tempDir, logName), jobStoreIDs)
+        if os.path.isdir(self.jobIndexDir):
+            shutil.rmtree(self.jobIndexDir)
+        os.rename(tempDir, self.jobIndexDir)
+        self._jobIndexed = True
+
+    def _writeJobIndexLog(self, logPath, jobStoreIDs):
+        """
+        Atomically replace the given log of the job index with one recording the creation of the
+        given jobs.
+        """
+        records = ''.join('+' + jobStoreID + '\n' for jobStoreID in sorted(jobStoreIDs))
+        with open(logPath + '.new', 'wb') as f:
+            f.write(records.encode('utf-8'))
+        os.rename(logPath + '.new', logPath)
 
     ##########################################
     # Functions that deal with temporary files associated with jobs
@@ -708,6 +930,26 @@ class FileJobStore(AbstractJobStore):
             # Just go in the root
             return self._getDynamicSprayDir(os.path.join(self.jobsDir, self.JOB_NAME_DIR_PREFIX + jobNameSlug))
 
+    def _getJobsDirForName(self, jobNameSlug):
+        """
+        Like _getArbitraryJobsDirForName() but while a batch is active, jobs of the same name are
+        put into the same directory until it is full, instead of listing the directories in the
+        hierarchy for every single job.
+
+        :param str jobNameSlug: A partial filename derived from the job name.
+
+        :rtype : string, path to temporary directory in which to place files/directories.
+        """
+        batchedJobDirs = getattr(self, '_batchedJobDirs', None)
+        if batchedJobDirs is None:
+            return self._getArbitraryJobsDirForName(jobNameSlug)
+        entry = batchedJobDirs.get(jobNameSlug)
+        if entry is None or entry[1] >= self.fanOut:
+            tempDir = self._getArbitraryJobsDirForName(jobNameSlug)
+            entry = batchedJobDirs[jobNameSlug] = [tempDir, len(os.listdir(tempDir))]
+        entry[1] += 1
+        return entry[0]
+
     def _getArbitraryStatsDir(self):
         """
         Gets a temporary directory in a multi-level hierarchy in self.statsDir.
@@ -24,7 +24,6 @@ import uuid
 import logging
 import time
 import os
-from toil import pickle
 from toil.lib.retry import retry
 from google.cloud import storage, exceptions
 from google.api_core.exceptions import GoogleAPICallError, InternalServerError, ServiceUnavailable
@@ -180,7 +179,7 @@ class GoogleJobStore(AbstractJobStore):
         if hasattr(self, "_batchedJobGraphs") and self._batchedJobGraphs is not None:
             self._batchedJobGraphs.append(job)
         else:
-            self._writeString(jobStoreID, pickle.dumps(job, protocol=pickle.HIGHEST_PROTOCOL))  # UPDATE: bz2.compress(
+            self._writeString(jobStoreID, job.serialize())  # UPDATE: bz2.compress(
         return job
 
     def _newJobID(self):
@@ -205,10 +204,10 @@ class GoogleJobStore(AbstractJobStore):
             jobString = self._readContents(jobStoreID)
         except NoSuchFileException:
             raise NoSuchJobException(jobStoreID)
-        return pickle.loads(jobString)  # UPDATE bz2.decompress(
+        return JobGraph.deserialize(jobString)  # UPDATE bz2.decompress(
 
     def update(self, job):
-        self._writeString(job.jobStoreID, pickle.dumps(job, protocol=pickle.HIGHEST_PROTOCOL), update=True)
+        self._writeString(job.jobStoreID, job.serialize(), update=True)
 
     @googleRetry
     def delete(self, jobStoreID):
@@ -0,0 +1,245 @@
+# Copyright (C) 2015-2019 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# python 2/3 compatibility
+from __future__ import absolute_import
+
+# standard library
+from contextlib import contextmanager
+from io import BytesIO
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+
+# toil dependencies
+from toil.jobStores.abstractJobStore import NoSuchJobException, NoSuchJobStoreException
+from toil.jobStores.fileJobStore import FileJobStore
+from toil.jobGraph import JobGraph
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteJobStore(FileJobStore):
+    """
+    A job store that keeps job records as well as stats and logging messages in a single SQLite
+    database file inside the job store directory. The contents of files are stored on disk, just
+    like in the FileJobStore. Every update to a job is a transaction and enumerating the jobs is a
+    single scan of an index, so unlike the FileJobStore this job store doesn't need to list and
+    stat a directory tree holding one file per job.
+
+    Concurrent access from multiple processes is coordinated by SQLite's file locks. To be
+    compatible with distributed batch systems, the job store must therefore be located on a file
+    system that is shared by all worker nodes and implements POSIX advisory locking correctly.
+    """
+
+    # The name of the database file in the job store directory
+    databaseFileName = 'jobStore.sqlite'
+
+    # The number of seconds to wait for a lock on the database held by another process
+    lockTimeout = 600
+
+    # Number of job records to fetch per query when enumerating all jobs
+    jobsPageSize = 1000
+
+    schema = """
+        CREATE TABLE jobs (
+            id TEXT PRIMARY KEY NOT NULL,
+            record BLOB NOT NULL);
+        CREATE TABLE stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            data BLOB NOT NULL,
+            read INTEGER NOT NULL DEFAULT 0);
+        CREATE INDEX statsByRead ON stats (read);
+        """
+
+    def __init__(self, path, fanOut=1000):
+        """
+        :param str path: Path to directory holding the job store
+        :param int fanOut: Number of items to have in a directory before making
+                           subdirectories
+        """
+        super(SQLiteJobStore, self).__init__(path, fanOut=fanOut)
+        self.databasePath = os.path.join(self.jobStoreDir, self.databaseFileName)
+        # SQLite connections may not be shared between threads, so each thread gets its own
+        self._connections = threading.local()
+
+    def __repr__(self):
+        return 'SQLiteJobStore({})'.format(self.jobStoreDir)
+
+    def initialize(self, config):
+        super(SQLiteJobStore, self).initialize(config)
+        self._connection().executescript(self.schema)
+
+    def resume(self):
+        if not os.path.isfile(self.databasePath):
+            raise NoSuchJobStoreException(self.jobStoreDir)
+        super(SQLiteJobStore, self).resume()
+
+    def destroy(self):
+        self._closeConnection()
+        super(SQLiteJobStore, self).destroy()
+
+    ##########################################
+    # The following methods deal with creating/loading/updating/writing/checking for the
+    # existence of jobs
+    ##########################################
+
+    def create(self, jobNode):
+        job = JobGraph.fromJobNode(jobNode, jobStoreID=self._newJobID(jobNode.jobName),
+                                   tryCount=self._defaultTryCount())
+        if getattr(self, '_batchedJobGraphs', None) is not None:
+            # Save it later
+            self._batchedJobGraphs.append(job)
+        else:
+            # Save it now
+            self.update(job)
+        return job
+
+    @contextmanager
+    def batch(self):
+        self._batchedJobGraphs = []
+        yield
+        # Write all jobs created in the batch in a single transaction
+        with self._transaction() as connection:
+            connection.executemany('INSERT OR REPLACE INTO jobs (id, record) VALUES (?, ?)',
+                                   [self._jobToRow(job) for job in self._batchedJobGraphs])
+        self._batchedJobGraphs = None
+
+    def waitForExists(self, jobStoreID, maxTries=35, sleepTime=1):
+        # All processes see the same state of the database, there is nothing to wait for.
+        return self.exists(jobStoreID)
+
+    def exists(self, jobStoreID):
+        cursor = self._connection().execute('SELECT 1 FROM jobs WHERE id = ?', (jobStoreID,))
+        return cursor.fetchone() is not None
+
+    def load(self, jobStoreID):
+        cursor = self._connection().execute('SELECT record FROM jobs WHERE id = ?', (jobStoreID,))
+        row = cursor.fetchone()
+        if row is None:
+            raise NoSuchJobException(jobStoreID)
+        return JobGraph.deserialize(bytes(row[0]))
+
+    def update(self, job):
+        # Every statement outside of an explicit transaction is atomic by itself
+        self._connection().execute('INSERT OR REPLACE INTO jobs (id, record) VALUES (?, ?)',
+                                   self._jobToRow(job))
+
+    def delete(self, jobStoreID):
+        # Remove the job-associated files in need of cleanup first so a failure leaves the job
+        # behind to be deleted again.
+        self.robust_rmtree(self._getJobFilesCleanupDir(jobStoreID))
+        self._connection().execute('DELETE FROM jobs WHERE id = ?', (jobStoreID,))
+
+    def jobs(self):
+        # Page through the jobs in the order of the primary key index instead of keeping a query
+        # open, so that the caller is free to modify jobs while iterating.
+        lastID = ''
+        while True:
+            rows = self._connection().execute(
+                'SELECT id, record FROM jobs WHERE id > ? ORDER BY id LIMIT ?',
+                (lastID, self.jobsPageSize)).fetchall()
+            for jobStoreID, record in rows:
+                yield JobGraph.deserialize(bytes(record))
+            if len(rows) < self.jobsPageSize:
+                break
+            lastID = rows[-1][0]
+
+    ##########################################
+    # The following methods deal with stats and logging messages
+    ##########################################
+
+    def writeStatsAndLogging(self, statsAndLoggingString):
+        if not isinstance(statsAndLoggingString, bytes):
+            statsAndLoggingString = statsAndLoggingString.encode('utf-8')
+        self._connection().execute('INSERT INTO stats (data) VALUES (?)',
+                                   (sqlite3.Binary(statsAndLoggingString),))
+
+    def readStatsAndLogging(self, callback, readAll=False):
+        connection = self._connection()
+        if readAll:
+            rows = connection.execute('SELECT id, data FROM stats ORDER BY id').fetchall()
+        else:
+            rows = connection.execute('SELECT id, data FROM stats WHERE read = 0 '
+                                      'ORDER BY id').fetchall()
+        for _, data in rows:
+            callback(BytesIO(bytes(data)))
+        # Mark the messages as read
+        with self._transaction() as connection:
+            connection.executemany('UPDATE stats SET read = 1 WHERE id = ?',
+                                   [(statsID,) for statsID, _ in rows])
+        return len(rows)
+
+    ##########################################
+    # Private methods
+    ##########################################
+
+    def _newJobID(self, jobName):
+        """
+        Make a new, unique job ID. Like in the FileJobStore, job-associated files are stored in a
+        directory named after the job ID, so the ID groups the jobs by name.
+
+        :param str jobName: the name of the job
+        :rtype: str
+        """
+        return os.path.join(self.JOB_NAME_DIR_PREFIX + self._makeStringFilenameSafe(jobName),
+                            self.JOB_DIR_PREFIX + uuid.uuid4().hex)
+
+    @staticmethod
+    def _jobToRow(job):
+        return job.jobStoreID, sqlite3.Binary(job.serialize())
+
+    def _connection(self):
+        """
+        Return the connection to the database for the current thread, opening it if necessary.
+        Connections are not inherited by forked processes.
+
+        :rtype: sqlite3.Connection
+        """
+        connection = getattr(self._connections, 'connection', None)
+        if connection is None or self._connections.pid != os.getpid():
+            # Disable the implicit transactions of the sqlite3 module, see _transaction()
+            connection = sqlite3.connect(self.databasePath, timeout=self.lockTimeout,
+                                         isolation_level=None)
+            self._connections.connection = connection
+            self._connections.pid = os.getpid()
+        return connection
+
+    def _closeConnection(self):
+        connection = getattr(self._connections, 'connection', None)
+        if connection is not None and self._connections.pid == os.getpid():
+            connection.close()
+        self._connections.connection = None
+
+    @contextmanager
+    def _transaction(self):
+        """
+        A context manager that runs the enclosed statements in a single transaction, which is
+        committed if the context exits normally and rolled back otherwise. The transaction takes
+        the write lock on the database up front, so that concurrent writers wait for each other
+        instead of failing to upgrade their locks.
+
+        :rtype: sqlite3.Connection
+        """
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except:
+            connection.execute('ROLLBACK')
+            raise
+        else:
+            connection.execute('COMMIT')
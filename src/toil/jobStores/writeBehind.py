@@ -0,0 +1,284 @@
+# Copyright (C) 2015-2019 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+
+from builtins import object
+from collections import OrderedDict
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+import logging
+import sys
+import threading
+
+from future.utils import raise_
+from six import iteritems
+
+from toil.jobGraph import JobGraph
+from toil.jobStores.abstractJobStore import NoSuchJobException
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindJobStore(object):
+    """
+    A proxy in front of a job store that lets the leader update job records without waiting for
+    the job store, read the records of many jobs at once and keep the records it has read or
+    written in a cache. All other methods are passed through to the job store unchanged.
+
+    Updates are queued and written by a pool of threads. The guarantees are:
+
+    - Updates of the same job are written in the order they were made. An update that is still
+      queued when the job is updated again is replaced by the newer one, so only the latest
+      record of a job is guaranteed to be written.
+
+    - Updates of different jobs may be written in any order.
+
+    - Reads through the proxy see queued updates: load() returns the latest record passed to
+      update() and exists() is true for a job with a queued update. Other processes, such as
+      workers, only see an update once it has been written, so a job must be passed to
+      release() before it is handed to a worker.
+
+    - delete() waits for queued updates of the job to be written first.
+
+    - At most maxPendingUpdates jobs can have updates queued or being written. Beyond that,
+      update() blocks until the job store catches up.
+
+    If writing an update fails, the exception is raised by the next call to update() or flush().
+
+    The records of up to cacheSize jobs that were loaded or updated through the proxy are kept,
+    and the least recently used ones are evicted beyond that. A cached record is only valid as
+    long as no other process changes the job, which is only the case until the job is handed to
+    a worker. That is why jobs must be passed to release() instead of flush() before they are
+    issued, so their record is reloaded once the worker is done with it. Since workers may also
+    delete other jobs, exists() always asks the job store unless the job has a queued update or
+    was prefetched.
+    """
+
+    # Number of threads writing updates
+    updateThreads = 8
+
+    # Number of threads loading jobs in prefetch()
+    loadThreads = 16
+
+    # Number of jobs with updates queued or being written before update() blocks
+    maxPendingUpdates = 1000
+
+    def __init__(self, jobStore, cacheSize=10000):
+        """
+        :param toil.jobStores.abstractJobStore.AbstractJobStore jobStore: the job store to write to
+        :param int cacheSize: the number of job records to cache, 0 disables the cache
+        """
+        self.jobStore = jobStore
+        self.cacheSize = cacheSize
+        self._updatePool = ThreadPool(self.updateThreads)
+        self._loadPool = None
+        self._lock = threading.Lock()
+        self._updated = threading.Condition(self._lock)
+        # The latest queued record of each job, by job ID
+        self._pendingUpdates = {}
+        # The IDs of the jobs whose record is being written
+        self._writing = set()
+        # The exc_info of the first update that failed
+        self._error = None
+        # The serialized records of the cached jobs by job ID, least recently used first
+        self._cache = OrderedDict()
+        # The records loaded by prefetch() and not yet returned by load(), None for jobs that
+        # don't exist, by job ID
+        self._prefetched = {}
+
+    def __getattr__(self, name):
+        return getattr(self.jobStore, name)
+
+    def __repr__(self):
+        return 'WriteBehindJobStore(%r)' % self.jobStore
+
+    def update(self, job):
+        """
+        Queue the given job record to be written to the job store.
+
+        :param toil.jobGraph.JobGraph job:
+        """
+        # Copy the record, the caller is free to modify the job once this returns
+        serializedRecord = job.serialize()
+        record = JobGraph.deserialize(serializedRecord)
+        jobStoreID = job.jobStoreID
+        with self._lock:
+            self._raiseError()
+            self._prefetched.pop(jobStoreID, None)
+            self._cacheRecord(jobStoreID, serializedRecord)
+            if jobStoreID in self._pendingUpdates:
+                # Coalesce with the update that has yet to be written
+                self._pendingUpdates[jobStoreID] = record
+                return
+            while len(self._pendingUpdates) + len(self._writing) >= self.maxPendingUpdates:
+                self._updated.wait()
+            self._pendingUpdates[jobStoreID] = record
+            if jobStoreID not in self._writing:
+                # Otherwise the thread writing the previous update will schedule this one
+                self._updatePool.apply_async(self._write, (jobStoreID,))
+
+    def load(self, jobStoreID):
+        with self._lock:
+            if jobStoreID in self._pendingUpdates:
+                return JobGraph.deserialize(self._pendingUpdates[jobStoreID].serialize())
+            if jobStoreID in self._prefetched:
+                job = self._prefetched.pop(jobStoreID)
+                if job is None:
+                    raise NoSuchJobException(jobStoreID)
+            else:
+                serializedRecord = self._cache.pop(jobStoreID, None)
+                if serializedRecord is not None:
+                    # Move the record to the most recently used end
+                    self._cache[jobStoreID] = serializedRecord
+                    return JobGraph.deserialize(serializedRecord)
+                job = None
+        if job is None:
+            job = self.jobStore.load(jobStoreID)
+        with self._lock:
+            if jobStoreID not in self._pendingUpdates:
+                self._cacheRecord(jobStoreID, job.serialize())
+        return job
+
+    def exists(self, jobStoreID):
+        with self._lock:
+            if jobStoreID in self._pendingUpdates:
+                return True
+            if jobStoreID in self._prefetched:
+                return self._prefetched[jobStoreID] is not None
+        # Not answered from the cache, a worker may delete jobs other than the one it was issued
+        # for, e.g. the subtree of a restarted checkpoint
+        return self.jobStore.exists(jobStoreID)
+
+    def delete(self, jobStoreID):
+        self.release(jobStoreID)
+        self.jobStore.delete(jobStoreID)
+
+    def release(self, jobStoreID):
+        """
+        Wait for the queued updates of the given job to be written and remove the job from the
+        cache. Must be called before the job is changed by another process, i.e. issued.
+
+        :param str jobStoreID: the ID of the job
+        """
+        self.flush(jobStoreID)
+        with self._lock:
+            self._cache.pop(jobStoreID, None)
+            self._prefetched.pop(jobStoreID, None)
+
+    @contextmanager
+    def prefetch(self, jobStoreIDs, records=None):
+        """
+        A context manager that loads the given jobs from the job store in parallel. Within the
+        context, exists() and load() answer from the loaded records, as long as the jobs aren't
+        changed by other processes in the meantime. Each prefetched record is returned by load()
+        only once, and then cached like any other record loaded.
+
+        :param list[str] jobStoreIDs: the IDs of the jobs to load
+
+        :param dict[str,bytes] records: the serialized records of jobs that are already known and
+               need not be loaded, by job ID, e.g. as reported by the workers that ran the jobs.
+               An empty record means the job doesn't exist anymore.
+        """
+        records = records or {}
+        jobStoreIDs = [jobStoreID for jobStoreID in jobStoreIDs if jobStoreID not in records]
+        if len(jobStoreIDs) > 1:
+            if self._loadPool is None:
+                self._loadPool = ThreadPool(self.loadThreads)
+            jobs = self._loadPool.map(self._loadIfExists, jobStoreIDs)
+        else:
+            # Not worth going through the pool, load() will get the job
+            jobStoreIDs, jobs = [], []
+        jobs = list(zip(jobStoreIDs, jobs))
+        jobs.extend((jobStoreID, JobGraph.deserialize(record) if record else None)
+                    for jobStoreID, record in iteritems(records))
+        if jobs:
+            with self._lock:
+                for jobStoreID, job in jobs:
+                    if jobStoreID not in self._pendingUpdates:
+                        self._prefetched[jobStoreID] = job
+                        self._cache.pop(jobStoreID, None)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._prefetched.clear()
+
+    def flush(self, jobStoreID=None):
+        """
+        Wait for the queued updates of the given job, or of all jobs, to be written.
+
+        :param str jobStoreID: the ID of the job to wait for, or None to wait for all jobs
+        """
+        with self._lock:
+            if jobStoreID is None:
+                while self._pendingUpdates or self._writing:
+                    self._updated.wait()
+            else:
+                while jobStoreID in self._pendingUpdates or jobStoreID in self._writing:
+                    self._updated.wait()
+            self._raiseError()
+
+    def shutdown(self):
+        """
+        Write all queued updates and stop the threads.
+        """
+        try:
+            self.flush()
+        finally:
+            self._updatePool.close()
+            self._updatePool.join()
+            if self._loadPool is not None:
+                self._loadPool.close()
+                self._loadPool.join()
+
+    def _loadIfExists(self, jobStoreID):
+        try:
+            return self.jobStore.load(jobStoreID)
+        except NoSuchJobException:
+            return None
+
+    def _write(self, jobStoreID):
+        with self._lock:
+            job = self._pendingUpdates.pop(jobStoreID)
+            self._writing.add(jobStoreID)
+        try:
+            self.jobStore.update(job)
+        except:
+            logger.exception('Failed to update job %s.', jobStoreID)
+            with self._lock:
+                if self._error is None:
+                    self._error = sys.exc_info()
+        finally:
+            with self._lock:
+                self._writing.remove(jobStoreID)
+                if jobStoreID in self._pendingUpdates:
+                    # The job was updated again while it was being written
+                    self._updatePool.apply_async(self._write, (jobStoreID,))
+                self._updated.notify_all()
+
+    def _cacheRecord(self, jobStoreID, serializedRecord):
+        # Must be called with the lock held
+        if self.cacheSize > 0:
+            self._cache.pop(jobStoreID, None)
+            self._cache[jobStoreID] = serializedRecord
+            while len(self._cache) > self.cacheSize:
+                # Evict the least recently used record
+                self._cache.popitem(last=False)
+
+    def _raiseError(self):
+        # Must be called with the lock held
+        if self._error is not None:
+            type, value, traceback = self._error
+            self._error = None
+            raise_(type, value, traceback)
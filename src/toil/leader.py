@@ -27,8 +27,12 @@ import logging
 import time
 import os
 import glob
+import uuid
+
+from six import itervalues
 
 from toil.lib.humanize import bytes2human
+from toil import pickle
 from toil import resolveEntryPoint
 try:
     from toil.cwl.cwltoil import CWL_INTERNAL_JOBS
@@ -36,8 +40,10 @@ except ImportError:
     # CWL extra not installed
     CWL_INTERNAL_JOBS = ()
 from toil.jobStores.abstractJobStore import NoSuchJobException
+from toil.jobStores.writeBehind import WriteBehindJobStore
 from toil.lib.throttle import LocalThrottle
 from toil.provisioners.clusterScaler import ScalerThread
+from toil.schedulingPolicy import schedulingPolicies, JobIssueQueue
 from toil.serviceManager import ServiceManager
 from toil.statsAndLogging import StatsAndLogging
 from toil.job import JobNode, ServiceJobNode
@@ -52,13 +58,11 @@ logger = logging.getLogger( __name__ )
 # Multiple predecessors:
 #   There is special-case handling for jobs with multiple predecessors as a
 #   performance optimization. This minimize number of expensive loads of
-#   jobGraphs from jobStores.  However, this special case could be unnecessary.
-#   The jobGraph is loaded to update predecessorsFinished, in
-#   _checkSuccessorReadyToRunMultiplePredecessors, however it doesn't appear to
-#   write the jobGraph back the jobStore.  Thus predecessorsFinished may really
-#   be leader state and could moved out of the jobGraph.  This would make this
-#   special-cases handling unnecessary and simplify the leader.
-#   Issue #2136
+#   jobGraphs from jobStores.  The jobGraph is loaded to update
+#   predecessorsFinished, in _checkSuccessorReadyToRunMultiplePredecessors,
+#   and written back to the jobStore while the job is waiting for other
+#   predecessors. This lets the worker of the last predecessor run the job
+#   itself, see toil.worker.successorsToRunInWorker.
 ###############################################################################
 
 
@@ -103,7 +107,8 @@ class DeadlockException(Exception):
 class Leader(object):
     """ Class that encapsulates the logic of the leader.
     """
-    def __init__(self, config, batchSystem, provisioner, jobStore, rootJob, jobCache=None):
+    def __init__(self, config, batchSystem, provisioner, jobStore, rootJob, jobCache=None,
+                 leaderState=None):
         """
         :param toil.common.Config config:
         :param toil.batchSystems.abstractBatchSystem.AbstractBatchSystem batchSystem:
@@ -114,16 +119,26 @@ class Leader(object):
         If jobCache is passed, it must be a dict from job ID to pre-existing
         JobGraph objects. Jobs will be loaded from the cache (which can be
         downloaded from the jobStore in a batch) during the construction of the ToilState object.
+
+        If leaderState is passed, it must be a snapshot of the state of a previous leader of the
+        workflow, from which the ToilState object is restored.
         """
         # Object containing parameters for the run
         self.config = config
 
-        # The job store
-        self.jobStore = jobStore
+        # The job store, with updates written behind so the main loop doesn't wait for them
+        self.jobStore = WriteBehindJobStore(jobStore)
         self.jobStoreLocator = config.jobStore
 
+        # Snapshots of the state written by previous leaders become invalid, see
+        # writeStateSnapshot()
+        self.stateGeneration = None
+        self._startStateGeneration()
+        # Whether a snapshot of the state was written in the current generation
+        self.stateSnapshotWritten = False
+
         # Get a snap shot of the current state of the jobs in the jobStore
-        self.toilState = ToilState(jobStore, rootJob, jobCache=jobCache)
+        self.toilState = ToilState(jobStore, rootJob, jobCache=jobCache, snapshot=leaderState)
         logger.debug("Found %s jobs to start and %i jobs with successors to run",
                      len(self.toilState.updatedJobs), len(self.toilState.successorCounts))
 
@@ -135,6 +150,20 @@ class Leader(object):
         # Map of batch system IDs to IssuedJob tuples
         self.jobBatchSystemIDToIssuedJob = {}
 
+        # The jobs to be issued at the end of the current pass of the main loop, in the order
+        # chosen by the scheduling policy
+        self.schedulingPolicy = schedulingPolicies[config.schedulingPolicy](config)
+        self.jobsToIssue = JobIssueQueue(self.schedulingPolicy)
+
+        # The number of jobs issued to the batch system, overall and by job name, that count
+        # towards the limits set by --maxIssuedJobs and --maxIssuedJobsPerName. Jobs beyond the
+        # limits are held in self.jobsToIssue until issued jobs finish. Service jobs are limited
+        # by --maxServiceJobs instead, as holding them back could deadlock their clients.
+        self.admittedJobsIssued = 0
+        self.jobNameToNumAdmittedJobsIssued = {}
+        # The number of jobs held back the last time it was logged to the metrics
+        self.loggedJobsHeld = 0
+
         # Number of preemptible jobs currently being run by batch system
         self.preemptableJobsIssued = 0
 
@@ -166,7 +195,7 @@ class Leader(object):
         self.serviceManager = ServiceManager(jobStore, self.toilState)
 
         # A thread to manage the aggregation of statistics and logging from the run
-        self.statsAndLogging = StatsAndLogging(self.jobStore, self.config)
+        self.statsAndLogging = StatsAndLogging(jobStore, self.config)
 
         # Set used to monitor deadlocked jobs
         self.potentialDeadlockedJobs = set()
@@ -182,6 +211,23 @@ class Leader(object):
 
         self.deadlockThrottler = LocalThrottle(self.config.deadlockWait)
 
+        # The longest time in seconds the main loop blocks waiting on the batch system, which
+        # it only does when it has nothing else to do
+        self.maxBatchSystemWait = 2
+
+        # The liveness of the helper threads is checked at most once per this many seconds
+        # instead of on every pass of the main loop
+        self.threadCheckThrottler = LocalThrottle(1)
+
+        # A snapshot of the leader's state is written to the job store at most once per this many
+        # seconds, starting one interval into the run
+        self.stateSnapshotThrottler = LocalThrottle(self.config.leaderStateInterval)
+        self.stateSnapshotThrottler.throttle(wait=False)
+
+        # Statistics on the main loop, reported every loopStatsInterval seconds
+        self.loopStatsInterval = 60
+        self._resetLoopStats()
+
     def run(self):
         """
         This runs the leader process to issue and manage jobs.
@@ -208,8 +254,12 @@ class Leader(object):
                     self.clusterScaler.start()
 
                 try:
-                    # Run the main loop
-                    self.innerLoop()
+                    try:
+                        # Run the main loop
+                        self.innerLoop()
+                    finally:
+                        # Write any job updates that are still queued
+                        self.jobStore.shutdown()
                 finally:
                     if self.clusterScaler is not None:
                         logger.debug('Waiting for workers to shutdown.')
@@ -230,6 +280,10 @@ class Leader(object):
         # Filter the failed jobs
         self.toilState.totalFailedJobs = [j for j in self.toilState.totalFailedJobs if self.jobStore.exists(j.jobStoreID)]
 
+        if self.toilState.totalFailedJobs and self.stateSnapshotWritten:
+            # The failed jobs must be reset from the job store when the workflow is restarted
+            self._startStateGeneration()
+
         try:
             self.create_status_sentinel_file(self.toilState.totalFailedJobs)
         except IOError as e:
@@ -309,6 +363,11 @@ class Leader(object):
         # ignore the jobGraph as is not yet ready to run
         assert len(successorJobGraph.predecessorsFinished) <= successorJobGraph.predecessorNumber
         if len(successorJobGraph.predecessorsFinished) < successorJobGraph.predecessorNumber:
+            if (not self.config.disableChaining and
+                    len(successorJobGraph.predecessorsFinished) == successorJobGraph.predecessorNumber - 1):
+                # Let the worker of the last predecessor know that the others have finished, so
+                # that it can chain to the successor
+                self.jobStore.update(successorJobGraph)
             return False
         else:
             # Remove the successor job from the cache
@@ -342,9 +401,30 @@ class Leader(object):
         successors = []
         for jobNode in jobGraph.stack[-1]:
             if self._makeJobSuccessorReadyToRun(jobGraph, jobNode):
-                successors.append(jobNode)
+                if jobNode.jobStoreID in jobGraph.ranSuccessorJobStoreIDs:
+                    self._processSuccessorRunByWorker(jobNode)
+                else:
+                    successors.append(jobNode)
         self.issueJobs(successors)
 
+    def _processSuccessorRunByWorker(self, jobNode):
+        """
+        Process a successor that the worker of its predecessor already ran, like a job issued by
+        the leader that finished.
+        """
+        self.jobStore.release(jobNode.jobStoreID)
+        if self.jobStore.exists(jobNode.jobStoreID):
+            logger.debug("Successor %s was run by the worker of its predecessor", jobNode)
+            jobGraph = self.jobStore.load(jobNode.jobStoreID)
+            # A successor run in a worker of its own, see toil.worker.runSuccessorsInParallel,
+            # may have failed
+            self._reportJobLog(jobGraph)
+            self.toilState.updatedJobs.add((jobGraph, 0))
+        else:
+            logger.debug("Successor %s was run by the worker of its predecessor and finished",
+                         jobNode)
+            self._updatePredecessorStatus(jobNode.jobStoreID)
+
     def _processFailedSuccessors(self, jobGraph):
         """Some of the jobs successors failed then either fail the job
         or restart it if it has retries left and is a checkpoint job"""
@@ -478,9 +558,47 @@ class Leader(object):
             jobGraph.services = []
             self.toilState.updatedJobs.add((jobGraph, 0))
 
-    def _gatherUpdatedJobs(self, updatedJobTuple):
-        """Gather any new, updated jobGraph from the batch system"""
-        jobID, result, wallTime = updatedJobTuple
+    def _getUpdatedJobs(self):
+        """
+        Collect all job updates the batch system has ready. The batch system is only waited on
+        if there are no jobs left to process, in which case the leader sleeps until a job
+        finishes or maxBatchSystemWait seconds have passed, whichever is sooner.
+
+        :return: the list of (jobID, exitValue, wallTime) tuples collected
+        :rtype: list[tuple]
+        """
+        maxWait = 0 if self.toilState.updatedJobs else self.maxBatchSystemWait
+        startTime = time.time()
+        updatedJobTuples = self.batchSystem.getUpdatedBatchJobs(maxWait=maxWait)
+        self.lastBatchSystemWait = time.time() - startTime
+        return updatedJobTuples
+
+    def _gatherUpdatedJobs(self, updatedJobTuples):
+        """
+        Gather the new, updated jobGraphs from the batch system, processing the whole batch
+        before returning to the main loop.
+
+        :param list[tuple] updatedJobTuples: (jobID, exitValue, wallTime) tuples as returned by
+               :meth:`AbstractBatchSystem.getUpdatedBatchJobs`
+        """
+        # Use the records the workers passed back through the batch system and load the records
+        # of the other finished jobs all at once
+        jobStoreIDs, workerResults = [], {}
+        for jobID, _, _ in updatedJobTuples:
+            if jobID in self.jobBatchSystemIDToIssuedJob:
+                jobStoreID = self.jobBatchSystemIDToIssuedJob[jobID].jobStoreID
+                jobStoreIDs.append(jobStoreID)
+                workerResult = self.batchSystem.getWorkerResult(jobID)
+                if workerResult is not None:
+                    workerResults[jobStoreID] = workerResult
+        with self.jobStore.prefetch(jobStoreIDs, records=workerResults):
+            for jobID, result, wallTime in updatedJobTuples:
+                self._gatherUpdatedJob(jobID, result, wallTime)
+
+    def _gatherUpdatedJob(self, jobID, result, wallTime):
+        """
+        Process a single job update from the batch system.
+        """
         # easy, track different state
         try:
             updatedJob = self.jobBatchSystemIDToIssuedJob[jobID]
@@ -527,9 +645,11 @@ class Leader(object):
         self.timeSinceJobsLastRescued = time.time()
 
         while self.toilState.updatedJobs or \
+              self.jobsToIssue or \
               self.getNumberOfJobsIssued() or \
               self.serviceManager.jobsIssuedToServiceManager:
 
+            loopStartTime = time.time()
             if self.toilState.updatedJobs:
                 self._processReadyJobs()
 
@@ -537,25 +657,35 @@ class Leader(object):
             self._startServiceJobs()
             self._processJobsWithRunningServices()
 
+            # issue the jobs that became ready, highest priority first
+            self.issueQueuedJobs()
+
             # check in with the batch system
-            updatedJobTuple = self.batchSystem.getUpdatedBatchJob(maxWait=2)
-            if updatedJobTuple is not None:
-                self._gatherUpdatedJobs(updatedJobTuple)
+            updatedJobTuples = self._getUpdatedJobs()
+            if updatedJobTuples:
+                self._gatherUpdatedJobs(updatedJobTuples)
             else:
                 self._processLostJobs()
 
-            # Check on the associated threads and exit if a failure is detected
-            self.statsAndLogging.check()
-            self.serviceManager.check()
-            # the cluster scaler object will only be instantiated if autoscaling is enabled
-            if self.clusterScaler is not None:
-                self.clusterScaler.check()
+            if self.threadCheckThrottler.throttle(wait=False):
+                # Check on the associated threads and exit if a failure is detected
+                self.statsAndLogging.check()
+                self.serviceManager.check()
+                # the cluster scaler object will only be instantiated if autoscaling is enabled
+                if self.clusterScaler is not None:
+                    self.clusterScaler.check()
 
             if len(self.toilState.updatedJobs) == 0 and self.deadlockThrottler.throttle(wait=False):
                 # Nothing happened this round and it's been long
                 # enough since we last checked. Check for deadlocks.
                 self.checkForDeadlocks()
 
+            if self.config.leaderStateInterval and self.stateSnapshotThrottler.throttle(wait=False):
+                self.writeStateSnapshot()
+
+            self._updateLoopStats(loopStartTime, len(updatedJobTuples))
+
+        self._reportLoopStats()
         logger.debug("Finished the main loop: no jobs left to run.")
 
         # Consistency check the toil state
@@ -567,6 +697,96 @@ class Leader(object):
         # assert self.toilState.jobsToBeScheduledWithMultiplePredecessors # These are not properly emptied yet
         # assert self.toilState.hasFailedSuccessors == set() # These are not properly emptied yet
 
+    def _startStateGeneration(self):
+        """
+        Start a new generation of snapshots of the leader's state, invalidating the snapshots
+        written before. A snapshot is only restored on restart if its generation is the last one
+        the job store records, see Toil._loadLeaderState().
+        """
+        self.stateGeneration = str(uuid.uuid4())
+        with self.jobStore.writeSharedFileStream(Toil.leaderGenerationFileName) as fH:
+            fH.write(self.stateGeneration.encode('utf-8'))
+
+    def writeStateSnapshot(self):
+        """
+        Write a snapshot of the leader's state to the job store, from which the state can be
+        restored if the workflow is restarted, instead of rebuilding it from all jobs. While the
+        state can't be captured in a snapshot, see ToilState.snapshot(), the snapshot written
+        last is invalidated instead.
+        """
+        snapshot = None
+        if not (self.serviceJobsToBeIssued or self.preemptableServiceJobsToBeIssued
+                or self.serviceManager.jobsIssuedToServiceManager):
+            pendingJobStoreIDs = [jobNode.jobStoreID
+                                  for jobNode in itervalues(self.jobBatchSystemIDToIssuedJob)]
+            pendingJobStoreIDs.extend(jobGraph.jobStoreID
+                                      for jobGraph, _ in self.toilState.updatedJobs)
+            pendingJobStoreIDs.extend(jobNode.jobStoreID for jobNode in self.jobsToIssue)
+            snapshot = self.toilState.snapshot(pendingJobStoreIDs)
+        if snapshot is None:
+            logger.debug('Skipping the snapshot of the leader state while services are running, '
+                         'jobs have failed or checkpoint jobs are waiting for successors.')
+            if self.stateSnapshotWritten:
+                self._startStateGeneration()
+                self.stateSnapshotWritten = False
+            return
+        startTime = time.time()
+        # The snapshot must not be ahead of the jobs in the job store
+        self.jobStore.flush()
+        with self.jobStore.writeSharedFileStream(Toil.leaderStateFileName) as fH:
+            pickle.dump(dict(workflowID=self.config.workflowID, generation=self.stateGeneration,
+                             state=snapshot), fH, protocol=pickle.HIGHEST_PROTOCOL)
+        self.stateSnapshotWritten = True
+        logger.debug('Wrote a snapshot of the leader state with %i waiting and %i pending jobs '
+                     'in %.2fs.', len(snapshot['jobs']), len(snapshot['pendingJobs']),
+                     time.time() - startTime)
+
+    def _resetLoopStats(self):
+        self.loopStatsStartTime = time.time()
+        self.loopIterations = 0
+        self.loopWaitTime = 0.0
+        self.loopBusyTime = 0.0
+        self.loopMaxLatency = 0.0
+        self.loopJobsProcessed = 0
+        self.lastBatchSystemWait = 0.0
+
+    def _updateLoopStats(self, loopStartTime, jobsProcessed):
+        """
+        Account for one pass of the main loop and report the statistics if they are due.
+
+        :param float loopStartTime: the time at which the pass started
+        :param int jobsProcessed: the number of finished jobs gathered during the pass
+        """
+        now = time.time()
+        # Time spent blocked on the batch system is idle time, not latency
+        latency = max(now - loopStartTime - self.lastBatchSystemWait, 0.0)
+        self.loopIterations += 1
+        self.loopWaitTime += self.lastBatchSystemWait
+        self.loopBusyTime += latency
+        self.loopMaxLatency = max(self.loopMaxLatency, latency)
+        self.loopJobsProcessed += jobsProcessed
+        if now - self.loopStatsStartTime >= self.loopStatsInterval:
+            self._reportLoopStats()
+
+    def _reportLoopStats(self):
+        """
+        Log the latency of the main loop and the rate at which it processes finished jobs,
+        and send both to the metrics dashboard, if enabled.
+        """
+        elapsed = time.time() - self.loopStatsStartTime
+        if self.loopIterations > 0 and elapsed > 0:
+            meanLatency = self.loopBusyTime / self.loopIterations
+            jobsPerSecond = self.loopJobsProcessed / elapsed
+            logger.debug("Leader loop ran %i times in the last %.1f seconds, spending %.1f seconds "
+                         "waiting on the batch system. Mean loop latency: %.4f seconds, "
+                         "maximum: %.4f seconds, finished jobs processed: %.2f per second",
+                         self.loopIterations, elapsed, self.loopWaitTime, meanLatency,
+                         self.loopMaxLatency, jobsPerSecond)
+            if self.toilMetrics:
+                self.toilMetrics.logLeaderLoopLatency(meanLatency)
+                self.toilMetrics.logJobsProcessedPerSecond(jobsPerSecond)
+        self._resetLoopStats()
+
     def checkForDeadlocks(self):
         """
         Checks if the system is deadlocked running service jobs.
@@ -597,7 +817,42 @@ class Leader(object):
             self.potentialDeadlockTime = 0
 
     def issueJob(self, jobNode):
-        """Add a job to the queue of jobs."""
+        """
+        Add a job to the queue of jobs. It is issued to the batch system by the next call to
+        :meth:`issueQueuedJobs`, in the order chosen by the scheduling policy.
+        """
+        self.jobsToIssue.push(jobNode)
+
+    def issueQueuedJobs(self):
+        """
+        Issue the queued jobs to the batch system, highest priority first, as long as the number
+        of jobs issued stays within the limits set by --maxIssuedJobs overall and by
+        --maxIssuedJobsPerName for each job name. Jobs beyond the limits remain queued, to be
+        issued by a later call once enough of the issued jobs have finished.
+        """
+        if self.jobsToIssue and self.admittedJobsIssued < self.config.maxIssuedJobs:
+            jobsToSubmit = self.jobsToIssue.popWhere(self._admitJob)
+            for jobNode in jobsToSubmit:
+                self._submitJob(jobNode)
+                if self.admittedJobsIssued >= self.config.maxIssuedJobs:
+                    break
+            jobsToSubmit.close()
+        if self.toilMetrics and len(self.jobsToIssue) != self.loggedJobsHeld:
+            self.loggedJobsHeld = len(self.jobsToIssue)
+            self.toilMetrics.logHeldJobs(self.loggedJobsHeld)
+
+    def _admitJob(self, jobNode):
+        """
+        Returns True if issuing the given job keeps the number of issued jobs with its name within
+        --maxIssuedJobsPerName.
+        """
+        return (self.jobNameToNumAdmittedJobsIssued.get(jobNode.jobName, 0)
+                < self.config.maxIssuedJobsPerName)
+
+    def _submitJob(self, jobNode):
+        """Issue a job to the batch system."""
+        # The worker must see the latest record of the job, which it will then change
+        self.jobStore.release(jobNode.jobStoreID)
         jobNode.command = ' '.join((resolveEntryPoint('_toil_worker'),
                                     jobNode.jobName,
                                     self.jobStoreLocator,
@@ -605,6 +860,11 @@ class Leader(object):
         # jobBatchSystemID is an int that is an incremented counter for each job
         jobBatchSystemID = self.batchSystem.issueBatchJob(jobNode)
         self.jobBatchSystemIDToIssuedJob[jobBatchSystemID] = jobNode
+        self.schedulingPolicy.jobIssued(jobNode)
+        if not isinstance(jobNode, ServiceJobNode):
+            self.admittedJobsIssued += 1
+            self.jobNameToNumAdmittedJobsIssued[jobNode.jobName] = \
+                self.jobNameToNumAdmittedJobsIssued.get(jobNode.jobName, 0) + 1
         if jobNode.preemptable:
             # len(jobBatchSystemIDToIssuedJob) should always be greater than or equal to preemptableJobsIssued,
             # so increment this value after the job is added to the issuedJob dict
@@ -636,11 +896,12 @@ class Leader(object):
 
     def issueQueingServiceJobs(self):
         """Issues any queuing service jobs up to the limit of the maximum allowed."""
+        # Service jobs bypass the queue of jobs to issue, which may hold jobs back
         while len(self.serviceJobsToBeIssued) > 0 and self.serviceJobsIssued < self.config.maxServiceJobs:
-            self.issueJob(self.serviceJobsToBeIssued.pop())
+            self._submitJob(self.serviceJobsToBeIssued.pop())
             self.serviceJobsIssued += 1
         while len(self.preemptableServiceJobsToBeIssued) > 0 and self.preemptableServiceJobsIssued < self.config.maxPreemptableServiceJobs:
-            self.issueJob(self.preemptableServiceJobsToBeIssued.pop())
+            self._submitJob(self.preemptableServiceJobsToBeIssued.pop())
             self.preemptableServiceJobsIssued += 1
 
     def getNumberOfJobsIssued(self, preemptable=None):
@@ -671,6 +932,11 @@ class Leader(object):
             assert self.preemptableJobsIssued > 0
             self.preemptableJobsIssued -= 1
         del self.jobBatchSystemIDToIssuedJob[jobBatchSystemID]
+        if not isinstance(jobNode, ServiceJobNode):
+            self.admittedJobsIssued -= 1
+            numIssued = self.jobNameToNumAdmittedJobsIssued.pop(jobNode.jobName) - 1
+            if numIssued:
+                self.jobNameToNumAdmittedJobsIssued[jobNode.jobName] = numIssued
         # If service job
         if jobNode.jobStoreID in self.toilState.serviceJobStoreIDToPredecessorJob:
             # Decrement the number of services
@@ -757,6 +1023,7 @@ class Leader(object):
         if resultStatus != 0:
             logger.warn("Despite the batch system claiming failure the "
                         "job %s seems to have finished and been removed", issuedJob)
+        self.schedulingPolicy.jobRemoved(issuedJob)
         self._updatePredecessorStatus(issuedJob.jobStoreID)
 
     def processFinishedJob(self, batchSystemID, resultStatus, wallTime=None):
@@ -767,6 +1034,7 @@ class Leader(object):
         jobStoreID = jobNode.jobStoreID
         if wallTime is not None and self.clusterScaler is not None:
             self.clusterScaler.addCompletedJob(jobNode, wallTime)
+        self.schedulingPolicy.jobFinished(jobNode, wallTime)
         if self.jobStore.exists(jobStoreID):
             logger.debug("Job %s continues to exist (i.e. has more to do)", jobNode)
             try:
@@ -784,16 +1052,7 @@ class Leader(object):
                     return
                 else:
                     raise
-            if jobGraph.logJobStoreFileID is not None:
-                with jobGraph.getLogFileHandle(self.jobStore) as logFileStream:
-                    # more memory efficient than read().striplines() while leaving off the
-                    # trailing \n left when using readlines()
-                    # http://stackoverflow.com/a/15233739
-                    StatsAndLogging.logWithFormatting(jobStoreID, logFileStream, method=logger.warn,
-                                                      message='The job seems to have left a log file, indicating failure: %s' % jobGraph)
-                if self.config.writeLogs or self.config.writeLogsGzip:
-                    with jobGraph.getLogFileHandle(self.jobStore) as logFileStream:
-                        StatsAndLogging.writeLogFiles(jobGraph.chainedJobs, logFileStream, self.config)
+            self._reportJobLog(jobGraph)
             if resultStatus != 0:
                 # If the batch system returned a non-zero exit code then the worker
                 # is assumed not to have captured the failure of the job, so we
@@ -839,6 +1098,22 @@ class Leader(object):
         else:  #The jobGraph is done
             self.processRemovedJob(jobNode, resultStatus)
 
+    def _reportJobLog(self, jobGraph):
+        """
+        Log the log file that the worker of the given job left if the job failed, and write it
+        out if requested.
+        """
+        if jobGraph.logJobStoreFileID is not None:
+            with jobGraph.getLogFileHandle(self.jobStore) as logFileStream:
+                # more memory efficient than read().striplines() while leaving off the
+                # trailing \n left when using readlines()
+                # http://stackoverflow.com/a/15233739
+                StatsAndLogging.logWithFormatting(jobGraph.jobStoreID, logFileStream, method=logger.warn,
+                                                  message='The job seems to have left a log file, indicating failure: %s' % jobGraph)
+            if self.config.writeLogs or self.config.writeLogsGzip:
+                with jobGraph.getLogFileHandle(self.jobStore) as logFileStream:
+                    StatsAndLogging.writeLogFiles(jobGraph.chainedJobs, logFileStream, self.config)
+
     @staticmethod
     def getSuccessors(jobGraph, alreadySeenSuccessors, jobStore):
         """
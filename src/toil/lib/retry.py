@@ -21,12 +21,7 @@ standard_library.install_aliases()
 from builtins import next
 from contextlib import contextmanager
 import time
-import urllib.request, urllib.error, urllib.parse
-try:
-    from httplib import BadStatusLine
-except ImportError:
-    # This has moved in Python 3
-    from http.client import BadStatusLine
+import urllib.error
 import logging
 
 log = logging.getLogger( __name__ )
@@ -145,6 +140,12 @@ def retryable_http_error( e ):
     """
     Determine if an error encountered during an HTTP download is likely to go away if we try again.
     """
+    # The HTTP client is only imported when needed, as it pulls in the email package
+    try:
+        from httplib import BadStatusLine
+    except ImportError:
+        # This has moved in Python 3
+        from http.client import BadStatusLine
     if isinstance( e, urllib.error.HTTPError ) and e.code in ('503', '408', '500'):
         # The server returned one of:
         # 503 Service Unavailable
@@ -169,6 +170,7 @@ def retry_http( delays=default_delays, timeout=default_timeout, predicate=retrya
     HTTPError: HTTP Error 408: some message
     >>> i > 1
     True
+    >>> from six.moves.http_client import BadStatusLine
     >>> i = 0
     >>> for attempt in retry_http(timeout=5):  # doctest: +IGNORE_EXCEPTION_DETAIL
     ...     with attempt:
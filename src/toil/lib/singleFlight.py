@@ -0,0 +1,161 @@
+# Copyright (C) 2015-2019 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from builtins import object
+from fcntl import flock, LOCK_EX, LOCK_SH, LOCK_NB
+import errno
+import os
+
+
+class SingleFlight(object):
+    """
+    Lets the processes on a node that need the same thing, e.g. the download of a file, have a
+    single one of them fetch it while the others wait for it to finish.
+
+    The process fetching the thing holds an exclusive lock on a lock file. The others block on
+    the lock and are woken up by the operating system when the fetch is done, or when the
+    process fetching it dies, which releases the lock. The lock file is removed when the fetch
+    is done. Each instance holds the lock through a file descriptor of its own, so the threads
+    of a process coordinate with each other like processes do.
+
+    >>> import tempfile
+    >>> flight = SingleFlight(os.path.join(tempfile.mkdtemp(), 'lock'))
+    >>> flight.take()
+    True
+    >>> other = SingleFlight(flight.lockFilePath)
+    >>> other.inFlight(), other.take(blocking=False)
+    (True, False)
+    >>> flight.land()
+    >>> other.inFlight(), other.take(blocking=False)
+    (False, True)
+    >>> other.land()
+    """
+
+    def __init__(self, lockFilePath):
+        """
+        :param str lockFilePath: the path of the lock file, the same in all processes fetching
+               the same thing, in a directory they share
+        """
+        self.lockFilePath = lockFilePath
+        self._fd = None
+
+    def take(self, blocking=True):
+        """
+        Start fetching the thing, waiting for any other process fetching it to finish first.
+        Since the other process may have fetched the thing, the caller should check whether it
+        still needs to be fetched after taking the flight.
+
+        :param bool blocking: if False, don't wait but return False if another process is
+               fetching the thing
+        :return: whether this process is now fetching the thing and must land the flight
+        :rtype: bool
+        """
+        assert self._fd is None
+        while True:
+            fd = os.open(self.lockFilePath, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                try:
+                    flock(fd, LOCK_EX if blocking else LOCK_EX | LOCK_NB)
+                except (IOError, OSError) as e:
+                    if not blocking and e.errno in (errno.EAGAIN, errno.EACCES):
+                        return False
+                    raise
+                # The process that held the lock may have removed the lock file in the meantime
+                if self._isLockFile(fd):
+                    self._fd, fd = fd, None
+                    return True
+            finally:
+                if fd is not None:
+                    os.close(fd)
+
+    def land(self):
+        """
+        Finish fetching the thing, letting the processes waiting for it proceed.
+        """
+        assert self._fd is not None
+        os.unlink(self.lockFilePath)
+        fd, self._fd = self._fd, None
+        os.close(fd)
+
+    def inFlight(self):
+        """
+        :return: whether another process is fetching the thing
+        :rtype: bool
+        """
+        fd = self._open()
+        if fd is None:
+            return False
+        try:
+            flock(fd, LOCK_SH | LOCK_NB)
+        except (IOError, OSError) as e:
+            if e.errno in (errno.EAGAIN, errno.EACCES):
+                return True
+            raise
+        else:
+            return False
+        finally:
+            os.close(fd)
+
+    def wait(self):
+        """
+        Wait for any other process fetching the thing to finish, without fetching it.
+        """
+        fd = self._open()
+        if fd is not None:
+            try:
+                flock(fd, LOCK_SH)
+            finally:
+                os.close(fd)
+
+    def _open(self):
+        try:
+            return os.open(self.lockFilePath, os.O_RDONLY)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+
+    def _isLockFile(self, fd):
+        try:
+            pathStat = os.stat(self.lockFilePath)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return False
+            raise
+        fdStat = os.fstat(fd)
+        return (pathStat.st_dev, pathStat.st_ino) == (fdStat.st_dev, fdStat.st_ino)
+
+
+def fetchOnce(lockFilePath, isFetched, fetch):
+    """
+    Fetch something unless it was fetched already, making sure that only one of the processes
+    on the node that need it fetches it at any time.
+
+    :param str lockFilePath: the path of the lock file, see :class:`SingleFlight`
+    :param isFetched: a function returning whether the thing was fetched already
+    :param fetch: a function fetching the thing
+    :return: whether this call fetched the thing
+    :rtype: bool
+    """
+    if isFetched():
+        return False
+    flight = SingleFlight(lockFilePath)
+    flight.take()
+    try:
+        if isFetched():
+            return False
+        fetch()
+        return True
+    finally:
+        flight.land()
@@ -20,7 +20,6 @@ import datetime
 from toil.lib.misc import std_dev, mean
 from six import string_types
 
-from toil.test import runningOnEC2
 
 logger = logging.getLogger(__name__)
 
@@ -49,6 +48,8 @@ def _getCurrentAWSZone(spotBid=None, nodeType=None, ctx=None):
     except ImportError:
         pass
     else:
+        # Importing the tests is expensive, so only do it when needed
+        from toil.test import runningOnEC2
         zone = os.environ.get('TOIL_AWS_ZONE', None)
         if not zone and runningOnEC2():
             try:
@@ -39,6 +39,7 @@ from six.moves.urllib.request import urlopen
 
 from toil.lib.memoize import strict_bool
 from toil.lib.iterables import concat
+from toil.lib.singleFlight import fetchOnce
 
 from toil import inVirtualEnv
 
@@ -164,21 +165,18 @@ class Resource(namedtuple('Resource', ('name', 'pathHash', 'url', 'contentHash')
         prepareSystem().
         """
         dirPath = self.localDirPath
-        if not os.path.exists(dirPath):
+
+        def save():
             tempDirPath = mkdtemp(dir=os.path.dirname(dirPath), prefix=self.contentHash + "-")
             self._save(tempDirPath)
             if callback is not None:
                 callback(tempDirPath)
-            try:
-                os.rename(tempDirPath, dirPath)
-            except OSError as e:
-                # If dirPath already exists & is non-empty either ENOTEMPTY or EEXIST will be raised
-                if e.errno == errno.ENOTEMPTY or e.errno == errno.EEXIST:
-                    # Another process beat us to it.
-                    # TODO: This is correct but inefficient since multiple processes download the resource redundantly
-                    pass
-                else:
-                    raise
+            os.rename(tempDirPath, dirPath)
+
+        # Only one process on the node downloads the resource, the others wait for it to finish
+        fetchOnce(lockFilePath=dirPath + '.lock',
+                  isFetched=lambda: os.path.exists(dirPath),
+                  fetch=save)
 
     @property
     def localPath(self):
@@ -0,0 +1,229 @@
+# Copyright (C) 2015-2019 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from __future__ import division
+
+from builtins import object
+from abc import ABCMeta, abstractmethod
+import heapq
+import itertools
+import logging
+import time
+
+from future.utils import with_metaclass
+
+logger = logging.getLogger(__name__)
+
+
+class AbstractSchedulingPolicy(with_metaclass(ABCMeta, object)):
+    """
+    Decides the order in which the leader issues the jobs that are ready to run. The leader
+    queues the jobs that become ready during a pass of its main loop in a :class:`JobIssueQueue`
+    and issues them to the batch system highest priority first. The policy is told when jobs are
+    issued, finish running and are removed from the job store, so it can learn from the workflow
+    as it runs.
+    """
+
+    def __init__(self, config):
+        """
+        :param toil.common.Config config: the configuration of the workflow
+        """
+        self.config = config
+
+    @abstractmethod
+    def priority(self, jobNode):
+        """
+        Returns the priority of the given job. It is computed once, when the job is queued.
+
+        :param toil.job.JobNode jobNode: the job about to be queued
+        :return: a tuple of numbers, compared with those of other jobs element by element. Jobs
+                 with greater priorities are issued first and jobs with equal priorities in the
+                 order they were queued.
+        :rtype: tuple
+        """
+        raise NotImplementedError()
+
+    def jobIssued(self, jobNode):
+        """
+        Called when a job is issued to the batch system, which may happen repeatedly for the
+        same job, e.g. when it is retried or issued again to be cleaned up.
+
+        :param toil.job.JobNode jobNode: the job
+        """
+        pass
+
+    def jobFinished(self, jobNode, wallTime):
+        """
+        Called when the batch system reports that the worker of a job has finished.
+
+        :param toil.job.JobNode jobNode: the job
+        :param float wallTime: the number of seconds the job ran for, or None if the batch
+               system doesn't track that
+        """
+        pass
+
+    def jobRemoved(self, jobNode):
+        """
+        Called when a job has been removed from the job store, meaning that it and all its
+        successors are done.
+
+        :param toil.job.JobNode jobNode: the job
+        """
+        pass
+
+
+class PrioritySchedulingPolicy(AbstractSchedulingPolicy):
+    """
+    Issues jobs in the order of the priorities the user gave them, see :class:`toil.job.Job`.
+    Jobs without a priority have priority 0 and jobs with the same priority are issued in the
+    order they became ready.
+    """
+
+    def priority(self, jobNode):
+        return (jobNode.priority or 0,)
+
+
+class CriticalPathSchedulingPolicy(PrioritySchedulingPolicy):
+    """
+    Breaks ties between jobs with the same user-given priority by issuing first the jobs that
+    are expected to take longest until they and all their successors are done, i.e. the jobs
+    likely to be on the critical path of the workflow. The leader can't know a job's successors
+    before it has run, so the expectation is the average time between the first issue and the
+    removal of the jobs with the same name that completed earlier in the workflow. For names that
+    haven't completed yet, the average over all jobs is used.
+    """
+
+    def __init__(self, config):
+        super(CriticalPathSchedulingPolicy, self).__init__(config)
+        # The name and the time of the first issue of the jobs that have yet to be removed, by
+        # job store ID
+        self._issued = {}
+        self._jobNameToAvgTime = {}
+        self._jobNameToNumCompleted = {}
+        self._totalAvgTime = 0.0
+        self._totalJobsCompleted = 0
+
+    def priority(self, jobNode):
+        return (jobNode.priority or 0, self.getExpectedTime(jobNode.jobName))
+
+    def getExpectedTime(self, jobName):
+        """
+        Returns the expected number of seconds until a job of the given name and all its
+        successors are done, or 0 if no job has completed yet.
+
+        :param str jobName: the name of the job
+        :rtype: float
+        """
+        return self._jobNameToAvgTime.get(jobName, self._totalAvgTime)
+
+    def jobIssued(self, jobNode):
+        if jobNode.jobStoreID not in self._issued:
+            self._issued[jobNode.jobStoreID] = (jobNode.jobName, time.time())
+
+    def jobRemoved(self, jobNode):
+        try:
+            jobName, issueTime = self._issued.pop(jobNode.jobStoreID)
+        except KeyError:
+            # The job was issued by a previous leader of the workflow
+            return
+        completionTime = time.time() - issueTime
+        numCompleted = self._jobNameToNumCompleted.get(jobName, 0)
+        self._jobNameToAvgTime[jobName] = ((self._jobNameToAvgTime.get(jobName, 0.0)
+                                            * numCompleted + completionTime) / (numCompleted + 1))
+        self._jobNameToNumCompleted[jobName] = numCompleted + 1
+        self._totalJobsCompleted += 1
+        self._totalAvgTime = ((self._totalAvgTime * (self._totalJobsCompleted - 1)
+                               + completionTime) / self._totalJobsCompleted)
+
+
+# The scheduling policies that can be selected with --schedulingPolicy, by name
+schedulingPolicies = {'priority': PrioritySchedulingPolicy,
+                      'criticalPath': CriticalPathSchedulingPolicy}
+
+
+def addSchedulingPolicy(name, policyClass):
+    """
+    Make a custom scheduling policy available under the given name.
+
+    :param str name: the name of the policy, as passed to --schedulingPolicy
+    :param type policyClass: a subclass of :class:`AbstractSchedulingPolicy`
+    """
+    assert issubclass(policyClass, AbstractSchedulingPolicy)
+    schedulingPolicies[name] = policyClass
+
+
+class JobIssueQueue(object):
+    """
+    The jobs the leader has yet to issue, ordered by the priorities a scheduling policy assigns
+    them.
+    """
+
+    def __init__(self, policy):
+        """
+        :param AbstractSchedulingPolicy policy: the policy ordering the jobs
+        """
+        self.policy = policy
+        self._heap = []
+        # Breaks ties between jobs of equal priority in the order they were queued. It also keeps
+        # the heap from ever comparing the jobs themselves.
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __iter__(self):
+        """
+        Iterate over the queued jobs, in no particular order.
+        """
+        return (jobNode for _, _, jobNode in self._heap)
+
+    def push(self, jobNode):
+        """
+        :param toil.job.JobNode jobNode: the job to queue
+        """
+        priority = tuple(-p for p in self.policy.priority(jobNode))
+        heapq.heappush(self._heap, (priority, next(self._counter), jobNode))
+
+    def pop(self):
+        """
+        Remove the job with the highest priority from the queue and return it.
+
+        :rtype: toil.job.JobNode
+        """
+        return heapq.heappop(self._heap)[2]
+
+    def popWhere(self, admit):
+        """
+        Remove the jobs the given function admits from the queue and yield them, highest priority
+        first. The jobs it doesn't admit remain queued in their place once the iteration is
+        finished or abandoned.
+
+        :param admit: a function that takes a :class:`toil.job.JobNode` and returns True if the
+               job may be removed from the queue. It is only called on a job when the caller
+               has handled the job yielded before.
+        :rtype: Iterator[toil.job.JobNode]
+        """
+        held = []
+        try:
+            while self._heap:
+                entry = heapq.heappop(self._heap)
+                if admit(entry[2]):
+                    yield entry[2]
+                else:
+                    held.append(entry)
+        finally:
+            if held:
+                # Cheaper than pushing the held jobs back one by one when most are held
+                self._heap.extend(held)
+                heapq.heapify(self._heap)
@@ -22,6 +22,7 @@ from past.utils import old_div
 from abc import ABCMeta, abstractmethod
 from fractions import Fraction
 from inspect import getsource
+import collections
 import logging
 import os
 import fcntl
@@ -39,9 +40,12 @@ from toil.batchSystems.mesos.test import MesosTestSupport
 from toil.batchSystems.parasolTestSupport import ParasolTestSupport
 from toil.batchSystems.parasol import ParasolBatchSystem
 from toil.batchSystems.singleMachine import SingleMachineBatchSystem
-from toil.batchSystems.abstractBatchSystem import (InsufficientSystemResources,
+from toil.batchSystems.workerPool import isWorkerCommand
+from toil.batchSystems.abstractBatchSystem import (AbstractBatchSystem,
+                                                   InsufficientSystemResources,
                                                    BatchSystemSupport)
 from toil.job import Job, JobNode
+from toil.worker import workerResultEnvVar
 from toil.test import (ToilTest,
                        needs_lsf,
                        needs_mesos,
@@ -89,6 +93,9 @@ class hidden(object):
         def supportsWallTime(self):
             return False
 
+        def supportsWorkerResults(self):
+            return False
+
         @classmethod
         def createConfig(cls):
             """
@@ -178,7 +185,44 @@ class hidden(object):
 
             # Make sure killBatchJobs can handle jobs that don't exist
             self.batchSystem.killBatchJobs([10])
-        
+
+        @travis_test
+        def testGetUpdatedBatchJobs(self):
+            jobIDs = set()
+            for i in range(3):
+                jobNode = JobNode(command='true', jobName='test%d' % i, unitName=None,
+                                  jobStoreID=str(i), requirements=defaultRequirements)
+                jobIDs.add(self.batchSystem.issueBatchJob(jobNode))
+            updatedIDs = set()
+            while len(updatedIDs) < len(jobIDs):
+                updatedJobs = self.batchSystem.getUpdatedBatchJobs(maxWait=1000, maxCount=2)
+                # Blocking for the first job means we always get at least one, but never more
+                # than we asked for.
+                self.assertTrue(1 <= len(updatedJobs) <= 2)
+                for jobID, exitStatus, wallTime in updatedJobs:
+                    self.assertEqual(exitStatus, 0)
+                    updatedIDs.add(jobID)
+            self.assertEqual(updatedIDs, jobIDs)
+            self.assertEqual(self.batchSystem.getUpdatedBatchJobs(maxWait=0), [])
+
+        @travis_test
+        def testGetWorkerResult(self):
+            # Only a worker leaves a result, a command that doesn't leaves none
+            commands = ['printf result > "$%s"' % workerResultEnvVar, 'true']
+            jobIDs = [self.batchSystem.issueBatchJob(JobNode(command=command, jobName='test',
+                                                             unitName=None, jobStoreID=str(i),
+                                                             requirements=defaultRequirements))
+                      for i, command in enumerate(commands)]
+            updatedIDs = set()
+            while len(updatedIDs) < len(jobIDs):
+                updatedIDs.update(jobID for jobID, _, _ in
+                                  self.batchSystem.getUpdatedBatchJobs(maxWait=1000))
+            expected = b'result' if self.supportsWorkerResults() else None
+            self.assertEqual(self.batchSystem.getWorkerResult(jobIDs[0]), expected)
+            # The result is only returned once
+            self.assertIsNone(self.batchSystem.getWorkerResult(jobIDs[0]))
+            self.assertIsNone(self.batchSystem.getWorkerResult(jobIDs[1]))
+
         @travis_test
         def testSetEnv(self):
             # Parasol disobeys shell rules and stupidly splits the command at the space character
@@ -341,6 +385,9 @@ class MesosBatchSystemTest(hidden.AbstractBatchSystemTest, MesosTestSupport):
     def supportsWallTime(self):
         return True
 
+    def supportsWorkerResults(self):
+        return True
+
     def createBatchSystem(self):
         from toil.batchSystems.mesos.batchSystem import MesosBatchSystem
         self._startMesos(numCores)
@@ -373,10 +420,95 @@ class SingleMachineBatchSystemTest(hidden.AbstractBatchSystemTest):
     def supportsWallTime(self):
         return True
 
+    def supportsWorkerResults(self):
+        return True
+
     def createBatchSystem(self):
         return SingleMachineBatchSystem(config=self.config,
                                         maxCores=numCores, maxMemory=1e9, maxDisk=2001)
 
+    @travis_test
+    def testWorkerPoolCommands(self):
+        """
+        Tests that worker commands go to the warm workers, also if they refer to the worker by
+        its absolute path, as they do if Toil is installed in a virtualenv.
+        """
+        workerPath = os.path.join(sys.prefix, 'bin', '_toil_worker')
+        self.assertTrue(isWorkerCommand('_toil_worker someJob file:/tmp/jobStore 1'))
+        self.assertTrue(isWorkerCommand(workerPath + ' someJob file:/tmp/jobStore 1'))
+        self.assertFalse(isWorkerCommand('true'))
+        self.assertFalse(isWorkerCommand('/usr/bin/_toil_worker_x someJob file:/tmp/jobStore 1'))
+        self.assertFalse(isWorkerCommand('_toil_worker someJob file:/tmp/jobStore 1 && true'))
+
+        self.batchSystem.workerPool = workerPool = _RecordingWorkerPool()
+        commands = [workerPath + ' someJob file:/tmp/jobStore 1', 'true']
+        jobIDs = [self.batchSystem.issueBatchJob(JobNode(command=command, jobName='test',
+                                                         unitName=None, jobStoreID=str(i),
+                                                         requirements=defaultRequirements))
+                  for i, command in enumerate(commands)]
+        updatedIDs = set()
+        while len(updatedIDs) < len(jobIDs):
+            for jobID, exitStatus, _ in self.batchSystem.getUpdatedBatchJobs(maxWait=1000):
+                self.assertEqual(exitStatus, 0)
+                updatedIDs.add(jobID)
+        self.assertEqual(workerPool.jobCommands, commands[:1])
+
+
+class _MinimalBatchSystem(AbstractBatchSystem):
+    """
+    A batch system implementing nothing but the abstract methods, whose jobs finish right away.
+    """
+
+    @classmethod
+    def supportsAutoDeployment(cls):
+        return False
+
+    @classmethod
+    def supportsWorkerCleanup(cls):
+        return False
+
+    def __init__(self):
+        self.updatedJobs = []
+
+    def issueBatchJob(self, jobNode):
+        jobID = len(self.updatedJobs)
+        self.updatedJobs.append((jobID, 0, 0.0))
+        return jobID
+
+    def killBatchJobs(self, jobIDs):
+        pass
+
+    def getIssuedBatchJobIDs(self):
+        return []
+
+    def getRunningBatchJobIDs(self):
+        return {}
+
+    def getUpdatedBatchJob(self, maxWait):
+        return self.updatedJobs.pop(0) if self.updatedJobs else None
+
+    def shutdown(self):
+        pass
+
+
+class AbstractBatchSystemDefaultsTest(ToilTest):
+    """
+    Tests the methods AbstractBatchSystem implements in terms of the abstract ones.
+    """
+
+    @travis_test
+    def testDefaults(self):
+        batchSystem = _MinimalBatchSystem()
+        jobIDs = [batchSystem.issueBatchJob(JobNode(command='true', jobName='test', unitName=None,
+                                                    jobStoreID=str(i),
+                                                    requirements=defaultRequirements))
+                  for i in range(3)]
+        self.assertEqual(batchSystem.getUpdatedBatchJobs(maxWait=0, maxCount=2),
+                         [(jobID, 0, 0.0) for jobID in jobIDs[:2]])
+        self.assertEqual(batchSystem.getUpdatedBatchJobs(maxWait=0), [(jobIDs[2], 0, 0.0)])
+        self.assertEqual(batchSystem.getUpdatedBatchJobs(maxWait=0), [])
+        self.assertIsNone(batchSystem.getWorkerResult(jobIDs[0]))
+
 
 @slow
 class MaxCoresSingleMachineBatchSystemTest(ToilTest):
@@ -831,6 +963,59 @@ class SingleMachineBatchSystemJobTest(hidden.AbstractBatchSystemJobTest):
         assert outString.startswith(possibleStarts)
         assert outString.endswith('sJCsJGCfJC')
 
+    @slow
+    def testWorkerPool(self):
+        """
+        Tests that warm workers run one job after the other, and are replaced after the requested
+        number of jobs.
+        """
+        tempDir = self._createTempDir('testFiles')
+
+        options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+        options.workDir = tempDir
+        options.batchSystem = self.batchSystemName
+        options.workerPool = True
+        options.workerPoolMaxJobs = 3
+        # Run each job in a worker of its own
+        options.disableChaining = True
+
+        outFile = os.path.join(tempDir, 'pids')
+        root = job = Job.wrapFn(_recordPid, outFile, memory='1M', disk='1M')
+        for _ in range(6):
+            job = job.addFollowOnFn(_recordPid, outFile, memory='1M', disk='1M')
+        Job.Runner.startToil(root, options)
+        with open(outFile) as oFH:
+            pids = oFH.read().split()
+        self.assertEqual(len(pids), 7)
+        self.assertNotIn(str(os.getpid()), pids)
+        self.assertEqual(sorted(collections.Counter(pids).values()), [1, 3, 3])
+
+
+class _RecordingWorkerPool(object):
+    """
+    Stands in for a :class:`toil.batchSystems.workerPool.WorkerPool`, recording the commands
+    submitted to it and pretending they succeeded.
+    """
+
+    def __init__(self):
+        self.jobCommands = []
+
+    def submit(self, jobCommand, environment):
+        self.jobCommands.append(jobCommand)
+        return subprocess.Popen(['true'])
+
+    def shutdown(self):
+        pass
+
+
+def _recordPid(outFile):
+    """
+    Append the ID of the process running the job to the out file.
+    :param str outFile: File to write to
+    """
+    with open(outFile, 'a') as oFH:
+        oFH.write('%i\n' % os.getpid())
+
 
 def _resourceBlockTestAuxFn(outFile, sleepTime, writeVal):
     """
@@ -34,6 +34,7 @@ import time
 import uuid
 from stubserver import FTPStubServer
 from abc import abstractmethod, ABCMeta
+from io import BytesIO
 from itertools import chain, islice
 from threading import Thread
 from unittest import skip
@@ -56,6 +57,7 @@ from toil.jobStores.abstractJobStore import (NoSuchJobException,
                                              NoSuchFileException)
 from toil.jobStores.googleJobStore import googleRetry
 from toil.jobStores.fileJobStore import FileJobStore
+from toil.jobStores.sqliteJobStore import SQLiteJobStore
 from toil.statsAndLogging import StatsAndLogging
 from toil.test import (ToilTest,
                        needs_aws,
@@ -1144,6 +1146,118 @@ class FileJobStoreTest(AbstractJobStoreTest.Test):
     def _cleanUpExternalStore(self, dirPath):
         shutil.rmtree(dirPath)
     
+    @travis_test
+    def testJobsIgnoresOrphanedJobDirectories(self):
+        """Check that a job directory without a job file is skipped when enumerating jobs."""
+        jobstore = self.jobstore_initialized
+        jobs = [jobstore.create(self.arbitraryJob) for _ in range(10)]
+        tempfile.mkdtemp(prefix=jobstore.JOB_DIR_PREFIX,
+                         dir=jobstore._getArbitraryJobsDirForName('orphan'))
+        start = time.time()
+        self.assertEqual(sorted(job.jobStoreID for job in jobstore.jobs()),
+                         sorted(job.jobStoreID for job in jobs))
+        self.assertLess(time.time() - start, 10)
+
+    @travis_test
+    def testJobIndex(self):
+        """Check that jobs are enumerated from the index, which is compacted on request."""
+        jobstore = self.jobstore_initialized
+        jobs = [jobstore.create(self.arbitraryJob) for _ in range(3)]
+        with jobstore.batch():
+            jobs.extend(jobstore.create(self.arbitraryJob) for _ in range(3))
+        jobstore.delete(jobs.pop(0).jobStoreID)
+        expected = sorted(job.jobStoreID for job in jobs)
+        with patch.object(FileJobStore, '_walkJobIDs', side_effect=AssertionError):
+            for store in (jobstore, self.jobstore_resumed_noconfig):
+                self.assertEqual(sorted(job.jobStoreID for job in store.jobs()), expected)
+            jobstore._compactJobIndex(jobstore._readJobIndex())
+            self.assertEqual(sorted(job.jobStoreID for job in jobstore.jobs()), expected)
+        records = []
+        for logName in os.listdir(jobstore.jobIndexDir):
+            with open(os.path.join(jobstore.jobIndexDir, logName)) as f:
+                records.extend(f.read().split())
+        self.assertEqual(sorted(records), ['+' + jobStoreID for jobStoreID in expected])
+
+    @travis_test
+    def testJobIndexBuiltOnClean(self):
+        """Check that a job store without an index, as older versions made, gets one on restart."""
+        jobstore = self.jobstore_initialized
+        rootJob = jobstore.create(self.arbitraryJob)
+        jobstore.setRootJob(rootJob.jobStoreID)
+        orphanedJob = jobstore.create(self.arbitraryJob)
+        shutil.rmtree(jobstore.jobIndexDir)
+        jobstore = self._createJobStore()
+        jobstore.resume()
+        self.assertEqual(sorted(job.jobStoreID for job in jobstore.jobs()),
+                         sorted([rootJob.jobStoreID, orphanedJob.jobStoreID]))
+        jobstore.clean()
+        self.assertTrue(os.path.isdir(jobstore.jobIndexDir))
+        with patch.object(FileJobStore, '_walkJobIDs', side_effect=AssertionError):
+            self.assertEqual([job.jobStoreID for job in jobstore.jobs()], [rootJob.jobStoreID])
+
+    @travis_test
+    def testJobIndexMalformed(self):
+        """Check that jobs are enumerated by walking the job directories if the index is malformed."""
+        jobstore = self.jobstore_initialized
+        rootJob = jobstore.create(self.arbitraryJob)
+        jobstore.setRootJob(rootJob.jobStoreID)
+        orphanedJob = jobstore.create(self.arbitraryJob)
+        # A write from another process interleaved with the records of this one
+        with open(jobstore._getJobIndexLog(), 'a') as f:
+            f.write('+' + rootJob.jobStoreID[:5] + '-../' + rootJob.jobStoreID + '\n')
+        self.assertIsNone(jobstore._readJobIndex())
+        self.assertEqual(sorted(job.jobStoreID for job in jobstore.jobs()),
+                         sorted([rootJob.jobStoreID, orphanedJob.jobStoreID]))
+        jobstore.clean()
+        with patch.object(FileJobStore, '_walkJobIDs', side_effect=AssertionError):
+            self.assertEqual([job.jobStoreID for job in jobstore.jobs()], [rootJob.jobStoreID])
+
+    def _createJobs(self, numJobs):
+        return [self.jobstore_initialized.create(JobNode(command='child',
+                                                         requirements=self.childJobReqs1,
+                                                         jobName='test-fanout',
+                                                         unitName='onJobStore',
+                                                         jobStoreID=None))
+                for _ in range(numJobs)]
+
+    @travis_test
+    def testBatchCreateGrouped(self):
+        """Check that the jobs created in a batch are written as a group when the batch ends."""
+        jobstore = self.jobstore_initialized
+        with patch.object(FileJobStore, '_writeJobFile', autospec=True,
+                          side_effect=FileJobStore._writeJobFile) as writeJobFile, \
+                patch.object(FileJobStore, '_updateAll', autospec=True,
+                             side_effect=FileJobStore._updateAll) as updateAll, \
+                patch.object(FileJobStore, '_indexJobs', autospec=True,
+                             side_effect=FileJobStore._indexJobs) as indexJobs:
+            with jobstore.batch():
+                jobGraphs = self._createJobs(100)
+                self.assertEqual(writeJobFile.call_count, 0)
+                self.assertEqual(indexJobs.call_count, 0)
+            updateAll.assert_called_once_with(jobstore, jobGraphs)
+            self.assertEqual(indexJobs.call_count, 1)
+            self.assertEqual(writeJobFile.call_count, len(jobGraphs))
+        for jobGraph in jobGraphs:
+            self.assertTrue(jobstore.exists(jobGraph.jobStoreID))
+
+    @slow
+    def testBatchCreateBenchmark(self):
+        """Check that creating the children of a wide fan-out is faster with a batch than without."""
+        jobstore = self.jobstore_initialized
+        numJobs = 5000
+        start = time.time()
+        self._createJobs(numJobs)
+        unbatched = time.time() - start
+        start = time.time()
+        with jobstore.batch():
+            jobGraphs = self._createJobs(numJobs)
+        batched = time.time() - start
+        logger.info('Created %i jobs in %.2fs without and in %.2fs with a batch',
+                    numJobs, unbatched, batched)
+        self.assertLess(batched, unbatched)
+        for jobGraph in jobGraphs:
+            self.assertTrue(jobstore.exists(jobGraph.jobStoreID))
+
     @travis_test
     def testPreserveFileName(self):
         "Check that the fileID ends with the given file name."
@@ -1157,6 +1271,66 @@ class FileJobStoreTest(AbstractJobStoreTest.Test):
             os.unlink(path)
 
 
+class SQLiteJobStoreTest(FileJobStoreTest):
+    def _createJobStore(self):
+        return SQLiteJobStore(self.namePrefix, fanOut=2)
+
+    @travis_test
+    def testBatchCreateGrouped(self):
+        """Check that the jobs created in a batch are written in a single transaction."""
+        jobstore = self.jobstore_initialized
+        with patch.object(SQLiteJobStore, 'update', autospec=True) as update, \
+                patch.object(SQLiteJobStore, '_transaction', autospec=True,
+                             side_effect=SQLiteJobStore._transaction) as transaction:
+            with jobstore.batch():
+                jobGraphs = self._createJobs(100)
+                self.assertEqual(transaction.call_count, 0)
+            self.assertEqual(transaction.call_count, 1)
+            self.assertEqual(update.call_count, 0)
+        for jobGraph in jobGraphs:
+            self.assertTrue(jobstore.exists(jobGraph.jobStoreID))
+
+    @skip('The jobs are enumerated from the database, not from an index')
+    def testJobIndex(self):
+        pass
+
+    @skip('The jobs are enumerated from the database, not from an index')
+    def testJobIndexBuiltOnClean(self):
+        pass
+
+    @skip('The jobs are enumerated from the database, not from an index')
+    def testJobIndexMalformed(self):
+        pass
+
+    @travis_test
+    def testDeleteJobFiles(self):
+        """Check that deleting a job removes its row along with the files to be cleaned up with it."""
+        jobstore = self.jobstore_initialized
+        job = jobstore.create(self.arbitraryJob)
+        with jobstore.writeFileStream(job.jobStoreID, cleanup=True) as (f, cleanupFileID):
+            f.write(b'deleted with the job')
+        with jobstore.writeFileStream(job.jobStoreID, cleanup=False) as (f, keptFileID):
+            f.write(b'kept after the job')
+        cleanupDir = jobstore._getJobFilesCleanupDir(job.jobStoreID)
+        self.assertTrue(os.path.isdir(cleanupDir))
+        jobstore.delete(job.jobStoreID)
+        self.assertFalse(jobstore.exists(job.jobStoreID))
+        self.assertEqual(jobstore._connection().execute(
+            'SELECT COUNT(*) FROM jobs WHERE id = ?', (job.jobStoreID,)).fetchone()[0], 0)
+        self.assertFalse(os.path.exists(cleanupDir))
+        self.assertFalse(jobstore.fileExists(cleanupFileID))
+        self.assertTrue(jobstore.fileExists(keptFileID))
+
+    @travis_test
+    def testJobsInDatabase(self):
+        """Check that jobs are enumerated from the database, across multiple pages."""
+        self.jobstore_initialized.jobsPageSize = 2
+        jobs = [self.jobstore_initialized.create(self.arbitraryJob) for _ in range(5)]
+        self.assertEqual(sorted(job.jobStoreID for job in self.jobstore_initialized.jobs()),
+                         sorted(job.jobStoreID for job in jobs))
+        self.assertEqual(os.listdir(self.jobstore_initialized.jobsDir), [])
+
+
 @needs_google
 class GoogleJobStoreTest(AbstractJobStoreTest.Test):
     projectID = os.getenv('TOIL_GOOGLE_PROJECTID')
@@ -1367,6 +1541,64 @@ class InvalidAWSJobStoreTest(ToilTest):
                           'us-west-2:a_b')
 
 
+@needs_aws
+class AWSUploadPartsTest(ToilTest):
+    @travis_test
+    def testPartsInMemory(self):
+        """
+        Check that the parts of a multipart upload are only taken from the iterable once there
+        is room to upload them, so that no more parts than are uploaded at a time are in memory.
+        """
+        from toil.jobStores.aws.utils import uploadParts
+        parallelism = 2
+        numParts = 10
+        lock = threading.Lock()
+        outstanding = [0, 0]  # the parts taken but not yet uploaded, and the most there were
+        uploaded = []
+
+        def parts():
+            for i in range(numParts):
+                with lock:
+                    outstanding[0] += 1
+                    outstanding[1] = max(outstanding)
+                yield None, lambda: BytesIO(b'part')
+
+        class Upload(object):
+            def upload_part_from_file(self, fp, part_num, size, headers):
+                time.sleep(0.1)
+                with lock:
+                    outstanding[0] -= 1
+                    uploaded.append(part_num)
+
+        uploadParts(Upload(), parts(), parallelism)
+        self.assertEqual(sorted(uploaded), list(range(1, numParts + 1)))
+        self.assertEqual(outstanding[0], 0)
+        self.assertEqual(outstanding[1], parallelism)
+
+    @travis_test
+    def testFailedPartWaitsForOthers(self):
+        """
+        Check that the failure of a part is only raised once the parts uploading at the same time
+        are done, so that the upload isn't cancelled while parts are still being uploaded.
+        """
+        from toil.jobStores.aws.utils import uploadParts
+        uploaded = []
+
+        class Upload(object):
+            def upload_part_from_file(self, fp, part_num, size, headers):
+                # The first part fails while the others are still being uploaded
+                if part_num == 1:
+                    time.sleep(0.5)
+                    raise RuntimeError('Part %i failed' % part_num)
+                time.sleep(2)
+                uploaded.append(part_num)
+
+        parts = [(None, lambda: BytesIO(b'part')) for _ in range(3)]
+        with self.assertRaises(RuntimeError):
+            uploadParts(Upload(), parts, parallelism=3)
+        self.assertEqual(sorted(uploaded), [2, 3])
+
+
 @needs_azure
 class AzureJobStoreTest(AbstractJobStoreTest.Test):
     accountName = os.getenv('TOIL_AZURE_KEYNAME')
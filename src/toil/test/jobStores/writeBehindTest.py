@@ -0,0 +1,150 @@
+# Copyright (C) 2015-2019 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+import threading
+
+from toil.common import Config
+from toil.job import JobNode
+from toil.jobStores.abstractJobStore import NoSuchJobException
+from toil.jobStores.fileJobStore import FileJobStore
+from toil.jobStores.writeBehind import WriteBehindJobStore
+from toil.test import ToilTest, travis_test
+
+
+class BlockingFileJobStore(FileJobStore):
+    """A file job store whose updates wait for the test and are recorded, as are loads."""
+    def __init__(self, path):
+        super(BlockingFileJobStore, self).__init__(path)
+        self.unblocked = threading.Event()
+        self.unblocked.set()
+        self.updates = []
+        self.loads = []
+
+    def load(self, jobStoreID):
+        self.loads.append(jobStoreID)
+        return super(BlockingFileJobStore, self).load(jobStoreID)
+
+    def update(self, job):
+        self.unblocked.wait()
+        if job.command == 'fail':
+            raise RuntimeError('Failed to update %s' % job)
+        self.updates.append(job.command)
+        super(BlockingFileJobStore, self).update(job)
+
+
+class WriteBehindJobStoreTest(ToilTest):
+    def setUp(self):
+        super(WriteBehindJobStoreTest, self).setUp()
+        path = self._getTestJobStorePath()
+        self.jobStore = BlockingFileJobStore(path)
+        config = Config()
+        config.jobStore = 'file:%s' % path
+        self.jobStore.initialize(config)
+        self.writeBehind = WriteBehindJobStore(self.jobStore)
+
+    def tearDown(self):
+        self.writeBehind.shutdown()
+        self.jobStore.destroy()
+        super(WriteBehindJobStoreTest, self).tearDown()
+
+    def _createJob(self):
+        return self.jobStore.create(JobNode(command='created', jobStoreID=None,
+                                            requirements=dict(memory=1, cores=1, disk=1,
+                                                              preemptable=False),
+                                            jobName='job', unitName=None))
+
+    @travis_test
+    def testReadYourWrites(self):
+        job = self._createJob()
+        self.jobStore.unblocked.clear()
+        job.command = 'updated'
+        self.writeBehind.update(job)
+        # Changing the job after the update doesn't change the queued record
+        job.command = 'changed'
+        self.assertEqual(self.writeBehind.load(job.jobStoreID).command, 'updated')
+        self.assertEqual(self.jobStore.load(job.jobStoreID).command, 'created')
+        self.jobStore.unblocked.set()
+        self.writeBehind.flush(job.jobStoreID)
+        self.assertEqual(self.jobStore.load(job.jobStoreID).command, 'updated')
+
+    @travis_test
+    def testCoalescing(self):
+        job = self._createJob()
+        self.jobStore.unblocked.clear()
+        for i in range(10):
+            job.command = str(i)
+            self.writeBehind.update(job)
+        self.jobStore.unblocked.set()
+        self.writeBehind.flush()
+        # The first update may have been written before the others were queued, the rest are
+        # replaced by the last one
+        self.assertEqual(self.jobStore.updates[-1], '9')
+        self.assertTrue(len(self.jobStore.updates) <= 2)
+        self.assertEqual(self.jobStore.load(job.jobStoreID).command, '9')
+
+    @travis_test
+    def testFailedUpdate(self):
+        job = self._createJob()
+        job.command = 'fail'
+        self.writeBehind.update(job)
+        self.assertRaises(RuntimeError, self.writeBehind.flush)
+        # The error is only raised once
+        self.writeBehind.flush()
+
+    @travis_test
+    def testPrefetch(self):
+        jobs = [self._createJob() for _ in range(3)]
+        self.jobStore.delete(jobs[0].jobStoreID)
+        with self.writeBehind.prefetch(job.jobStoreID for job in jobs):
+            self.assertFalse(self.writeBehind.exists(jobs[0].jobStoreID))
+            self.assertRaises(NoSuchJobException, self.writeBehind.load, jobs[0].jobStoreID)
+            self.assertTrue(self.writeBehind.exists(jobs[1].jobStoreID))
+            self.assertEqual(self.writeBehind.load(jobs[1].jobStoreID), jobs[1])
+            # Queued updates take precedence over prefetched records
+            jobs[2].command = 'updated'
+            self.writeBehind.update(jobs[2])
+            self.assertEqual(self.writeBehind.load(jobs[2].jobStoreID).command, 'updated')
+
+    @travis_test
+    def testCache(self):
+        self.writeBehind.cacheSize = 2
+        jobs = [self._createJob() for _ in range(3)]
+        for job in jobs:
+            self.assertEqual(self.writeBehind.load(job.jobStoreID), job)
+        self.assertEqual(self.jobStore.loads, [job.jobStoreID for job in jobs])
+        # The first job was evicted, the others are cached
+        del self.jobStore.loads[:]
+        for job in reversed(jobs):
+            self.assertEqual(self.writeBehind.load(job.jobStoreID), job)
+        self.assertEqual(self.jobStore.loads, [jobs[0].jobStoreID])
+        # A released job is reloaded, as a worker may have changed it
+        del self.jobStore.loads[:]
+        self.writeBehind.release(jobs[1].jobStoreID)
+        jobs[1].command = 'changed by worker'
+        self.jobStore.update(jobs[1])
+        self.assertEqual(self.writeBehind.load(jobs[1].jobStoreID).command, 'changed by worker')
+        self.assertEqual(self.jobStore.loads, [jobs[1].jobStoreID])
+
+    @travis_test
+    def testPrefetchRecords(self):
+        jobs = [self._createJob() for _ in range(4)]
+        jobs[2].command = 'reported'
+        records = {jobs[2].jobStoreID: jobs[2].serialize(), jobs[3].jobStoreID: b''}
+        with self.writeBehind.prefetch((job.jobStoreID for job in jobs), records=records):
+            # Only the jobs without a known record are loaded
+            self.assertEqual(sorted(self.jobStore.loads), sorted(job.jobStoreID for job in jobs[:2]))
+            self.assertEqual(self.writeBehind.load(jobs[2].jobStoreID).command, 'reported')
+            self.assertFalse(self.writeBehind.exists(jobs[3].jobStoreID))
+            self.assertEqual(self.writeBehind.load(jobs[0].jobStoreID), jobs[0])
+        self.assertEqual(len(self.jobStore.loads), 2)
@@ -0,0 +1,130 @@
+# Copyright (C) 2015-2019 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from builtins import range
+import multiprocessing
+import os
+import time
+from threading import Thread
+
+from toil.lib.singleFlight import SingleFlight, fetchOnce
+from toil.test import ToilTest, travis_test
+
+
+def _fetch(tempDir, index):
+    """
+    Fetch a file into the given directory, as one of several processes needing it, recording
+    that this process fetched it.
+    """
+    filePath = os.path.join(tempDir, 'file')
+
+    def fetch():
+        with open(os.path.join(tempDir, 'fetched-%i' % index), 'w'):
+            pass
+        time.sleep(1)
+        with open(filePath + '.tmp', 'w') as f:
+            f.write('content')
+        os.rename(filePath + '.tmp', filePath)
+
+    fetchOnce(os.path.join(tempDir, 'lock'), lambda: os.path.exists(filePath), fetch)
+    with open(filePath) as f:
+        assert f.read() == 'content'
+
+
+def _takeAndDie(lockFilePath):
+    SingleFlight(lockFilePath).take()
+    os._exit(0)
+
+
+class SingleFlightTest(ToilTest):
+    """
+    Tests the coordination of the processes on a node needing the same thing.
+    """
+
+    def setUp(self):
+        super(SingleFlightTest, self).setUp()
+        self.tempDir = self._createTempDir()
+        self.lockFilePath = os.path.join(self.tempDir, 'lock')
+
+    @travis_test
+    def testFetchOnce(self):
+        """
+        Only one of several processes needing a file fetches it, the others wait for it.
+        """
+        processes = [multiprocessing.Process(target=_fetch, args=(self.tempDir, i))
+                     for i in range(8)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+        self.assertEqual(len([f for f in os.listdir(self.tempDir) if f.startswith('fetched-')]),
+                         1)
+        # The lock file is removed when the fetch is done
+        self.assertFalse(os.path.exists(self.lockFilePath))
+
+    @travis_test
+    def testWait(self):
+        """
+        Waiting for a flight returns as soon as it lands.
+        """
+        flight = SingleFlight(self.lockFilePath)
+        self.assertTrue(flight.take())
+        waiter = Thread(target=SingleFlight(self.lockFilePath).wait)
+        waiter.start()
+        waiter.join(1)
+        self.assertTrue(waiter.is_alive())
+        start = time.time()
+        flight.land()
+        waiter.join(10)
+        self.assertFalse(waiter.is_alive())
+        self.assertLess(time.time() - start, 1)
+        # Nothing to wait for anymore
+        SingleFlight(self.lockFilePath).wait()
+
+    @travis_test
+    def testTakeAfterLanding(self):
+        """
+        A process blocked on a flight takes the next one after the flight lands, even though the
+        lock file it blocked on was removed.
+        """
+        flight = SingleFlight(self.lockFilePath)
+        self.assertTrue(flight.take())
+        other = SingleFlight(self.lockFilePath)
+        taker = Thread(target=other.take)
+        taker.start()
+        time.sleep(0.5)
+        flight.land()
+        taker.join(10)
+        self.assertFalse(taker.is_alive())
+        self.assertTrue(SingleFlight(self.lockFilePath).inFlight())
+        self.assertFalse(flight.take(blocking=False))
+        other.land()
+        self.assertTrue(flight.take(blocking=False))
+        flight.land()
+
+    @travis_test
+    def testHolderDies(self):
+        """
+        A flight is over when the process holding it dies.
+        """
+        process = multiprocessing.Process(target=_takeAndDie, args=(self.lockFilePath,))
+        process.start()
+        process.join()
+        self.assertTrue(os.path.exists(self.lockFilePath))
+        flight = SingleFlight(self.lockFilePath)
+        self.assertFalse(flight.inFlight())
+        flight.wait()
+        self.assertTrue(flight.take(blocking=False))
+        flight.land()
@@ -0,0 +1,245 @@
+# Copyright (C) 2015-2019 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from builtins import range
+from fcntl import flock, LOCK_EX
+import itertools
+import logging
+import multiprocessing
+import os
+import sqlite3
+import time
+
+import dill
+
+from toil.fileStores.cacheEvictionPolicy import cacheEvictionPolicies
+from toil.fileStores.cachingFileStore import CachingFileStore
+from toil.test import ToilTest, travis_test, slow
+
+logger = logging.getLogger(__name__)
+
+
+class CacheIndexTest(ToilTest):
+    """
+    Tests the index of the state of the cache on a node, as used by the caching file store.
+    """
+
+    def setUp(self):
+        super(CacheIndexTest, self).setUp()
+        self.path = os.path.join(self._createTempDir(), CachingFileStore._CacheIndex.fileName)
+        CachingFileStore._CacheIndex.create(self.path, nlink=1, attemptNumber=0, total=1000)
+        self.index = CachingFileStore._CacheIndex(self.path)
+
+    def tearDown(self):
+        self.index.close()
+        super(CacheIndexTest, self).tearDown()
+
+    @travis_test
+    def testState(self):
+        self.assertEqual(self.index.getState(),
+                         CachingFileStore._CacheState(nlink=1, attemptNumber=0, total=1000,
+                                                      cached=0, sigmaJob=0, hits=0, misses=0))
+        self.index.adjust(cached=600, sigmaJob=300)
+        self.index.adjust(sigmaJob=200)
+        self.index.setProperties(attemptNumber=1)
+        state = self.index.getState()
+        self.assertEqual((state.attemptNumber, state.cached, state.sigmaJob), (1, 600, 500))
+        self.assertFalse(state.isBalanced())
+
+    @travis_test
+    def testJobFiles(self):
+        self.index.addJob(CachingFileStore._JobState(jobID='a', jobName='A', jobReqs=100,
+                                                     jobDir='/a', pid=os.getpid()))
+        self.index.addJobFile('a', 'file1', '/a/1', 10, True)
+        self.index.addJobFile('a', 'file1', '/a/2', -1, None)
+        self.index.addJobFile('a', 'file2', '/a/1', 0, False)
+        self.index.addJobFile('a', 'file3', None, 0, False)
+        jobState, = self.index.getJobs()
+        # Only the cached file counts against the requirements of the job
+        self.assertEqual(jobState.jobReqs, 90)
+        self.assertEqual(sorted(self.index.getJobFiles('a', 'file1')),
+                         [('/a/1', 10), ('/a/2', -1)])
+        self.assertEqual(self.index.getJobFiles('b', 'file1'), [])
+        self.assertEqual(sorted(self.index.getJobFileIDs('a')), ['file1', 'file2', 'file3'])
+        self.assertEqual(self.index.getJobFilePaths('a'), {'/a/1', '/a/2', None})
+        self.assertEqual(self.index.countJobFileIDs('a', '/a/1'), 2)
+        self.index.removeJobFile('a', 'file3', None)
+        self.index.removeJobFile('a', 'file2', '/a/1')
+        self.assertEqual(self.index.countJobFileIDs('a', '/a/1'), 1)
+        self.assertEqual(sorted(self.index.getJobFileIDs('a')), ['file1'])
+        self.index.removeJob('a')
+        self.assertEqual(self.index.getJobs(), [])
+        self.assertEqual(self.index.getJobFileIDs('a'), [])
+
+    @travis_test
+    def testEvictionPolicies(self):
+        # The ID, size and time of last access of each file
+        self.index.setCachedFiles([('a', 10, 4.0), ('b', 20, 3.0), ('c', 1, 2.0), ('d', 0, 1.0)])
+        for fileStoreID in ('a', 'd', 'd', 'b'):
+            self.index.recordHit(fileStoreID)
+        self.index.recordMiss()
+        state = self.index.getState()
+        self.assertEqual((state.hits, state.misses), (4, 1))
+        self.index.removeCachedFiles(['d'])
+        self.index.addCachedFile('e', 5)
+        # c is the least recently used, then a and b were used after the other files were
+        # added, and e was just added. a and b have been used twice, c and e once, and b, then
+        # e, a and c are the largest files for the number of times they were used.
+        for policy, order in (('lru', 'cabe'), ('lfu', 'ceab'), ('size', 'beac')):
+            candidates = self.index.getEvictionCandidates(cacheEvictionPolicies[policy])
+            self.assertEqual(''.join(fileStoreID for fileStoreID, _ in candidates), order)
+        candidates = self.index.getEvictionCandidates(cacheEvictionPolicies['lru'])
+        self.assertEqual(next(candidates), ('c', 1))
+        candidates.close()
+        self.index.removeCachedFiles(['c'])
+        self.assertEqual(next(self.index.getEvictionCandidates('lastAccess')), ('a', 10))
+
+    @travis_test
+    def testLock(self):
+        """
+        The changes made while holding the cache lock are discarded if the operation fails, and
+        transactions in its scope are part of it.
+        """
+        with CachingFileStore._CacheLock(self.index) as lock:
+            self.index.adjust(cached=1, sigmaJob=1)
+            lock.release()
+            lock.acquire()
+            self.index.adjust(sigmaJob=1)
+        try:
+            with CachingFileStore._CacheLock(self.index):
+                self.index.adjust(cached=1, sigmaJob=1)
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        state = self.index.getState()
+        self.assertEqual((state.cached, state.sigmaJob), (1, 2))
+        # Another connection can't write while the lock is held, but it can read
+        with CachingFileStore._CacheLock(self.index):
+            self.index.adjust(cached=1)
+            other = CachingFileStore._CacheIndex(self.path)
+            other.timeout = 0.1
+            self.assertEqual(other.getState().cached, 1)
+            self.assertRaises(sqlite3.OperationalError, other.adjust, cached=1)
+            other.close()
+        self.assertEqual(self.index.getState().cached, 2)
+
+    @slow
+    def testContention(self):
+        """
+        Compare the time it takes N concurrent workers to account for cache hits in the cache
+        index, against a pickled state file under an exclusive lock, as the index replaced.
+        """
+        numReaders, numReads = 8, 100
+        stateFile = os.path.join(self._createTempDir(), '_cacheState')
+        with open(stateFile, 'wb') as f:
+            dill.dump(dict(total=1000, cached=0, sigmaJob=0, jobState={}), f)
+        results = {}
+        for name, target, path in (('index', _readWithIndex, self.path),
+                                   ('state file', _readWithStateFile, stateFile)):
+            readers = [multiprocessing.Process(target=target, args=(path, i, numReads))
+                       for i in range(numReaders)]
+            start = time.time()
+            for reader in readers:
+                reader.start()
+            for reader in readers:
+                reader.join()
+                self.assertEqual(reader.exitcode, 0)
+            results[name] = time.time() - start
+            logger.info('%i readers doing %i cache hits each with the %s took %.2fs, %.0fus '
+                        'per hit', numReaders, numReads, name, results[name],
+                        results[name] / (numReaders * numReads) * 1e6)
+        self.assertEqual(self.index.getState().sigmaJob, -numReaders * numReads)
+        self.assertEqual(len(self.index.getJobs()), numReaders)
+        self.assertLess(results['index'], results['state file'])
+
+    @slow
+    def testEvictionBenchmark(self):
+        """
+        Compare the time it takes to find the first files to evict in a cache of 100k files
+        with the index, against listing the cache and sorting the files by modification time.
+        """
+        numFiles, numEvicted = 100000, 10
+        cacheDir = self._createTempDir()
+        for i in range(numFiles):
+            open(os.path.join(cacheDir, 'file%i' % i), 'w').close()
+        self.index.setCachedFiles([('file%i' % i, 0, i) for i in range(numFiles)])
+        start = time.time()
+        candidates = self.index.getEvictionCandidates(cacheEvictionPolicies['lru'])
+        evicted = [fileStoreID for fileStoreID, _ in itertools.islice(candidates, numEvicted)]
+        candidates.close()
+        indexTime = time.time() - start
+        start = time.time()
+        allCacheFiles = [(x, os.stat(os.path.join(cacheDir, x))) for x in os.listdir(cacheDir)]
+        sorted(allCacheFiles, key=lambda x: (x[1].st_mtime, x[1].st_size))[:numEvicted]
+        listingTime = time.time() - start
+        logger.info('Finding %i files to evict among %i took %.4fs with the index, %.4fs by '
+                    'listing the cache', numEvicted, numFiles, indexTime, listingTime)
+        self.assertEqual(evicted, ['file%i' % i for i in range(numEvicted)])
+        self.assertLess(indexTime, listingTime)
+
+
+def _readWithIndex(path, reader, numReads):
+    """
+    Account for cache hits in the cache index, like CachingFileStore.readGlobalFile does.
+    """
+    index = CachingFileStore._CacheIndex(path)
+    jobID = 'job%i' % reader
+    with CachingFileStore._CacheLock(index):
+        index.addJob(CachingFileStore._JobState(jobID=jobID, jobName=jobID, jobReqs=numReads,
+                                                jobDir='/' + jobID, pid=os.getpid()))
+    for i in range(numReads):
+        localFilePath = '/%s/%i' % (jobID, i)
+        index.getJobFilePaths(jobID)
+        with CachingFileStore._CacheLock(index):
+            index.adjust(sigmaJob=-1)
+            index.getState().isBalanced()
+            index.addJobFile(jobID, 'file%i' % i, localFilePath, 1, True)
+    index.close()
+
+
+def _readWithStateFile(path, reader, numReads):
+    """
+    Account for the same cache hits as _readWithIndex in a pickled state file, reading and
+    rewriting all of it under an exclusive lock for each change.
+    """
+    jobID = 'job%i' % reader
+
+    def update(change):
+        with open(path + '.lock', 'w') as lock:
+            flock(lock, LOCK_EX)
+            with open(path, 'rb') as f:
+                state = dill.load(f)
+            change(state)
+            with open(path + '.tmp%i' % reader, 'wb') as f:
+                dill.dump(state, f)
+            os.rename(path + '.tmp%i' % reader, path)
+
+    def addJob(state):
+        state['jobState'][jobID] = dict(jobReqs=numReads, jobDir='/' + jobID, pid=os.getpid(),
+                                        jobSpecificFiles={}, filesToFSIDs={})
+
+    update(addJob)
+    for i in range(numReads):
+        localFilePath = '/%s/%i' % (jobID, i)
+
+        def addFile(state):
+            state['sigmaJob'] -= 1
+            jobState = state['jobState'][jobID]
+            jobState['jobSpecificFiles']['file%i' % i] = {localFilePath: 1}
+            jobState['filesToFSIDs'][localFilePath] = {'file%i' % i}
+            jobState['jobReqs'] -= 1
+
+        with open(path, 'rb') as f:
+            list(dill.load(f)['jobState'][jobID]['filesToFSIDs'].keys())
+        update(addFile)
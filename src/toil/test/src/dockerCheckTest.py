@@ -13,8 +13,10 @@
 # limitations under the License.
 
 from __future__ import absolute_import, print_function
-from toil.test import ToilTest, needs_appliance
-from toil import checkDockerImageExists, parseDockerAppliance
+from mock import MagicMock, patch
+from toil.test import ToilTest, needs_appliance, travis_test
+from toil import (ApplianceImageNotFound, checkDockerImageExists, parseDockerAppliance,
+                  requestCheckRegularDocker)
 from docker.errors import ImageNotFound
 
 # requires internet
@@ -99,3 +101,18 @@ class dockerCheckTests(ToilTest):
                              ['quay.io', 'ucsc_cgl/toil', 'latest'],
                              ['gcr.io', 'google-containers/busybox', 'latest']]
         assert parsings == expected_parsings
+
+
+class ApplianceImageNotFoundTest(ToilTest):
+    """
+    Tests the error raised for an appliance image whose manifest can't be retrieved.
+    """
+    @travis_test
+    def testCatchable(self):
+        """The error can be caught as Toil's error and as docker's."""
+        response = MagicMock(ok=False, status_code=404)
+        with patch('requests.head', return_value=response):
+            for errorClass in (ApplianceImageNotFound, ImageNotFound, RuntimeError):
+                with self.assertRaises(errorClass):
+                    requestCheckRegularDocker('quay.io/ucsc_cgl/toil:---', 'quay.io',
+                                              'ucsc_cgl/toil', '---')
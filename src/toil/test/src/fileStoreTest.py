@@ -23,11 +23,13 @@ from abc import abstractmethod, ABCMeta
 from struct import pack, unpack
 from uuid import uuid4
 
+from toil.common import Toil
 from toil.job import Job
 from toil.fileStores.cachingFileStore import IllegalDeletionCacheError, CacheUnbalancedError, CachingFileStore
 from toil.test import ToilTest, needs_aws, needs_azure, needs_google, slow, travis_test
 from toil.leader import FailedJobsException
 from toil.jobStores.abstractJobStore import NoSuchFileException
+from toil.utils.toilStats import getStats
 
 import collections
 import inspect
@@ -236,9 +238,9 @@ class hidden(object):
         @slow
         def testCacheLockRace(self):
             """
-            Make 3 jobs compete for the same cache lock file.  If they have the lock at the same
-            time, the test will fail.  This test abuses the _CacheState class and modifies values in
-            the lock file.  DON'T TRY THIS AT HOME.
+            Make 3 jobs compete for the same cache lock.  If they have the lock at the same
+            time, the test will fail.  This test abuses the cache index and modifies values in
+            it.  DON'T TRY THIS AT HOME.
             """
             A = Job.wrapJobFn(self._setUpLockFile)
             B = Job.wrapJobFn(self._selfishLocker, cores=1)
@@ -259,9 +261,7 @@ class hidden(object):
             Set nlink=0 for the cache test
             """
             with job.fileStore.cacheLock():
-                cacheInfo = job.fileStore._CacheState._load(job.fileStore.cacheStateFile)
-                cacheInfo.nlink = 0
-                cacheInfo.write(job.fileStore.cacheStateFile)
+                job.fileStore.cacheIndex.setProperties(nlink=0)
 
         @staticmethod
         def _selfishLocker(job):
@@ -271,15 +271,14 @@ class hidden(object):
             """
             for i in range(0, 1000):
                 with job.fileStore.cacheLock():
-                    cacheInfo = job.fileStore._CacheState._load(job.fileStore.cacheStateFile)
-                    cacheInfo.nlink += 1
-                    cacheInfo.cached = max(cacheInfo.nlink, cacheInfo.cached)
-                    cacheInfo.write(job.fileStore.cacheStateFile)
+                    cacheInfo = job.fileStore.cacheIndex.getState()
+                    job.fileStore.cacheIndex.setProperties(
+                        nlink=cacheInfo.nlink + 1,
+                        cached=max(cacheInfo.nlink + 1, cacheInfo.cached))
                 time.sleep(0.001)
                 with job.fileStore.cacheLock():
-                    cacheInfo = job.fileStore._CacheState._load(job.fileStore.cacheStateFile)
-                    cacheInfo.nlink -= 1
-                    cacheInfo.write(job.fileStore.cacheStateFile)
+                    cacheInfo = job.fileStore.cacheIndex.getState()
+                    job.fileStore.cacheIndex.setProperties(nlink=cacheInfo.nlink - 1)
 
         @staticmethod
         def _raceTestSuccess(job):
@@ -287,7 +286,7 @@ class hidden(object):
             Assert that the cache test passed successfully.
             """
             with job.fileStore.cacheLock():
-                cacheInfo = job.fileStore._CacheState._load(job.fileStore.cacheStateFile)
+                cacheInfo = job.fileStore.cacheIndex.getState()
                 # Value of the nlink has to be zero for successful run
                 assert cacheInfo.nlink == 0
                 assert cacheInfo.cached > 1
@@ -427,21 +426,18 @@ class hidden(object):
         @staticmethod
         def _forceModifyCacheLockFile(job, newTotalMB):
             """
-            This function opens and modifies the cache lock file to reflect a new "total"
-            value = newTotalMB and thereby fooling the cache logic into believing only newTotalMB is
-            allowed for the run.
+            This function modifies the cache index to reflect a new "total" value = newTotalMB
+            and thereby fooling the cache logic into believing only newTotalMB is allowed for the
+            run.
 
-            :param int newTotalMB: New value for "total" in the cacheLockFile
+            :param int newTotalMB: New value for "total" in the cache index
             """
-            with job.fileStore.cacheLock() as _:
-                cacheInfo = job.fileStore._CacheState._load(job.fileStore.cacheStateFile)
-                cacheInfo.total = float(newTotalMB * 1024 * 1024)
-                cacheInfo.write(job.fileStore.cacheStateFile)
+            job.fileStore.cacheIndex.setProperties(total=float(newTotalMB * 1024 * 1024))
 
         @staticmethod
         def _probeJobReqs(job, total=None, cached=None, sigmaJob=None):
             """
-            Probes the cacheLockFile to ensure the values for total, disk and cache are as expected.
+            Probes the cache index to ensure the values for total, disk and cache are as expected.
             Can also specify combinations of the requirements if desired.
 
             :param int total: Expected Total Space available for caching in MB.
@@ -450,8 +446,8 @@ class hidden(object):
             """
             valueDict = locals()
             assert (total or cached or sigmaJob)
-            with job.fileStore.cacheLock() as x:
-                cacheInfo = job.fileStore._CacheState._load(job.fileStore.cacheStateFile)
+            with job.fileStore.cacheLock():
+                cacheInfo = job.fileStore.cacheIndex.getState()
                 for value in ('total', 'cached', 'sigmaJob'):
                     # If the value wasn't provided, it is None and should be ignored
                     if valueDict[value] is None:
@@ -465,7 +461,7 @@ class hidden(object):
         def testAsyncWriteWithCaching(self):
             """
             Ensure the Async Writing of files happens as expected.  The first Job forcefully
-            modifies the cache lock file to 1GB. The second asks for 1GB of disk and  writes a 900MB
+            modifies the cache index to 1GB. The second asks for 1GB of disk and  writes a 900MB
             file into cache then rewrites it to the job store triggering an async write since the
             two unique jobstore IDs point to the same local file.  Also, the second write is not
             cached since the first was written to cache, and there "isn't enough space" to cache the
@@ -496,10 +492,10 @@ class hidden(object):
             :return: Job store file ID for second written file
             """
             # Make this take longer so we can test asynchronous writes across jobs/workers.
-            oldHarbingerFileRead = job.fileStore.HarbingerFile.read
-            def newHarbingerFileRead(self):
+            oldHarbingerFileDelete = job.fileStore.HarbingerFile.delete
+            def newHarbingerFileDelete(self):
                 time.sleep(5)
-                return oldHarbingerFileRead(self)
+                return oldHarbingerFileDelete(self)
 
             job.fileStore.logToMaster('Double writing a file into job store')
             work_dir = job.fileStore.getLocalTempDir()
@@ -510,7 +506,7 @@ class hidden(object):
             fsID = job.fileStore.writeGlobalFile(testFile.name)
             hidden.AbstractCachingFileStoreTest._readFromJobStoreWithoutAssertions(job, fsID)
             # Make this take longer so we can test asynchronous writes across jobs/workers.
-            job.fileStore.HarbingerFile.read = newHarbingerFileRead
+            job.fileStore.HarbingerFile.delete = newHarbingerFileDelete
             return job.fileStore.writeGlobalFile(testFile.name)
 
         @staticmethod
@@ -527,6 +523,100 @@ class hidden(object):
             assert job.fileStore.HarbingerFile(job.fileStore, fileStoreID=fsID).exists()
             job.fileStore.readGlobalFile(fsID)
 
+        @travis_test
+        def testAsyncUploadStats(self):
+            """
+            Write the same local file to the job store several times, which uploads all but the
+            first copy in the background, and ensure the uploads are reported with the stats of
+            the worker.
+            """
+            self.options.stats = True
+            self.options.clean = 'never'
+            self.options.maxParallelUploads = 2
+            A = Job.wrapJobFn(self._writeFileRepeatedly, fileMB=2, times=4)
+            with Toil(self.options) as toil:
+                toil.start(A)
+            jobStore = Toil.resumeJobStore(self.options.jobStore)
+            try:
+                stats = getStats(jobStore)
+            finally:
+                jobStore.destroy()
+            uploads = [worker.uploads for worker in getattr(stats, 'workers', [])
+                       if 'uploads' in worker]
+            self.assertEqual(len(uploads), 1)
+            files = int(uploads[0]['files'])
+            self.assertGreaterEqual(files, 3)
+            self.assertEqual(int(uploads[0]['bytes']), files * 2 * 1024 * 1024)
+            self.assertGreater(float(uploads[0]['throughput']), 0)
+            self.assertGreaterEqual(int(uploads[0]['maxQueueDepth']), 0)
+
+        @staticmethod
+        def _writeFileRepeatedly(job, fileMB, times):
+            """
+            Write a local file to the job store the given number of times.
+
+            :param int fileMB: File Size
+            :param int times: The number of times to write the file
+            """
+            work_dir = job.fileStore.getLocalTempDir()
+            with open(os.path.join(work_dir, str(uuid4())), 'wb') as testFile:
+                testFile.write(os.urandom(fileMB * 1024 * 1024))
+            for _ in range(times):
+                job.fileStore.writeGlobalFile(testFile.name)
+
+        @travis_test
+        def testPrefetchInputFiles(self):
+            """
+            Write a file that isn't cached and pass it to a child as an argument, and to a
+            follow-on as a promise. The worker downloads the file into the cache for both before
+            they read it.
+            """
+            workdir = self._createTempDir(purpose='nonLocalDir')
+            A = Job.wrapJobFn(self._writeFileAndReadItInSuccessors, nonLocalDir=workdir)
+            B = Job.wrapJobFn(self._assertPrefetched, A.rv())
+            A.addFollowOn(B)
+            Job.Runner.startToil(A, self.options)
+
+        @staticmethod
+        def _writeFileAndReadItInSuccessors(job, nonLocalDir):
+            """
+            Write a file that isn't cached to the job store and add a child reading it.
+
+            :param str nonLocalDir: A dir to write the file to
+            :return: Job store file ID for the file
+            """
+            cls = hidden.AbstractNonCachingFileStoreTest
+            fsID, _ = cls._writeFileToJobStore(job, isLocalFile=False, nonLocalDir=nonLocalDir)
+            assert not job.fileStore._fileIsCached(fsID)
+            # The child removes the file from the cache again, so that the follow-on has to
+            # download it too
+            job.addChildJobFn(hidden.AbstractCachingFileStoreTest._assertPrefetched, [fsID],
+                              delete=True)
+            return fsID
+
+        @staticmethod
+        def _assertPrefetched(job, fsIDs, delete=False):
+            """
+            Ensure the given files are cached, or being downloaded into the cache, and read them.
+
+            :param fsIDs: Job store file ID for the file, or a list of those
+            :param bool delete: Whether to delete the file from the cache after reading it
+            """
+            if not isinstance(fsIDs, list):
+                fsIDs = [fsIDs]
+            for fsID in fsIDs:
+                # Nothing but the worker prefetching the file downloads it before it is read
+                harbingerFile = job.fileStore.HarbingerFile(job.fileStore, fileStoreID=fsID)
+                timeout = time.time() + 60
+                while not (job.fileStore._fileIsCached(fsID) or harbingerFile.exists()):
+                    assert time.time() < timeout
+                    time.sleep(0.1)
+                job.fileStore.readGlobalFile(fsID)
+                assert job.fileStore._fileIsCached(fsID)
+                if delete:
+                    job.fileStore.deleteLocalFile(fsID)
+                    job.fileStore.removeSingleCachedFile(fsID)
+
         # writeGlobalFile tests
         
         @travis_test
@@ -601,6 +691,10 @@ class hidden(object):
                                                        mutable=False)
                 expected = x + 1
             else:
+                # The worker may have downloaded the file ahead of time, make sure it is a miss
+                job.fileStore._stopPrefetching()
+                if job.fileStore._fileIsCached(fsID):
+                    job.fileStore.removeSingleCachedFile(fsID)
                 if cacheReadFile:
                     outfile = job.fileStore.readGlobalFile(fsID, '/'.join([work_dir, 'temp']),
                                                            cache=True, mutable=False)
@@ -632,10 +726,10 @@ class hidden(object):
         def testMultipleJobsReadSameCacheHitGlobalFile(self):
             """
             Write a local file to the job store (hence adding a copy to cache), then have 10 jobs
-            read it.  Assert cached file size in the cache lock file never goes up, assert sigma job
+            read it.  Assert cached file size in the cache index never goes up, assert sigma job
             reqs is always
                    (a multiple of job reqs) - (number of files linked to the cachedfile * filesize).
-            At the end, assert the cache lock file shows sigma job = 0.
+            At the end, assert the cache index shows sigma job = 0.
             """
             self._testMultipleJobsReadGlobalFileFunction(cacheHit=True)
 
@@ -643,10 +737,10 @@ class hidden(object):
         def testMultipleJobsReadSameCacheMissGlobalFile(self):
             """
             Write a non-local file to the job store(hence no cached copy), then have 10 jobs read
-            it. Assert cached file size in the cache lock file never goes up, assert sigma job reqs
+            it. Assert cached file size in the cache index never goes up, assert sigma job reqs
             is always
                    (a multiple of job reqs) - (number of files linked to the cachedfile * filesize).
-            At the end, assert the cache lock file shows sigma job = 0.
+            At the end, assert the cache index shows sigma job = 0.
             """
             self._testMultipleJobsReadGlobalFileFunction(cacheHit=False)
 
@@ -687,7 +781,7 @@ class hidden(object):
             :param int diskMB: disk requirements provided to the job
             :param str fsID: job store file ID
             :param str maxWriteFile: path to file where the max number of concurrent readers of
-                                     cache lock file will be written
+                                     the cached file will be written
             """
             work_dir = job.fileStore.getLocalTempDir()
             outfile = job.fileStore.readGlobalFile(fsID, '/'.join([work_dir, 'temp']), cache=True,
@@ -702,7 +796,7 @@ class hidden(object):
                     x.seek(0)
                     x.truncate()
                     x.write(str(max(prev_max, fileNlinks)))
-                cacheInfo = job.fileStore._CacheState._load(job.fileStore.cacheStateFile)
+                cacheInfo = job.fileStore.cacheIndex.getState()
                 if cacheInfo.nlink == 2:
                     assert cacheInfo.cached == 0.0  # Since fileJobstore on same filesystem
                 else:
@@ -734,7 +828,7 @@ class hidden(object):
         def testReturnFileSizes(self):
             """
             Write a couple of files to the jobstore.  Delete a couple of them.  Read back written
-            and locally deleted files.  Ensure that after every step that the cache state file is
+            and locally deleted files.  Ensure that after every step that the cache index is
             describing the correct values.
             """
             workdir = self._createTempDir(purpose='nonLocalDir')
@@ -749,7 +843,7 @@ class hidden(object):
         def testReturnFileSizesWithBadWorker(self):
             """
             Write a couple of files to the jobstore.  Delete a couple of them.  Read back written
-            and locally deleted files.  Ensure that after every step that the cache state file is
+            and locally deleted files.  Ensure that after every step that the cache index is
             describing the correct values.
             """
             self.options.retryCount = 20
@@ -767,7 +861,7 @@ class hidden(object):
         def _returnFileTestFn(job, jobDisk, initialCachedSize, nonLocalDir, numIters=100):
             """
             Aux function for jobCacheTest.testReturnFileSizes Conduct numIters operations and ensure
-            the cache state file is tracked appropriately.
+            the cache index is tracked appropriately.
 
             Track the cache calculations even thought they won't be used in filejobstore
 
@@ -854,25 +948,27 @@ class hidden(object):
         @staticmethod
         def _requirementsConcur(job, jobDisk, cached):
             """
-            Assert the values for job disk and total cached file sizes tracked in the job's cache
-            state file is equal to the values we expect.
+            Assert the values for job disk and total cached file sizes tracked in the cache
+            index are equal to the values we expect.
             """
-            with job.fileStore._CacheState.open(job.fileStore) as cacheInfo:
-                jobState = cacheInfo.jobState[job.fileStore.jobID]
+            with job.fileStore.cacheLock():
+                cacheInfo = job.fileStore.cacheIndex.getState()
+                jobState, = [jobState for jobState in job.fileStore.cacheIndex.getJobs()
+                             if jobState.jobID == job.fileStore.jobID]
                 # cached should have a value only if the job store is on a different file system
                 # than the cache
                 if cacheInfo.nlink != 2:
                     assert cacheInfo.cached == cached
                 else:
                     assert cacheInfo.cached == 0
-            assert jobState['jobReqs'] == jobDisk
+            assert jobState.jobReqs == jobDisk
 
         # Testing the resumability of a failed worker
         @slow
         def testControlledFailedWorkerRetry(self):
             """
             Conduct a couple of job store operations.  Then die.  Ensure that the restarted job is
-            tracking values in the cache state file appropriately.
+            tracking values in the cache index appropriately.
             """
             workdir = self._createTempDir(purpose='nonLocalDir')
             self.options.retryCount = 1
@@ -0,0 +1,108 @@
+# Copyright (C) 2015-2019 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+import logging
+import os
+import sys
+
+from toil import subprocess, toilPackageDirPath
+from toil.test import ToilTest, travis_test
+
+logger = logging.getLogger(__name__)
+
+
+class ImportTimeTest(ToilTest):
+    """
+    Tests the time it takes to import the entry points, which every worker process pays for.
+    """
+    # Modules that are expensive to import and only needed by some commands, or not at all by
+    # running a job. Boto is patched when Toil is imported, see toil._monkey_patch_boto.
+    lazyModules = ['requests', 'docker', 'pytest', 'toil.test', 'toil.provisioners', 'toil.cwl',
+                   'toil.wdl', 'boto3', 'pytz']
+
+    # The time, in seconds, that importing the worker may take. This is several times what it
+    # takes on a development machine, to allow for slow test machines.
+    workerImportBudget = 1.0
+
+    @staticmethod
+    def _run(args):
+        """
+        Run the interpreter with the given arguments, with Toil on the module search path.
+
+        :rtype: str
+        """
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+            [os.path.dirname(toilPackageDirPath())] + sys.path))
+        output = subprocess.check_output([sys.executable] + args,
+                                         stderr=subprocess.STDOUT, env=env)
+        return output.decode('utf-8')
+
+    def _importTime(self, moduleName):
+        """
+        Import the given module in a fresh interpreter.
+
+        :return: the time, in seconds, the import took
+        :rtype: float
+        """
+        output = self._run(['-c', 'import time; start = time.time(); import %s; '
+                                  'print(time.time() - start)' % moduleName])
+        return float(output.split()[-1])
+
+    def _importedModules(self, moduleName):
+        """
+        Import the given module in a fresh interpreter.
+
+        :return: the names of the modules imported along with it
+        :rtype: set[str]
+        """
+        output = self._run(['-c', 'import sys; import %s; print(" ".join(sys.modules))'
+                                  % moduleName])
+        return set(output.split())
+
+    def _importTimes(self, moduleName):
+        """
+        Import the given module in a fresh interpreter. Requires Python 3.7.
+
+        :return: the cumulative time, in seconds, spent importing each module, by module name
+        :rtype: dict[str,float]
+        """
+        output = self._run(['-X', 'importtime', '-c', 'import ' + moduleName])
+        importTimes = {}
+        for line in output.splitlines():
+            # import time: self [us] | cumulative | imported package
+            if line.startswith('import time:') and not line.endswith('imported package'):
+                _, cumulative, name = line[len('import time:'):].split('|')
+                importTimes[name.strip()] = int(cumulative) / 1e6
+        return importTimes
+
+    def _assertLazy(self, moduleName):
+        importedModules = self._importedModules(moduleName)
+        self.assertEqual([m for m in self.lazyModules if m in importedModules], [])
+
+    @travis_test
+    def testWorker(self):
+        # The first import may compile the modules
+        importTime = min(self._importTime('toil.worker') for _ in range(3))
+        logger.info('Importing the worker took %.3fs', importTime)
+        if importTime >= self.workerImportBudget and sys.version_info >= (3, 7):
+            importTimes = self._importTimes('toil.worker')
+            slowest = sorted(importTimes, key=importTimes.get, reverse=True)[:20]
+            logger.error('The slowest imports were:\n%s',
+                         '\n'.join('%.3fs %s' % (importTimes[m], m) for m in slowest))
+        self.assertLess(importTime, self.workerImportBudget)
+        self._assertLazy('toil.worker')
+
+    @travis_test
+    def testToilCommand(self):
+        self._assertLazy('toil.utils.toilMain')
@@ -13,13 +13,19 @@
 # limitations under the License.
 
 from __future__ import absolute_import
+import logging
 import os
+import pickle
+import timeit
+import uuid
 from argparse import ArgumentParser
 from toil.common import Toil
-from toil.job import Job
-from toil.test import ToilTest, travis_test
+from toil.job import Job, JobNode, ServiceJobNode
+from toil.test import ToilTest, travis_test, slow
 from toil.jobGraph import JobGraph
 
+logger = logging.getLogger(__name__)
+
 class JobGraphTest(ToilTest):
     
     def setUp(self):
@@ -80,3 +86,166 @@ class JobGraphTest(ToilTest):
         self.assertNotEqual(j, j2)
         
         ###TODO test other functionality
+
+
+class JobGraphSerializationTest(ToilTest):
+
+    @staticmethod
+    def _makeJobGraph(numSuccessors=10):
+        def jobNode():
+            return JobNode(requirements=dict(memory=2**30, cores=1, disk=2**31, preemptable=True),
+                           jobName='SomeJob', unitName='someUnit',
+                           jobStoreID='job' + str(uuid.uuid4()),
+                           command='_toil %s /tmp/jobStore False' % uuid.uuid4())
+        jobGraph = JobGraph(command='_toil %s /tmp/jobStore False' % uuid.uuid4(),
+                            memory=2**30, cores=2.5, disk=2**31, preemptable=False,
+                            unitName='someUnit', jobName='SomeJob',
+                            jobStoreID='job' + str(uuid.uuid4()),
+                            remainingRetryCount=1, predecessorNumber=2,
+                            filesToDelete=['a', 'b'], chainedJobs=['SomeJob'])
+        jobGraph.predecessorsFinished = {'job1', 'job2'}
+        jobGraph.stack = [[jobNode() for _ in range(numSuccessors)], [jobNode()]]
+        jobGraph.services = [[ServiceJobNode(jobStoreID='service', memory=1, cores=1, disk=1,
+                                             preemptable=None, startJobStoreID='start',
+                                             terminateJobStoreID='terminate',
+                                             errorJobStoreID='error', unitName=None,
+                                             jobName='SomeService', command=None,
+                                             predecessorNumber=1)]]
+        return jobGraph
+
+    def _assertSameJobGraph(self, jobGraph, decoded):
+        self.assertIs(type(decoded), type(jobGraph))
+        self.assertEqual(decoded.__getstate__(), jobGraph.__getstate__())
+
+    @travis_test
+    def testRoundTrip(self):
+        jobGraph = self._makeJobGraph()
+        data = jobGraph.serialize()
+        self.assertTrue(data.startswith(JobGraph.encodingMagic))
+        self._assertSameJobGraph(jobGraph, JobGraph.deserialize(data))
+
+    @travis_test
+    def testPriority(self):
+        jobGraph = self._makeJobGraph()
+        jobGraph.priority = 2
+        jobGraph.stack[0][0].priority = -1.5
+        jobGraph.services[0][0].priority = 1
+        decoded = JobGraph.deserialize(jobGraph.serialize())
+        self._assertSameJobGraph(jobGraph, decoded)
+        self.assertEqual(decoded.priority, 2)
+        self.assertEqual([jobNode.priority for jobNode in decoded.stack[0][:2]], [-1.5, None])
+        self.assertEqual(decoded.services[0][0].priority, 1)
+
+    @travis_test
+    def testInputFileIDs(self):
+        jobGraph = self._makeJobGraph()
+        self.assertEqual(jobGraph.inputFileIDs, ())
+        jobGraph.inputFileIDs = [('file1', 5), ('file2', 0)]
+        decoded = JobGraph.deserialize(jobGraph.serialize())
+        self._assertSameJobGraph(jobGraph, decoded)
+        self.assertEqual([tuple(fileID) for fileID in decoded.inputFileIDs],
+                         [('file1', 5), ('file2', 0)])
+
+    @travis_test
+    def testSnapshot(self):
+        jobGraph = self._makeJobGraph()
+        snapshot = jobGraph.snapshot()
+        self._assertSameJobGraph(jobGraph, snapshot)
+        state = snapshot.__getstate__()
+        # Change the job graph the way the worker does between jobs
+        jobGraph.stack[-1].pop()
+        jobGraph.stack.pop()
+        jobGraph.services[0].pop()
+        jobGraph.filesToDelete.append('c')
+        jobGraph.predecessorsFinished.add('job3')
+        jobGraph.command = None
+        self.assertEqual(snapshot.__getstate__(), state)
+
+    @travis_test
+    def testPickleCompatibility(self):
+        jobGraph = self._makeJobGraph()
+        data = pickle.dumps(jobGraph, protocol=pickle.HIGHEST_PROTOCOL)
+        self._assertSameJobGraph(jobGraph, JobGraph.deserialize(data))
+
+    @travis_test
+    def testPickleFallback(self):
+        jobGraph = self._makeJobGraph()
+        jobGraph.stack.append((self._makeJobGraph(),))
+        data = jobGraph.serialize()
+        self.assertFalse(data.startswith(JobGraph.encodingMagic))
+        self.assertEqual(JobGraph.deserialize(data).stack[-1][0].jobStoreID,
+                         jobGraph.stack[-1][0].jobStoreID)
+
+    @travis_test
+    def testUnknownVersion(self):
+        data = bytearray(self._makeJobGraph().serialize())
+        data[len(JobGraph.encodingMagic)] = JobGraph.encodingVersion + 1
+        self.assertRaises(ValueError, JobGraph.deserialize, bytes(data))
+
+    @slow
+    def testBenchmark(self):
+        """
+        Compare the time taken to encode and decode a job graph, and the size of the resulting
+        record, against pickling.
+        """
+        number = 2000
+        for numSuccessors in (0, 10, 100):
+            jobGraph = self._makeJobGraph(numSuccessors)
+            data = jobGraph.serialize()
+            pickled = pickle.dumps(jobGraph, protocol=pickle.HIGHEST_PROTOCOL)
+            results = dict(
+                encode=timeit.timeit(jobGraph.serialize, number=number),
+                decode=timeit.timeit(lambda: JobGraph.deserialize(data), number=number),
+                pickle=timeit.timeit(lambda: pickle.dumps(jobGraph, protocol=pickle.HIGHEST_PROTOCOL),
+                                     number=number),
+                unpickle=timeit.timeit(lambda: pickle.loads(pickled), number=number))
+            logger.info('%i successors: %i bytes encoded vs %i bytes pickled; '
+                        'encode %.1fus, decode %.1fus, pickle %.1fus, unpickle %.1fus per record',
+                        numSuccessors, len(data), len(pickled),
+                        *(results[k] / number * 1e6 for k in ('encode', 'decode', 'pickle', 'unpickle')))
+            self.assertLess(len(data), len(pickled))
+
+
+class JobNodeMemoryTest(ToilTest):
+
+    @staticmethod
+    def _makeJobNode(i):
+        return JobNode(requirements=dict(memory=2**30, cores=1, disk=2**31, preemptable=True),
+                       jobName=''.join(['Some', 'Job']), unitName=''.join(['some', 'Unit']),
+                       jobStoreID='job%i' % i, command='_toil job%i /tmp/jobStore False' % i)
+
+    @travis_test
+    def testSlotsAndInterning(self):
+        jobNode, otherJobNode = self._makeJobNode(0), self._makeJobNode(1)
+        self.assertFalse(hasattr(jobNode, '__dict__'))
+        self.assertIs(jobNode.jobName, otherJobNode.jobName)
+        self.assertIs(jobNode.unitName, otherJobNode.unitName)
+        # Job graphs pickled before the attributes were moved to slots must still be readable
+        state = jobNode.__getstate__()
+        restored = JobNode.__new__(JobNode)
+        restored.__setstate__(dict(state, jobName=''.join(['Some', 'Job'])))
+        self.assertEqual(restored, jobNode)
+        self.assertIs(restored.jobName, jobNode.jobName)
+        self.assertEqual(pickle.loads(pickle.dumps(jobNode, protocol=2)), jobNode)
+
+    @slow
+    def testMemoryBenchmark(self):
+        """
+        Measure the memory used by a graph of one million job nodes, as held by the leader.
+        """
+        try:
+            import tracemalloc
+        except ImportError:
+            self.skipTest('tracemalloc is not available')
+        numJobs = 1000000
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            jobNodes = [self._makeJobNode(i) for i in range(numJobs)]
+            used = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+        logger.info('%i job nodes use %i MiB, %i bytes per node',
+                    len(jobNodes), used // 2**20, used // numJobs)
+        # The attributes alone would take more than that if held in a dictionary per instance
+        self.assertLess(used // numJobs, 400)
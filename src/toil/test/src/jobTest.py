@@ -27,6 +27,7 @@ import random
 from six.moves import xrange
 
 from toil.common import Toil
+from toil.fileStores import FileID
 from toil.leader import FailedJobsException
 from toil.lib.bioio import getTempFile
 from toil.job import Job, JobGraphDeadlockException, JobFunctionWrappingJob
@@ -601,6 +602,18 @@ class JobTest(ToilTest):
 
         return jobs[0]
 
+    @travis_test
+    def testInputFileIDs(self):
+        """
+        Tests that the files a job will read are the ones declared with addInputFiles followed by
+        those found in its arguments, each listed once.
+        """
+        a, b, c, d = (FileID(fileID, 1) for fileID in 'abcd')
+        job = Job.wrapJobFn(inputFilesJobFn, [a, (b, a)], {'k': c, 'l': 'notAFile'})
+        job.addInputFiles(d, a)
+        self.assertEqual([str(fileID) for fileID in job._getInputFileIDs()], ['d', 'a', 'c', 'b'])
+        self.assertEqual(Job()._getInputFileIDs(), [])
+
     def isAcyclic(self, adjacencyList):
         """
         Returns true if there are any cycles in the graph, which is represented as an adjacency
@@ -624,6 +637,9 @@ class JobTest(ToilTest):
                 return False
         return True
 
+def inputFilesJobFn(job, fileIDs, fileIDsByName):
+    pass
+
 def simpleJobFn(job, value):
     job.fileStore.logToMaster(value)
 
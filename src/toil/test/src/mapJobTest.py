@@ -0,0 +1,86 @@
+# Copyright (C) 2015-2019 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+import os
+
+from toil.job import Job, MapJob
+from toil.test import ToilTest, travis_test
+
+
+class MapJobTest(ToilTest):
+    """
+    Tests the MapJob class
+    """
+
+    def setUp(self):
+        super(MapJobTest, self).setUp()
+        self.options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+        self.options.logLevel = "INFO"
+
+    @travis_test
+    def testMap(self):
+        """
+        The results of a map job are those of the function for each item, in order, and each
+        chunk is run by a job of its own.
+        """
+        tempDir = self._createTempDir()
+        root = Job()
+        mapJob = root.addChildMap(recordPid, list(range(25)), tempDir, 1, chunkSize=10,
+                                  memory='100M', cores=0.1, disk='100M')
+        root.addFollowOnJobFn(check, mapJob.rv(), [(i, 1) for i in range(25)])
+        Job.Runner.startToil(root, self.options)
+        self.assertEqual(len(os.listdir(tempDir)), 3)
+
+    @travis_test
+    def testPromisedItems(self):
+        """
+        The items of a map job can be the promised return value of another job.
+        """
+        root = Job.wrapFn(numbers, 5)
+        mapJob = root.addFollowOnMap(square, root.rv())
+        mapJob.addFollowOnJobFn(check, mapJob.rv(), [0, 1, 4, 9, 16])
+        Job.Runner.startToil(root, self.options)
+
+    @travis_test
+    def testEmpty(self):
+        root = Job.wrapMap(square, [])
+        root.addFollowOnJobFn(check, root.rv(), [])
+        Job.Runner.startToil(root, self.options)
+
+    @travis_test
+    def testChunkSize(self):
+        self.assertEqual(Job.wrapMap(square, [])._chunkSize, MapJob.defaultChunkSize)
+        self.assertRaises(ValueError, Job.wrapMap, square, [], chunkSize=0)
+
+
+def numbers(n):
+    return list(range(n))
+
+
+def square(x):
+    return x * x
+
+
+def recordPid(item, dirPath, extra):
+    """
+    Records the given item in a file named after the pid of the process processing it, so that
+    the number of files is the number of chunk jobs.
+    """
+    with open(os.path.join(dirPath, str(os.getpid())), 'a') as f:
+        f.write('%i\n' % item)
+    return item, extra
+
+
+def check(job, results, expectedResults):
+    assert results == expectedResults, results
@@ -14,7 +14,10 @@
 
 from __future__ import absolute_import
 from builtins import range
+import multiprocessing
 import os
+import signal
+import time
 
 # Python 3 compatibility imports
 from six.moves import xrange
@@ -57,20 +60,72 @@ class ResumabilityTest(ToilTest):
             # store ID: n/t/jobwbijqL failed with exit value 1"
             self.assertTrue("failed with exit value" not in logString)
 
-def parent(job):
+    def testLeaderState(self):
+        """
+        Tests that a toil workflow whose leader is killed can be resumed from a snapshot of the
+        leader's state instead of rebuilding it from the job store.
+        """
+        options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+        options.logLevel = "INFO"
+        options.leaderStateInterval = 1
+        # The children run long enough for the leader to take a snapshot
+        root = Job.wrapJobFn(parent, childDelay=3, followOn=killLeader)
+        leader = multiprocessing.Process(target=startKilledLeader, args=(root, options))
+        leader.start()
+        leader.join()
+        self.assertEqual(leader.exitcode, -signal.SIGKILL)
+
+        options.restart = True
+        tempDir = self._createTempDir()
+        options.logFile = os.path.join(tempDir, "log.txt")
+        Job.Runner.startToil(root, options)
+        with open(options.logFile) as f:
+            logString = f.read()
+            self.assertTrue("Restored the state of" in logString)
+            self.assertTrue("failed with exit value" not in logString)
+
+    def testLeaderStateAfterFailure(self):
+        """
+        Tests that the snapshot of the leader's state isn't restored after jobs failed.
+        """
+        options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+        options.logLevel = "INFO"
+        options.retryCount = 0
+        options.leaderStateInterval = 1
+        root = Job.wrapJobFn(parent, childDelay=3)
+        with self.assertRaises(FailedJobsException):
+            Job.Runner.startToil(root, options)
+
+        options.restart = True
+        tempDir = self._createTempDir()
+        options.logFile = os.path.join(tempDir, "log.txt")
+        Job.Runner.startToil(root, options)
+        with open(options.logFile) as f:
+            logString = f.read()
+            self.assertTrue("Restored the state of" not in logString)
+            self.assertTrue("failed with exit value" not in logString)
+
+def startKilledLeader(root, options):
+    """
+    Runs the workflow, telling its jobs the PID of the leader so that killLeader() can kill it.
+    """
+    os.environ['TOIL_TEST_LEADER_PID'] = str(os.getpid())
+    Job.Runner.startToil(root, options)
+
+def parent(job, childDelay=0, followOn=None):
     """
     Set up a bunch of dummy child jobs, and a bad job that needs to be
     restarted as the follow on.
     """
     for _ in range(5):
-        job.addChildJobFn(goodChild)
-    job.addFollowOnJobFn(badChild)
+        job.addChildJobFn(goodChild, childDelay)
+    job.addFollowOnJobFn(followOn or badChild)
 
-def goodChild(job):
+def goodChild(job, delay=0):
     """
-    Does nothing.
+    Does nothing, after sleeping for the given number of seconds.
     """
-    return
+    time.sleep(delay)
 
 def badChild(job):
     """
@@ -83,3 +138,15 @@ def badChild(job):
         with job.fileStore.jobStore.writeSharedFileStream("alreadyRun", isProtected=False) as fileHandle:
             fileHandle.write("failed once\n")
             raise RuntimeError("this is an expected error")
+
+def killLeader(job):
+    """
+    Kills the leader the first time it's run, succeeds the second time.
+    """
+    try:
+        with job.fileStore.jobStore.readSharedFileStream("alreadyRun") as fileHandle:
+            fileHandle.read()
+    except NoSuchFileException:
+        with job.fileStore.jobStore.writeSharedFileStream("alreadyRun", isProtected=False) as fileHandle:
+            fileHandle.write(b"killed the leader once\n")
+        os.kill(int(os.environ['TOIL_TEST_LEADER_PID']), signal.SIGKILL)
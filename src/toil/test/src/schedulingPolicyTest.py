@@ -0,0 +1,169 @@
+# Copyright (C) 2015-2019 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+import os
+import time
+import uuid
+
+from toil.common import Config
+from toil.job import Job, JobNode
+from toil.schedulingPolicy import (CriticalPathSchedulingPolicy, JobIssueQueue,
+                                   PrioritySchedulingPolicy, addSchedulingPolicy,
+                                   schedulingPolicies)
+from toil.test import ToilTest, slow, travis_test
+
+
+def _jobNode(jobName, priority=None, jobStoreID=None):
+    return JobNode(requirements=dict(memory=1, cores=1, disk=1, preemptable=False),
+                   jobName=jobName, unitName=None, jobStoreID=jobStoreID or jobName,
+                   command=None, priority=priority)
+
+
+class RecordingSchedulingPolicy(PrioritySchedulingPolicy):
+    """Records the unit names of the jobs in the order they are issued."""
+    issued = []
+
+    def jobIssued(self, jobNode):
+        self.issued.append(jobNode.unitName)
+
+
+class SchedulingPolicyTest(ToilTest):
+
+    @staticmethod
+    def _drain(queue):
+        jobNames = []
+        while queue:
+            jobNames.append(queue.pop().jobName)
+        return jobNames
+
+    @travis_test
+    def testPriority(self):
+        queue = JobIssueQueue(PrioritySchedulingPolicy(Config()))
+        for jobName, priority in [('a', None), ('b', 1), ('c', -1), ('d', None), ('e', 1)]:
+            queue.push(_jobNode(jobName, priority))
+        self.assertEqual(len(queue), 5)
+        # Jobs of equal priority are issued in the order they were queued
+        self.assertEqual(self._drain(queue), ['b', 'e', 'a', 'd', 'c'])
+
+    @travis_test
+    def testCriticalPath(self):
+        policy = CriticalPathSchedulingPolicy(Config())
+        self.assertEqual(policy.getExpectedTime('long'), 0)
+        long, short = _jobNode('long'), _jobNode('short')
+        policy.jobIssued(long)
+        policy.jobIssued(short)
+        policy.jobRemoved(short)
+        time.sleep(0.1)
+        # Issuing a job again doesn't reset the time it was first issued
+        policy.jobIssued(long)
+        policy.jobRemoved(long)
+        self.assertTrue(policy.getExpectedTime('long') > policy.getExpectedTime('short'))
+        # Names that haven't completed yet are expected to take the average time
+        self.assertAlmostEqual(policy.getExpectedTime('new'),
+                               (policy.getExpectedTime('long')
+                                + policy.getExpectedTime('short')) / 2)
+
+        queue = JobIssueQueue(policy)
+        for jobName, priority in [('short', None), ('new', None), ('long', None), ('short', 1)]:
+            queue.push(_jobNode(jobName, priority))
+        # The user's priorities take precedence
+        self.assertEqual(self._drain(queue), ['short', 'long', 'new', 'short'])
+
+    @travis_test
+    def testPopWhere(self):
+        queue = JobIssueQueue(PrioritySchedulingPolicy(Config()))
+        for jobName, priority in [('a', None), ('b', 2), ('c', 1), ('d', None), ('e', 3)]:
+            queue.push(_jobNode(jobName, priority))
+        popped = []
+        for jobNode in queue.popWhere(lambda jobNode: jobNode.jobName in 'abd'):
+            popped.append(jobNode.jobName)
+            if len(popped) == 2:
+                break
+        self.assertEqual(popped, ['b', 'a'])
+        # The jobs that weren't admitted or reached keep their place
+        self.assertEqual(self._drain(queue), ['e', 'c', 'd'])
+
+    @travis_test
+    def testIssueOrder(self):
+        addSchedulingPolicy('recording', RecordingSchedulingPolicy)
+        try:
+            options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+            options.schedulingPolicy = 'recording'
+            root = Job()
+            for priority in (1, 3, None, 2):
+                root.addChildJobFn(fn, priority=priority, name=str(priority))
+            Job.Runner.startToil(root, options)
+        finally:
+            del schedulingPolicies['recording']
+        # The root is issued first, then its children
+        self.assertEqual(RecordingSchedulingPolicy.issued[1:5], ['3', '2', '1', 'None'])
+
+    def _runConcurrentJobs(self, **options):
+        """
+        Run eight short jobs, half of them named 'a' and half 'b' after the functions they run,
+        which can all run at the same time, with the given options limiting the number of jobs issued.
+
+        :return: the maximum number of jobs that ran at the same time, overall and by name
+        :rtype: tuple[int, dict[str,int]]
+        """
+        options_ = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+        options_.__dict__.update(options)
+        tempDir = self._createTempDir()
+        root = Job()
+        for i in range(8):
+            root.addChildJobFn((a, b)[i % 2], tempDir, cores=0.1, memory='10M', disk='10M')
+        Job.Runner.startToil(root, options_)
+        runTimes = []
+        for fileName in os.listdir(tempDir):
+            with open(os.path.join(tempDir, fileName)) as f:
+                jobName, start, end = f.read().split()
+                runTimes.append((jobName, float(start), float(end)))
+        self.assertEqual(len(runTimes), 8)
+
+        def maxConcurrent(runTimes):
+            # The number of jobs running right after each job starts
+            return max(sum(1 for _, start, end in runTimes if start <= s < end)
+                       for _, s, _ in runTimes)
+        return maxConcurrent(runTimes), {jobName: maxConcurrent([r for r in runTimes
+                                                                 if r[0] == jobName])
+                                         for jobName in 'ab'}
+
+    @slow
+    def testMaxIssuedJobs(self):
+        numConcurrent, _ = self._runConcurrentJobs(maxIssuedJobs=2)
+        self.assertTrue(numConcurrent <= 2)
+
+    @slow
+    def testMaxIssuedJobsPerName(self):
+        _, numConcurrentByName = self._runConcurrentJobs(maxIssuedJobsPerName=1)
+        self.assertEqual(numConcurrentByName, dict(a=1, b=1))
+
+
+def fn(job):
+    pass
+
+
+def recordRunTime(jobName, dirPath):
+    start = time.time()
+    time.sleep(1)
+    with open(os.path.join(dirPath, str(uuid.uuid4())), 'w') as f:
+        f.write('%s %r %r' % (jobName, start, time.time()))
+
+
+def a(job, dirPath):
+    recordRunTime('a', dirPath)
+
+
+def b(job, dirPath):
+    recordRunTime('b', dirPath)
@@ -0,0 +1,157 @@
+# Copyright (C) 2015-2019 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+import sys
+
+from toil.common import Config
+from toil.job import JobNode
+from toil.jobStores.fileJobStore import FileJobStore
+from toil.test import ToilTest, travis_test
+from toil.toilState import ToilState
+
+
+class ToilStateTest(ToilTest):
+    """Test building the leader's state from the job store."""
+    def setUp(self):
+        super(ToilStateTest, self).setUp()
+        path = self._getTestJobStorePath()
+        self.jobStore = FileJobStore(path)
+        self.config = Config()
+        self.config.jobStore = 'file:%s' % path
+        self.jobStore.initialize(self.config)
+
+    def tearDown(self):
+        self.jobStore.destroy()
+        super(ToilStateTest, self).tearDown()
+
+    def _createJob(self, command=None, predecessorNumber=1):
+        jobGraph = self.jobStore.create(JobNode(command='job', jobStoreID=None,
+                                                requirements=dict(memory=1, cores=1, disk=1,
+                                                                  preemptable=False),
+                                                jobName='job', unitName=None,
+                                                predecessorNumber=predecessorNumber))
+        jobGraph.command = command
+        self.jobStore.update(jobGraph)
+        return jobGraph
+
+    def _addSuccessors(self, jobGraph, successors):
+        jobGraph.stack.append([JobNode.fromJobGraph(successor) for successor in successors])
+        self.jobStore.update(jobGraph)
+
+    @travis_test
+    def testDeepChain(self):
+        """A chain deeper than the recursion limit must not exhaust the stack."""
+        root = self._createJob()
+        jobGraph = root
+        for _ in range(sys.getrecursionlimit() + 100):
+            successor = self._createJob()
+            self._addSuccessors(jobGraph, [successor])
+            jobGraph = successor
+        jobGraph.command = 'leaf'
+        self.jobStore.update(jobGraph)
+        toilState = ToilState(self.jobStore, self.jobStore.load(root.jobStoreID))
+        self.assertEqual([job.jobStoreID for job, _ in toilState.updatedJobs], [jobGraph.jobStoreID])
+        self.assertEqual(len(toilState.successorCounts), sys.getrecursionlimit() + 100)
+
+    @travis_test
+    def testFanOutAndIn(self):
+        """Jobs with multiple predecessors are only ready once all of them are done."""
+        root, finished = self._createJob(), self._createJob()
+        pending = self._createJob(command='pending')
+        joined = self._createJob(predecessorNumber=3)
+        ready = [self._createJob(command='ready') for _ in range(50)]
+        self._addSuccessors(root, [finished, pending] + ready)
+        self._addSuccessors(finished, [joined])
+        toilState = ToilState(self.jobStore, self.jobStore.load(root.jobStoreID))
+        self.assertEqual({job.jobStoreID for job, _ in toilState.updatedJobs},
+                         {job.jobStoreID for job in ready + [pending]})
+        self.assertEqual(toilState.successorCounts, {root.jobStoreID: 52, finished.jobStoreID: 1})
+        self.assertEqual(set(toilState.jobsToBeScheduledWithMultiplePredecessors),
+                         {joined.jobStoreID})
+        self.assertEqual(toilState.jobsToBeScheduledWithMultiplePredecessors[joined.jobStoreID]
+                         .predecessorsFinished, {finished.jobStoreID})
+
+    def _restore(self, toilState, pendingJobs):
+        snapshot = toilState.snapshot([job.jobStoreID for job in pendingJobs])
+        self.assertIsNotNone(snapshot)
+        return ToilState(self.jobStore, None, snapshot=snapshot)
+
+    def _runJob(self, jobGraph, successors=()):
+        """Update a job like a worker that ran it and added the given successors."""
+        jobGraph.command = None
+        if successors:
+            self._addSuccessors(jobGraph, successors)
+        else:
+            self.jobStore.delete(jobGraph.jobStoreID)
+
+    @travis_test
+    def testSnapshotWithoutChanges(self):
+        root = self._createJob()
+        pending = [self._createJob(command='pending') for _ in range(3)]
+        self._addSuccessors(root, pending)
+        toilState = ToilState(self.jobStore, self.jobStore.load(root.jobStoreID))
+        restored = self._restore(toilState, pending)
+        self.assertEqual({job.jobStoreID for job, _ in restored.updatedJobs},
+                         {job.jobStoreID for job in pending})
+        self.assertEqual(restored.successorCounts, toilState.successorCounts)
+        self.assertEqual(set(restored.successorJobStoreIDToPredecessorJobs),
+                         set(toilState.successorJobStoreIDToPredecessorJobs))
+
+    @travis_test
+    def testSnapshotReplaysChanges(self):
+        """Jobs that ran after the snapshot was taken are reloaded, along with their successors."""
+        root = self._createJob()
+        finished, running = self._createJob(command='finished'), self._createJob(command='running')
+        self._addSuccessors(root, [finished, running])
+        toilState = ToilState(self.jobStore, self.jobStore.load(root.jobStoreID))
+        snapshot = toilState.snapshot([finished.jobStoreID, running.jobStoreID])
+        self._runJob(finished)
+        child = self._createJob(command='child')
+        self._runJob(running, [child])
+        restored = ToilState(self.jobStore, None, snapshot=snapshot)
+        self.assertEqual([job.jobStoreID for job, _ in restored.updatedJobs], [child.jobStoreID])
+        self.assertEqual(restored.successorCounts, {root.jobStoreID: 1, running.jobStoreID: 1})
+
+        # Once all successors are gone, the predecessor is reloaded and ready to be deleted
+        self._runJob(child)
+        self._runJob(self.jobStore.load(running.jobStoreID))
+        restored = ToilState(self.jobStore, None, snapshot=snapshot)
+        self.assertEqual([(job.jobStoreID, job.stack) for job, _ in restored.updatedJobs],
+                         [(root.jobStoreID, [])])
+        self.assertEqual(restored.successorCounts, {})
+
+    @travis_test
+    def testSnapshotWithMultiplePredecessors(self):
+        """A job waiting for multiple predecessors may finish without being reachable."""
+        root, waiting = self._createJob(), self._createJob()
+        pending = self._createJob(command='pending')
+        joined = self._createJob(command='joined', predecessorNumber=2)
+        self._addSuccessors(root, [waiting, pending])
+        self._addSuccessors(waiting, [joined])
+        toilState = ToilState(self.jobStore, self.jobStore.load(root.jobStoreID))
+        snapshot = toilState.snapshot([pending.jobStoreID])
+        self.assertEqual(snapshot['jobsWithMultiplePredecessors'], [joined.jobStoreID])
+
+        # The pending job ran and became the last predecessor of the joined job
+        self._runJob(pending, [joined])
+        restored = ToilState(self.jobStore, None, snapshot=snapshot)
+        self.assertEqual([job.jobStoreID for job, _ in restored.updatedJobs], [joined.jobStoreID])
+        self.assertEqual(restored.jobsToBeScheduledWithMultiplePredecessors, {})
+
+        # The joined job ran and finished too, so both its predecessors are ready to be deleted
+        self._runJob(joined)
+        restored = ToilState(self.jobStore, None, snapshot=snapshot)
+        self.assertEqual({job.jobStoreID for job, _ in restored.updatedJobs},
+                         {waiting.jobStoreID, pending.jobStoreID})
+        self.assertEqual(restored.successorCounts, {root.jobStoreID: 2})
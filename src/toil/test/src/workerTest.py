@@ -11,14 +11,16 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import os
 import pickle
+import time
 
 from toil.common import Config
 from toil.job import Job
 from toil.jobGraph import JobGraph
 from toil.jobStores.fileJobStore import FileJobStore
-from toil.test import ToilTest, travis_test
-from toil.worker import nextChainableJobGraph
+from toil.test import ToilTest, slow, travis_test
+from toil.worker import nextChainableJobGraph, runInParallel, successorsToRunInWorker
 
 class WorkerTests(ToilTest):
     """Test miscellaneous units of the worker."""
@@ -30,28 +32,30 @@ class WorkerTests(ToilTest):
         self.config.jobStore = 'file:%s' % path
         self.jobStore.initialize(self.config)
         self.jobGraphNumber = 0
-    
+
+    def createJobGraph(self, memory, cores, disk, preemptable, checkpoint, predecessorNumber=1):
+        """Create a fake-ish Job and JobGraph pair, and return the
+        jobGraph."""
+        name = 'jobGraph%d' % self.jobGraphNumber
+        self.jobGraphNumber += 1
+
+        job = Job()
+        job.checkpoint = checkpoint
+        # The job doesn't have a jobStoreID yet, so we can't tag the file
+        with self.jobStore.writeFileStream() as (f, fileStoreID):
+            pickle.dump(job, f, pickle.HIGHEST_PROTOCOL)
+        command = '_toil %s fooCommand toil True' % fileStoreID
+        jobGraph = JobGraph(command=command, memory=memory, cores=cores,
+                            disk=disk, unitName=name,
+                            jobName=name, preemptable=preemptable,
+                            jobStoreID=name, remainingRetryCount=1,
+                            predecessorNumber=predecessorNumber)
+        return self.jobStore.create(jobGraph)
+
     @travis_test
     def testNextChainableJobGraph(self):
         """Make sure chainable/non-chainable jobs are identified correctly."""
-        def createJobGraph(memory, cores, disk, preemptable, checkpoint):
-            """Create a fake-ish Job and JobGraph pair, and return the
-            jobGraph."""
-            name = 'jobGraph%d' % self.jobGraphNumber
-            self.jobGraphNumber += 1
-
-            job = Job()
-            job.checkpoint = checkpoint
-            # The job doesn't have a jobStoreID yet, so we can't tag the file
-            with self.jobStore.writeFileStream() as (f, fileStoreID):
-                pickle.dump(job, f, pickle.HIGHEST_PROTOCOL)
-            command = '_toil %s fooCommand toil True' % fileStoreID
-            jobGraph = JobGraph(command=command, memory=memory, cores=cores,
-                                disk=disk, unitName=name,
-                                jobName=name, preemptable=preemptable,
-                                jobStoreID=name, remainingRetryCount=1,
-                                predecessorNumber=1)
-            return self.jobStore.create(jobGraph)
+        createJobGraph = self.createJobGraph
 
         # Identical non-checkpoint jobs should be chainable.
         jobGraph1 = createJobGraph(1, 2, 3, True, False)
@@ -91,3 +95,182 @@ class WorkerTests(ToilTest):
         jobGraph2 = createJobGraph(1, 2, 3, False, True)
         jobGraph1.stack = [[jobGraph2]]
         self.assertEqual(None, nextChainableJobGraph(jobGraph1, self.jobStore))
+
+    @travis_test
+    def testCheckpointFlag(self):
+        """The checkpoint flag in the jobGraph spares loading the job."""
+        for isCheckpoint in (True, False):
+            jobGraph1 = self.createJobGraph(1, 2, 3, True, False)
+            jobGraph2 = self.createJobGraph(1, 2, 3, True, False)
+            jobGraph2.command = '_toil missingFile fooCommand toil True'
+            jobGraph2.isCheckpoint = isCheckpoint
+            self.jobStore.update(jobGraph2)
+            jobGraph1.stack = [[jobGraph2]]
+            self.assertEqual(None if isCheckpoint else jobGraph2,
+                             nextChainableJobGraph(jobGraph1, self.jobStore))
+
+    @travis_test
+    def testSuccessorsToRunInWorker(self):
+        """Make sure the successors a worker can run as jobs of their own are identified."""
+        self.config.maxChainedSiblings = 3
+        jobGraph1 = self.createJobGraph(1, 2, 3, True, False)
+        siblings = [self.createJobGraph(1, 2, 3, True, False) for _ in range(3)]
+        jobGraph1.stack = [siblings]
+        self.assertEqual(siblings, successorsToRunInWorker(jobGraph1, self.jobStore, self.config))
+
+        # Siblings that are checkpoints or don't fit are left to the leader
+        siblings[1] = self.createJobGraph(1, 2, 3, True, True)
+        siblings[2] = self.createJobGraph(1, 2, 4, True, False)
+        self.assertEqual(siblings[:1],
+                         successorsToRunInWorker(jobGraph1, self.jobStore, self.config))
+
+        # So are larger levels
+        jobGraph1.stack = [[self.createJobGraph(1, 2, 3, True, False) for _ in range(4)]]
+        self.assertEqual([], successorsToRunInWorker(jobGraph1, self.jobStore, self.config))
+
+        # A successor with multiple predecessors is run once all others have finished
+        successor = self.createJobGraph(1, 2, 3, True, False, predecessorNumber=3)
+        jobGraph1.stack = [[successor]]
+        successor.predecessorsFinished = {'otherPredecessor'}
+        self.jobStore.update(successor)
+        self.assertEqual([], successorsToRunInWorker(jobGraph1, self.jobStore, self.config))
+        successor.predecessorsFinished.add('anotherPredecessor')
+        self.jobStore.update(successor)
+        self.assertEqual([successor],
+                         successorsToRunInWorker(jobGraph1, self.jobStore, self.config))
+
+    @travis_test
+    def testRunInParallel(self):
+        """Siblings are run in parallel if their requirements add up to the worker's."""
+        self.config.maxWorkerFanOut = 4
+        jobGraph1 = self.createJobGraph(4, 4, 4, True, False)
+        siblings = [self.createJobGraph(1, 1, 1, True, False) for _ in range(4)]
+        jobGraph1.stack = [siblings]
+        self.assertEqual(siblings, successorsToRunInWorker(jobGraph1, self.jobStore, self.config))
+        self.assertTrue(runInParallel(jobGraph1, siblings, self.config))
+        # A single job is run on its own
+        self.assertFalse(runInParallel(jobGraph1, siblings[:1], self.config))
+
+        # The level must be small enough
+        self.config.maxWorkerFanOut = 3
+        self.assertFalse(runInParallel(jobGraph1, siblings, self.config))
+        self.assertEqual([], successorsToRunInWorker(jobGraph1, self.jobStore, self.config))
+
+        # And the siblings must fit within the worker together
+        self.config.maxWorkerFanOut = 4
+        for requirement in range(3):
+            requirements = [4, 4, 4]
+            requirements[requirement] = 3
+            jobGraph1 = self.createJobGraph(*requirements, preemptable=True, checkpoint=False)
+            jobGraph1.stack = [siblings]
+            self.assertFalse(runInParallel(jobGraph1, siblings, self.config))
+            self.assertEqual([], successorsToRunInWorker(jobGraph1, self.jobStore, self.config))
+
+    @slow
+    def testRunSiblings(self):
+        """A worker runs small siblings one after the other."""
+        options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+        options.maxChainedSiblings = 3
+        tempDir = self._createTempDir()
+        root = Job.wrapJobFn(recordPid, tempDir, 'root')
+        for name in ('a', 'b'):
+            root.addChildJobFn(recordPid, tempDir, name)
+        root.addChildJobFn(recordPid, tempDir, 'c').addChildJobFn(recordPid, tempDir, 'd')
+        Job.Runner.startToil(root, options)
+        pids = readPids(tempDir)
+        self.assertEqual(sorted(pids), ['a', 'b', 'c', 'd', 'root'])
+        self.assertEqual(len(set(pids[name] for name in ('root', 'a', 'b', 'c'))), 1)
+
+    @slow
+    def testRunFanIn(self):
+        """The worker of the last predecessor of a job runs it."""
+        options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+        tempDir = self._createTempDir()
+        root = Job()
+        first = root.addChildJobFn(recordPid, tempDir, 'first')
+        last = root.addChildJobFn(recordPid, tempDir, 'last', delay=5)
+        successor = Job.wrapJobFn(recordPid, tempDir, 'successor')
+        first.addChild(successor)
+        last.addChild(successor)
+        Job.Runner.startToil(root, options)
+        pids = readPids(tempDir)
+        self.assertEqual(sorted(pids), ['first', 'last', 'successor'])
+        self.assertEqual(pids['successor'], pids['last'])
+
+    @slow
+    def testChainWithCaching(self):
+        """
+        A worker running a chain of jobs with a single caching file store updates each of them
+        in order, while the next job is running.
+        """
+        options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+        options.disableCaching = False
+        tempDir = self._createTempDir()
+        job = root = Job.wrapJobFn(writeAndRead, 0, None, tempDir)
+        for i in range(1, 10):
+            job = job.addChildJobFn(writeAndRead, i, job.rv(), tempDir)
+        Job.Runner.startToil(root, options)
+        pids = readPids(tempDir)
+        self.assertEqual(len(pids), 10)
+        self.assertEqual(len(set(pids.values())), 1)
+
+    @slow
+    def testFanOut(self):
+        """A worker runs small siblings in parallel, each in a process of its own."""
+        options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+        options.maxWorkerFanOut = 3
+        tempDir, parentDir = self._createTempDir(), self._createTempDir()
+        names = ['a', 'b', 'c']
+        root = Job.wrapJobFn(recordPid, tempDir, 'root', memory='300M', cores=1, disk='300M')
+        for name in names:
+            root.addChildJobFn(waitForSiblings, tempDir, parentDir, name, names,
+                               memory='100M', cores=0.1, disk='100M')
+        Job.Runner.startToil(root, options)
+        pids = readPids(tempDir)
+        self.assertEqual(sorted(pids), ['a', 'b', 'c', 'root'])
+        self.assertEqual(len(set(pids.values())), 4)
+        # The siblings were started by the worker of the root job, not by the batch system
+        self.assertEqual(set(readPids(parentDir).values()), {pids['root']})
+
+
+def waitForSiblings(job, dirPath, parentDirPath, name, names):
+    """
+    Record the pid of the job and of its parent process, and wait for its siblings to do the
+    same, which they only can if they run at the same time.
+    """
+    recordPid(job, dirPath, name)
+    with open(os.path.join(parentDirPath, name), 'w') as f:
+        f.write(str(os.getppid()))
+    for _ in range(600):
+        if all(os.path.exists(os.path.join(dirPath, sibling)) for sibling in names):
+            return
+        time.sleep(.1)
+    raise RuntimeError("The siblings of job %s didn't run at the same time" % name)
+
+
+def writeAndRead(job, i, previousFileID, dirPath):
+    """
+    Write a file holding i to the job store, after checking the file written by the previous job.
+    """
+    if previousFileID is not None:
+        with open(job.fileStore.readGlobalFile(previousFileID)) as f:
+            assert int(f.read()) == i - 1
+    recordPid(job, dirPath, str(i))
+    localPath = job.fileStore.getLocalTempFile()
+    with open(localPath, 'w') as f:
+        f.write(str(i))
+    return job.fileStore.writeGlobalFile(localPath)
+
+
+def recordPid(job, dirPath, name, delay=0):
+    time.sleep(delay)
+    with open(os.path.join(dirPath, name), 'w') as f:
+        f.write(str(os.getpid()))
+
+
+def readPids(dirPath):
+    pids = {}
+    for name in os.listdir(dirPath):
+        with open(os.path.join(dirPath, name)) as f:
+            pids[name] = f.read()
+    return pids
@@ -14,7 +14,15 @@
 from __future__ import absolute_import
 
 from builtins import object
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 import logging
+import time
+
+from six import iteritems, itervalues
+
+from toil.jobGraph import JobGraph
+from toil.jobStores.abstractJobStore import NoSuchJobException
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +31,13 @@ class ToilState(object):
     """
     Represents a snapshot of the jobs in the jobStore. Used by the leader to manage the batch.
     """
-    def __init__(self, jobStore, rootJob, jobCache=None):
+    # Number of threads loading jobs from the job store while building the state
+    loadThreads = 16
+
+    # Minimum number of seconds between progress reports while building the state
+    progressInterval = 30
+
+    def __init__(self, jobStore, rootJob, jobCache=None, snapshot=None):
         """
         Loads the state from the jobStore, using the rootJob 
         as the source of the job graph.
@@ -31,8 +45,13 @@ class ToilState(object):
         The jobCache is a map from jobStoreIDs to jobGraphs or None. Is used to
         speed up the building of the state.
 
+        If a snapshot of the state of a previous leader is passed, the state is restored from it
+        instead, see :meth:`snapshot`. The job store must have been left as is by that leader,
+        without being cleaned.
+
         :param toil.jobStores.abstractJobStore.AbstractJobStore jobStore 
         :param toil.jobWrapper.JobGraph rootJob
+        :param dict snapshot: a snapshot returned by :meth:`snapshot`
         """
         # This is a hash of jobs, referenced by jobStoreID, to their predecessor jobs.
         self.successorJobStoreIDToPredecessorJobs = {}
@@ -66,32 +85,242 @@ class ToilState(object):
         self.jobsToBeScheduledWithMultiplePredecessors = {}
         
         ##Algorithm to build this information
-        self._buildToilState(rootJob, jobStore, jobCache)
+        if snapshot is None:
+            self._buildToilState(rootJob, jobStore, jobCache)
+        else:
+            self._replaySnapshot(snapshot, jobStore)
 
-    def _buildToilState(self, jobGraph, jobStore, jobCache=None):
+    def _buildToilState(self, rootJob, jobStore, jobCache=None):
         """
-        Traverses tree of jobs from the root jobGraph (rootJob) building the
-        ToilState class.
+        Traverses the graph of jobs from the root jobGraph (rootJob) building the ToilState
+        class.
+
+        The graph is traversed iteratively, one level of successors at a time, so deep chains of
+        jobs can't exceed the recursion limit. The jobs of each level are loaded from the job
+        store in parallel.
 
         If jobCache is passed, it must be a dict from job ID to JobGraph
         object. Jobs will be loaded from the cache (which can be downloaded from
         the jobStore in a batch) instead of piecemeal when recursed into.
 
-        :param jobGraph: Object representing a job.
+        :param toil.jobGraph.JobGraph rootJob: Object representing the root job.
         :param jobStore: Object inheriting toil.jobStores.abstractJobStore.AbstractJobStore.
-        :param jobCache:
-        :return:
+        :param dict jobCache: Cache of JobGraph objects, by job ID
+        """
+        self._traverse([rootJob], jobStore.load, jobCache)
+
+    def _traverse(self, jobGraphs, loadJob, jobCache=None, staleJobStoreIDs=frozenset()):
+        """
+        Add the given jobs and everything that is reachable from them to the state, level by
+        level. Jobs in the state that have multiple predecessors and whose cached JobGraph may
+        be out of date are not added when they become ready but returned instead.
+
+        :param list[toil.jobGraph.JobGraph] jobGraphs: the jobs to start from
+        :param loadJob: a function loading the JobGraph for a job ID from the job store
+        :param dict jobCache: Cache of JobGraph objects, by job ID
+        :param set staleJobStoreIDs: the IDs of the jobs whose cached JobGraph may be out of date
+        :rtype: list[str]
+        """
+        startTime = lastReportTime = time.time()
+        numJobs, numLoaded = 0, 0
+        staleReadyJobStoreIDs = []
+        pool = None
+        try:
+            while jobGraphs:
+                # Load the successors of this level that haven't been seen before
+                jobStoreIDs = self._unseenSuccessors(jobGraphs, jobCache)
+                if len(jobStoreIDs) > 1:
+                    if pool is None:
+                        pool = ThreadPool(self.loadThreads)
+                    chunkSize = max(1, len(jobStoreIDs) // (4 * self.loadThreads))
+                    loadedJobs = pool.map(loadJob, jobStoreIDs, chunksize=chunkSize)
+                else:
+                    loadedJobs = [loadJob(jobStoreID) for jobStoreID in jobStoreIDs]
+                loadedJobs = dict(zip(jobStoreIDs, loadedJobs))
+                numLoaded += len(loadedJobs)
+
+                def getJob(jobId):
+                    try:
+                        return loadedJobs[jobId]
+                    except KeyError:
+                        return jobCache[jobId]
+
+                nextJobGraphs = []
+                for jobGraph in jobGraphs:
+                    self._processJob(jobGraph, getJob, nextJobGraphs)
+                numJobs += len(jobGraphs)
+                jobGraphs = []
+                for jobGraph in nextJobGraphs:
+                    if jobGraph.jobStoreID in staleJobStoreIDs:
+                        staleReadyJobStoreIDs.append(jobGraph.jobStoreID)
+                    else:
+                        jobGraphs.append(jobGraph)
+
+                now = time.time()
+                if now - lastReportTime >= self.progressInterval:
+                    logger.info('Traversed %i jobs so far, %i of them loaded from the job store, '
+                                'in %.1fs', numJobs, numLoaded, now - startTime)
+                    lastReportTime = now
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        logger.info('Traversed %i jobs, %i of them loaded from the job store, in %.1fs',
+                    numJobs, numLoaded, time.time() - startTime)
+        return staleReadyJobStoreIDs
+
+    def snapshot(self, pendingJobStoreIDs):
         """
+        Return a snapshot of the state from which :meth:`__init__` can restore it after a
+        restart, or None if the state can't be captured in a snapshot. That is the case while
+        any services are running, jobs have failed or checkpoint jobs are waiting for their
+        successors, because restoring those requires the job store to be cleaned.
 
-        def getJob(jobId):
-            if jobCache is not None:
-                if jobId in jobCache:
-                    return jobCache[jobId]
-            return jobStore.load(jobId)
+        The jobs waiting for successors or predecessors to finish are included in the snapshot.
+        A job is only ever changed by running it, so those jobs stay as they are on the job
+        store until the jobs they wait for finish. Changes made after the snapshot therefore all
+        start from the pending jobs, which are reloaded from the job store on restart.
 
-        # If the jobGraph has a command, is a checkpoint, has services or is ready to be
-        # deleted it is ready to be processed
-        if jobGraph.command is not None or jobGraph.checkpoint is not None or jobGraph.services or not jobGraph.stack:
+        :param list[str] pendingJobStoreIDs: the IDs of the jobs that are issued or ready to be
+               issued
+        :rtype: dict|None
+        """
+        if (self.servicesIssued or self.serviceJobStoreIDToPredecessorJob
+                or self.totalFailedJobs or self.hasFailedSuccessors or self.failedSuccessors):
+            return None
+        jobs = {}
+        for predecessorJobs in itervalues(self.successorJobStoreIDToPredecessorJobs):
+            for jobGraph in predecessorJobs:
+                if jobGraph.checkpoint is not None:
+                    return None
+                jobs[jobGraph.jobStoreID] = jobGraph.serialize()
+        for jobStoreID, jobGraph in iteritems(self.jobsToBeScheduledWithMultiplePredecessors):
+            jobs[jobStoreID] = jobGraph.serialize()
+        return dict(jobs=jobs,
+                    successorCounts=dict(self.successorCounts),
+                    predecessors={jobStoreID: [jobGraph.jobStoreID for jobGraph in predecessorJobs]
+                                  for jobStoreID, predecessorJobs
+                                  in iteritems(self.successorJobStoreIDToPredecessorJobs)},
+                    jobsWithMultiplePredecessors=list(self.jobsToBeScheduledWithMultiplePredecessors),
+                    pendingJobs=list(pendingJobStoreIDs))
+
+    def _replaySnapshot(self, snapshot, jobStore):
+        """
+        Restore the state from a snapshot and replay the changes made to the job store since the
+        snapshot was taken. Only the jobs that were pending when the snapshot was taken, and
+        those whose state has changed because of them, are loaded from the job store.
+
+        :param dict snapshot: a snapshot returned by :meth:`snapshot`
+        :param toil.jobStores.abstractJobStore.AbstractJobStore jobStore:
+        """
+        jobs = {jobStoreID: JobGraph.deserialize(record)
+                for jobStoreID, record in iteritems(snapshot['jobs'])}
+        self.successorCounts = dict(snapshot['successorCounts'])
+        self.successorJobStoreIDToPredecessorJobs = {
+            jobStoreID: [jobs[predecessorID] for predecessorID in predecessorIDs]
+            for jobStoreID, predecessorIDs in iteritems(snapshot['predecessors'])}
+        pendingJobStoreIDs = list(snapshot['pendingJobs'])
+        # The cached jobs with multiple predecessors will be reloaded once they become ready
+        staleJobStoreIDs = set(snapshot['jobsWithMultiplePredecessors']) - set(pendingJobStoreIDs)
+        self.jobsToBeScheduledWithMultiplePredecessors = {jobStoreID: jobs[jobStoreID]
+                                                          for jobStoreID in staleJobStoreIDs}
+
+        def loadJob(jobStoreID):
+            # Repair the job like AbstractJobStore.clean() would have
+            jobGraph = jobStore.load(jobStoreID)
+            if jobGraph.checkpoint is not None:
+                jobGraph.restartCheckpoint(jobStore)
+            jobStore.cleanJob(jobGraph)
+            return jobGraph
+
+        def loadJobIfExists(jobStoreID):
+            try:
+                return loadJob(jobStoreID)
+            except NoSuchJobException:
+                return None
+
+        # A job waiting for multiple predecessors can run and finish once the last of them has,
+        # without being reached from the pending jobs, which only lose it from their stack.
+        for jobStoreID in list(staleJobStoreIDs):
+            if not jobStore.exists(jobStoreID):
+                staleJobStoreIDs.remove(jobStoreID)
+                self._replayFinishedJob(jobStoreID, pendingJobStoreIDs)
+
+        numReplayed = 0
+        while pendingJobStoreIDs:
+            jobStoreIDs = list(OrderedDict.fromkeys(pendingJobStoreIDs))
+            pendingJobStoreIDs = []
+            jobGraphs = []
+            for jobStoreID in jobStoreIDs:
+                jobGraph = loadJobIfExists(jobStoreID)
+                if jobGraph is None:
+                    self._replayFinishedJob(jobStoreID, pendingJobStoreIDs)
+                else:
+                    jobGraphs.append(jobGraph)
+            numReplayed += len(jobStoreIDs)
+            for jobStoreID in self._traverse(jobGraphs, loadJob,
+                                             staleJobStoreIDs=staleJobStoreIDs):
+                staleJobStoreIDs.remove(jobStoreID)
+                pendingJobStoreIDs.append(jobStoreID)
+        logger.info('Restored the state of %i waiting jobs from a snapshot and replayed %i pending '
+                    'jobs.', len(jobs), numReplayed)
+
+    def _replayFinishedJob(self, jobStoreID, pendingJobStoreIDs):
+        """
+        Account for a job that finished after the snapshot was taken. Predecessors whose
+        successors have now all finished are appended to pendingJobStoreIDs.
+
+        :param str jobStoreID: the ID of the finished job
+        :param list[str] pendingJobStoreIDs: the IDs of the jobs to reload from the job store
+        """
+        self.jobsToBeScheduledWithMultiplePredecessors.pop(jobStoreID, None)
+        for predecessorJob in self.successorJobStoreIDToPredecessorJobs.pop(jobStoreID, []):
+            self.successorCounts[predecessorJob.jobStoreID] -= 1
+            if self.successorCounts[predecessorJob.jobStoreID] == 0:
+                self.successorCounts.pop(predecessorJob.jobStoreID)
+                pendingJobStoreIDs.append(predecessorJob.jobStoreID)
+
+    def _unseenSuccessors(self, jobGraphs, jobCache):
+        """
+        Return the IDs of the successors of the given jobs that haven't been considered yet and
+        will have to be loaded from the job store.
+
+        :param list[toil.jobGraph.JobGraph] jobGraphs: the jobs whose successors to consider
+        :param dict jobCache: Cache of JobGraph objects, by job ID
+        :rtype: list[str]
+        """
+        jobStoreIDs = []
+        seen = set()
+        for jobGraph in jobGraphs:
+            if not self._isReady(jobGraph):
+                for successorJobNode in jobGraph.stack[-1]:
+                    successorJobStoreID = successorJobNode.jobStoreID
+                    if (successorJobStoreID not in self.successorJobStoreIDToPredecessorJobs
+                            and successorJobStoreID not in seen
+                            and (jobCache is None or successorJobStoreID not in jobCache)):
+                        seen.add(successorJobStoreID)
+                        jobStoreIDs.append(successorJobStoreID)
+        return jobStoreIDs
+
+    @staticmethod
+    def _isReady(jobGraph):
+        """
+        If the jobGraph has a command, is a checkpoint, has services or is ready to be
+        deleted it is ready to be processed.
+        """
+        return (jobGraph.command is not None or jobGraph.checkpoint is not None
+                or jobGraph.services or not jobGraph.stack)
+
+    def _processJob(self, jobGraph, getJob, nextJobGraphs):
+        """
+        Add the given job to the state and collect those of its successors that need to be
+        considered next.
+
+        :param toil.jobGraph.JobGraph jobGraph: the job to add
+        :param getJob: a function returning the JobGraph for a job ID
+        :param list nextJobGraphs: the list to append successor JobGraphs to
+        """
+        if self._isReady(jobGraph):
             logger.debug('Found job to run: %s, with command: %s, with checkpoint: %s, '
                          'with  services: %s, with stack: %s', jobGraph.jobStoreID,
                          jobGraph.command is not None, jobGraph.checkpoint is not None,
@@ -121,8 +350,8 @@ class ToilState(object):
                     # It is ready to be run, so remove it from the cache
                     self.jobsToBeScheduledWithMultiplePredecessors.pop(successorJobStoreID)
                     
-                    # Recursively consider the successor
-                    self._buildToilState(successorJobGraph, jobStore, jobCache=jobCache)
+                    # Consider the successor next
+                    nextJobGraphs.append(successorJobGraph)
             
             # For each successor
             for successorJobNode in jobGraph.stack[-1]:
@@ -150,8 +379,8 @@ class ToilState(object):
                             
                     else:
                         # The successor has only the jobGraph as a predecessor so
-                        # recursively consider the successor
-                        self._buildToilState(getJob(successorJobStoreID), jobStore, jobCache=jobCache)
+                        # consider the successor next
+                        nextJobGraphs.append(getJob(successorJobStoreID))
                 
                 else:
                     # We've already seen the successor
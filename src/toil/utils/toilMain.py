@@ -1,7 +1,7 @@
 from __future__ import absolute_import, print_function
 from past.builtins import map
 from toil.version import version
-import pkg_resources
+import importlib
 import os
 import sys
 import re
@@ -9,47 +9,52 @@ import re
 # Python 3 compatibility imports
 from six import iteritems, iterkeys
 
+# The modules in toil.utils implementing the commands. They are only imported when needed, as
+# some of them pull in the provisioners and cloud libraries.
+moduleNames = ['toilKill',
+               'toilStats',
+               'toilStatus',
+               'toilClean',
+               'toilLaunchCluster',
+               'toilDestroyCluster',
+               'toilSshCluster',
+               'toilRsyncCluster',
+               'toilDebugFile',
+               'toilDebugJob']
+
 def main():
-    modules = loadModules()
     try:
         command = sys.argv[1]
     except IndexError:
-        printHelp(modules)
+        printHelp(loadModules())
     else:
         if command == '--help':
-            printHelp(modules)
+            printHelp(loadModules())
         elif command == '--version':
             try:
+                import pkg_resources
                 print(pkg_resources.get_distribution('toil').version)
             except:
                 print("Version gathered from toil.version: "+version)
         else:
             try:
-                module = modules[command]
+                moduleName = commandToModuleName()[command]
             except KeyError:
                 print("Unknown option '%s'. "
                       "Pass --help to display usage information.\n" % command, file=sys.stderr)
                 sys.exit(1)
             else:
                 del sys.argv[1]
-                module.main()
+                importlib.import_module('toil.utils.' + moduleName).main()
+
+def commandToModuleName():
+    return { "-".join(
+             map(lambda x : x.lower(), re.findall('[A-Z][^A-Z]*', name)
+             )) : name for name in moduleNames}
 
 def loadModules():
-    # noinspection PyUnresolvedReferences
-    from toil.utils import (toilKill,
-                            toilStats,
-                            toilStatus,
-                            toilClean,
-                            toilLaunchCluster,
-                            toilDestroyCluster,
-                            toilSshCluster,
-                            toilRsyncCluster,
-                            toilDebugFile,
-                            toilDebugJob)
-    commandMapping = { "-".join(
-                     map(lambda x : x.lower(), re.findall('[A-Z][^A-Z]*', name)
-                     )) : module for name, module in iteritems(locals())}
-    return commandMapping
+    return {command: importlib.import_module('toil.utils.' + name)
+            for command, name in iteritems(commandToModuleName())}
 
 def printHelp(modules):
     usage = ("\n"
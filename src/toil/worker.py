@@ -18,8 +18,8 @@ from builtins import str
 from builtins import map
 from builtins import filter
 import os
+import errno
 import sys
-import copy
 import random
 import json
 import tempfile
@@ -33,8 +33,9 @@ from threading import Thread
 
 from toil.lib.expando import MagicExpando
 from toil.common import Toil, safeUnpickleFromStream
+from toil.fileStores import FileID
 from toil.fileStores.abstractFileStore import AbstractFileStore
-from toil import logProcessContext
+from toil import logProcessContext, resolveEntryPoint, subprocess
 from toil.job import Job
 from toil.lib.bioio import setLogLevel
 from toil.lib.bioio import getTotalCpuTime
@@ -45,6 +46,49 @@ from toil.deferred import DeferredFunctionManager
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 
+# The environment variable naming the file the worker leaves its result in, set by batch systems
+# that pass the result back to the leader, see AbstractBatchSystem.getWorkerResult()
+workerResultEnvVar = 'TOIL_WORKER_RESULT_FILE'
+
+def writeWorkerResult(resultPath, jobGraph):
+    """
+    Leave the result of the worker in the given file, for the batch system to pass back to the
+    leader along with the exit code.
+
+    :param str resultPath: the file to write
+    :param toil.jobGraph.JobGraph jobGraph: the record of the job as the worker left it in the
+           job store, or None if the worker deleted the job
+    """
+    # Write to a temporary file first, so a worker killed halfway doesn't leave a truncated result
+    with open(resultPath + '.tmp', 'wb') as f:
+        if jobGraph is not None:
+            f.write(jobGraph.serialize())
+    os.rename(resultPath + '.tmp', resultPath)
+
+def readWorkerResult(resultPath):
+    """
+    Read and remove the result a worker left with :func:`writeWorkerResult`.
+
+    :param str resultPath: the file the worker was told to write
+    :rtype: bytes or None
+    :return: the serialized record of the job, an empty string if the worker deleted the job, or
+             None if the worker didn't leave a result
+    """
+    try:
+        with open(resultPath, 'rb') as f:
+            result = f.read()
+    except (IOError, OSError) as e:
+        if e.errno != errno.ENOENT:
+            raise
+        # The worker didn't get as far as writing the result, or was killed while doing so
+        try:
+            os.remove(resultPath + '.tmp')
+        except OSError:
+            pass
+        return None
+    os.remove(resultPath)
+    return result
+
 def nextChainableJobGraph(jobGraph, jobStore):
     """Returns the next chainable jobGraph after this jobGraph if one
     exists, or None if the chain must terminate.
@@ -68,17 +112,7 @@ def nextChainableJobGraph(jobGraph, jobStore):
     #We check the requirements of the jobGraph to see if we can run it
     #within the current worker
     successorJobNode = jobs[0]
-    if successorJobNode.memory > jobGraph.memory:
-        logger.debug("We need more memory for the next job, so finishing")
-        return None
-    if successorJobNode.cores > jobGraph.cores:
-        logger.debug("We need more cores for the next job, so finishing")
-        return None
-    if successorJobNode.disk > jobGraph.disk:
-        logger.debug("We need more disk for the next job, so finishing")
-        return None
-    if successorJobNode.preemptable != jobGraph.preemptable:
-        logger.debug("Preemptability is different for the next job, returning to the leader")
+    if not _fitsWorker(jobGraph, successorJobNode):
         return None
     if successorJobNode.predecessorNumber > 1:
         logger.debug("The jobGraph has multiple predecessors, we must return to the leader.")
@@ -87,21 +121,130 @@ def nextChainableJobGraph(jobGraph, jobStore):
     # Load the successor jobGraph
     successorJobGraph = jobStore.load(successorJobNode.jobStoreID)
 
-    # Somewhat ugly, but check if job is a checkpoint job and quit if
-    # so
-    if successorJobGraph.command.startswith("_toil "):
-        #Load the job
-        successorJob = Job._loadJob(successorJobGraph.command, jobStore)
-
-        # Check it is not a checkpoint
-        if successorJob.checkpoint:
-            logger.debug("Next job is checkpoint, so finishing")
-            return None
+    if _isCheckpoint(successorJobGraph, jobStore):
+        logger.debug("Next job is checkpoint, so finishing")
+        return None
 
     # Made it through! This job is chainable.
     return successorJobGraph
 
-def workerScript(jobStore, config, jobName, jobStoreID, redirectOutputToLogFile=True):
+def successorsToRunInWorker(jobGraph, jobStore, config):
+    """
+    Returns the jobGraphs of the successors in the next level of this jobGraph that the worker can
+    run as jobs of their own when the chain terminates. Unlike a chained job, such a successor
+    keeps its own jobGraph, so the leader handles its successors as if it had been issued. These
+    are the jobs of a level with at most config.maxChainedSiblings jobs, which are run one after
+    the other, the jobs of a level with at most config.maxWorkerFanOut jobs that fit within the
+    resources of the worker together, which are run in parallel, see :func:`runInParallel`, and
+    jobs with multiple predecessors of which all others have finished. They must fit within the
+    resources of the worker and must not be checkpoints or have services.
+    """
+    if len(jobGraph.stack) == 0 or len(jobGraph.services) > 0 or jobGraph.checkpoint != None:
+        return []
+    jobs = jobGraph.stack[-1]
+    if len(jobs) > 1 and len(jobs) > max(config.maxChainedSiblings, config.maxWorkerFanOut):
+        logger.debug("The worker can't run its %i children", len(jobs))
+        return []
+    successorJobGraphs = []
+    for successorJobNode in jobs:
+        if not _fitsWorker(jobGraph, successorJobNode):
+            continue
+        successorJobGraph = jobStore.load(successorJobNode.jobStoreID)
+        if successorJobNode.predecessorNumber > 1:
+            # The leader records the predecessors that finished in the successor's jobGraph
+            predecessorsFinished = successorJobGraph.predecessorsFinished
+            if (jobGraph.jobStoreID in predecessorsFinished
+                    or len(predecessorsFinished) < successorJobNode.predecessorNumber - 1):
+                logger.debug("The job %s is waiting for other predecessors", successorJobGraph)
+                continue
+        if (successorJobGraph.command is None or len(successorJobGraph.services) > 0
+                or _isCheckpoint(successorJobGraph, jobStore)):
+            continue
+        successorJobGraphs.append(successorJobGraph)
+    if len(jobs) > config.maxChainedSiblings and not runInParallel(jobGraph, successorJobGraphs,
+                                                                   config):
+        logger.debug("The worker can't run its %i children one after the other", len(jobs))
+        return []
+    return successorJobGraphs
+
+def runInParallel(jobGraph, successorJobGraphs, config):
+    """Returns True if the worker of the jobGraph runs the given successors in parallel, which
+    requires that their requirements add up to no more than its resources.
+    """
+    if not 1 < len(successorJobGraphs) <= config.maxWorkerFanOut:
+        return False
+    for requirement in ('memory', 'cores', 'disk'):
+        if sum(getattr(successorJobGraph, requirement)
+               for successorJobGraph in successorJobGraphs) > getattr(jobGraph, requirement):
+            logger.debug("We need more %s to run the next jobs in parallel", requirement)
+            return False
+    return True
+
+def runSuccessorsInParallel(successorJobGraphs, jobStore, config, localWorkerTempDir):
+    """
+    Runs the jobs of the given jobGraphs at the same time, each in a worker process of its own,
+    like the leader would. A worker that fails to capture the failure of its job is handled like
+    the leader does for the jobs it issued.
+
+    :param str localWorkerTempDir: the directory to leave the results of the workers in
+    :return: the IDs of the jobs that the workers finished and deleted
+    :rtype: set[str]
+    """
+    workerCommand = resolveEntryPoint('_toil_worker')
+    workers = []
+    for i, successorJobGraph in enumerate(successorJobGraphs):
+        logger.debug("Running the successor %s in a worker of its own", successorJobGraph)
+        resultPath = os.path.join(localWorkerTempDir, 'fanOutResult%i' % i)
+        environment = dict(os.environ)
+        environment[workerResultEnvVar] = resultPath
+        popen = subprocess.Popen([workerCommand, successorJobGraph.jobName, config.jobStore,
+                                  successorJobGraph.jobStoreID], env=environment)
+        workers.append((successorJobGraph, popen, resultPath))
+    doneJobStoreIDs = set()
+    for successorJobGraph, popen, resultPath in workers:
+        exitStatus = popen.wait()
+        result = readWorkerResult(resultPath)
+        if exitStatus != 0:
+            logger.warning("The worker of the successor %s exited with status %i",
+                           successorJobGraph, exitStatus)
+            if jobStore.exists(successorJobGraph.jobStoreID):
+                failedJobGraph = jobStore.load(successorJobGraph.jobStoreID)
+                failedJobGraph.setupJobAfterFailure(config)
+                jobStore.update(failedJobGraph)
+        elif (not result if result is not None
+              else not jobStore.exists(successorJobGraph.jobStoreID)):
+            doneJobStoreIDs.add(successorJobGraph.jobStoreID)
+    return doneJobStoreIDs
+
+def _fitsWorker(jobGraph, successorJobNode):
+    """Returns True if the successor can run within the resources of the worker of the
+    jobGraph.
+    """
+    if successorJobNode.memory > jobGraph.memory:
+        logger.debug("We need more memory for the next job, so finishing")
+        return False
+    if successorJobNode.cores > jobGraph.cores:
+        logger.debug("We need more cores for the next job, so finishing")
+        return False
+    if successorJobNode.disk > jobGraph.disk:
+        logger.debug("We need more disk for the next job, so finishing")
+        return False
+    if successorJobNode.preemptable != jobGraph.preemptable:
+        logger.debug("Preemptability is different for the next job, returning to the leader")
+        return False
+    return True
+
+def _isCheckpoint(jobGraph, jobStore):
+    """Returns True if the job of the jobGraph is a checkpoint. The job is only loaded to find
+    out if its jobGraph was written without recording it.
+    """
+    if jobGraph.isCheckpoint is not None:
+        return jobGraph.isCheckpoint
+    # Somewhat ugly, but check if job is a checkpoint job
+    return jobGraph.command.startswith("_toil ") and Job._loadJob(jobGraph.command, jobStore).checkpoint
+
+def workerScript(jobStore, config, jobName, jobStoreID, redirectOutputToLogFile=True,
+                 resultPath=None):
     """
     Worker process script, runs a job. 
     
@@ -109,6 +252,10 @@ def workerScript(jobStore, config, jobName, jobStoreID, redirectOutputToLogFile=
     :param str jobStoreLocator: Specifies the job store to use
     :param str jobStoreID: The job store ID of the job to be run
     :param bool redirectOutputToLogFile: Redirect standard out and standard error to a log file
+    :param str resultPath: The file to leave the result in, see :func:`writeWorkerResult`
+
+    :return: True if the job failed
+    :rtype: bool
     """
     logging.basicConfig()
     setLogLevel(config.logLevel)
@@ -241,6 +388,7 @@ def workerScript(jobStore, config, jobName, jobStoreID, redirectOutputToLogFile=
     blockFn = lambda : True
     listOfJobs = [jobName]
     job = None
+    fileStore = None
     try:
 
         #Put a message at the top of the log, just to make sure it's working.
@@ -256,6 +404,8 @@ def workerScript(jobStore, config, jobName, jobStoreID, redirectOutputToLogFile=
         jobGraph = jobStore.load(jobStoreID)
         listOfJobs[0] = str(jobGraph)
         logger.debug("Parsed job wrapper")
+        # The leader has processed any successors run by a previous worker of the jobGraph
+        vars(jobGraph).pop('ranSuccessorJobStoreIDs', None)
         
         ##########################################
         #Cleanup from any earlier invocation of the jobGraph
@@ -308,6 +458,39 @@ def workerScript(jobStore, config, jobName, jobStoreID, redirectOutputToLogFile=
         if config.stats:
             startClock = getTotalCpuTime()
 
+        # A single fileStore object serves all the jobs run by this worker. Its updates of the
+        # job graphs happen in order, so waiting for the latest one is enough.
+        fileStore = AbstractFileStore.createFileStore(jobStore, jobGraph, localWorkerTempDir, blockFn,
+                                                      caching=not config.disableCaching)
+        blockFn = fileStore._blockFn
+
+        def runJob(jobGraph):
+            """Runs the command of the jobGraph, returning the job."""
+            assert jobGraph.command.startswith("_toil ")
+            logger.debug("Got a command to run: %s" % jobGraph.command)
+            # Start downloading the files the job will read while the job is loaded and set up
+            fileStore._prefetch([FileID(*fileID) for fileID in jobGraph.inputFileIDs],
+                                jobGraph.disk)
+            #Load the job
+            job = Job._loadJob(jobGraph.command, jobStore)
+            # The job may read files that weren't known before, e.g. those it was promised
+            fileStore._prefetch(job._getInputFileIDs(), jobGraph.disk)
+            # If it is a checkpoint job, save the command
+            if job.checkpoint:
+                jobGraph.checkpoint = jobGraph.command
+
+            fileStore._setJobGraph(jobGraph)
+            with job._executor(jobGraph=jobGraph,
+                               stats=statsDict if config.stats else None,
+                               fileStore=fileStore):
+                with deferredFunctionManager.open() as defer:
+                    with fileStore.open(job):
+                        job._runner(jobGraph=jobGraph, jobStore=jobStore, fileStore=fileStore, defer=defer)
+
+            # Accumulate messages from this job & any subsequent chained jobs
+            statsDict.workers.logsToMaster += fileStore.loggingMessages
+            return job
+
         startTime = time.time()
         while True:
             ##########################################
@@ -315,29 +498,7 @@ def workerScript(jobStore, config, jobName, jobStoreID, redirectOutputToLogFile=
             ##########################################
             
             if jobGraph.command is not None:
-                assert jobGraph.command.startswith("_toil ")
-                logger.debug("Got a command to run: %s" % jobGraph.command)
-                #Load the job
-                job = Job._loadJob(jobGraph.command, jobStore)
-                # If it is a checkpoint job, save the command
-                if job.checkpoint:
-                    jobGraph.checkpoint = jobGraph.command
-
-                # Create a fileStore object for the job
-                fileStore = AbstractFileStore.createFileStore(jobStore, jobGraph, localWorkerTempDir, blockFn,
-                                                              caching=not config.disableCaching)
-                with job._executor(jobGraph=jobGraph,
-                                   stats=statsDict if config.stats else None,
-                                   fileStore=fileStore):
-                    with deferredFunctionManager.open() as defer:
-                        with fileStore.open(job):
-                            # Get the next block function and list that will contain any messages
-                            blockFn = fileStore._blockFn
-
-                            job._runner(jobGraph=jobGraph, jobStore=jobStore, fileStore=fileStore, defer=defer)
-
-                # Accumulate messages from this job & any subsequent chained jobs
-                statsDict.workers.logsToMaster += fileStore.loggingMessages
+                job = runJob(jobGraph)
 
             else:
                 #The command may be none, in which case
@@ -352,8 +513,65 @@ def workerScript(jobStore, config, jobName, jobStoreID, redirectOutputToLogFile=
             ##########################################
             #Establish if we can run another jobGraph within the worker
             ##########################################
-            successorJobGraph = nextChainableJobGraph(jobGraph, jobStore)
-            if successorJobGraph is None or config.disableChaining:
+            successorJobGraph = None
+            while not config.disableChaining:
+                successorJobGraph = nextChainableJobGraph(jobGraph, jobStore)
+                if successorJobGraph is not None:
+                    break
+                successorJobGraphs = successorsToRunInWorker(jobGraph, jobStore, config)
+                if not successorJobGraphs:
+                    break
+
+                ##########################################
+                #We run the successors that can't be chained as jobs of
+                #their own, one after the other, or in parallel in workers
+                #of their own. Those that are done with no successors of their
+                #own are deleted. Those with a single predecessor are also
+                #removed from the stack, as if they had finished. The leader
+                #takes over the others like jobs it issued.
+                ##########################################
+
+                listOfJobs.extend(str(successorJobGraph) for successorJobGraph in successorJobGraphs)
+                if runInParallel(jobGraph, successorJobGraphs, config):
+                    # The workers must find the files written by this one in the job store
+                    blockFn()
+                    # The workers of the successors delete those that are done
+                    doneJobStoreIDs = runSuccessorsInParallel(successorJobGraphs, jobStore, config,
+                                                              localWorkerTempDir)
+                    jobsToDelete = ()
+                else:
+                    for successorJobGraph in successorJobGraphs:
+                        logger.debug("Running the successor %s as a job of its own", successorJobGraph)
+                        job = runJob(successorJobGraph)
+                    doneJobStoreIDs = set(successorJobGraph.jobStoreID
+                                          for successorJobGraph in successorJobGraphs
+                                          if successorJobGraph.command is None
+                                          and len(successorJobGraph.stack) == 0
+                                          and len(successorJobGraph.services) == 0)
+                    jobsToDelete = doneJobStoreIDs
+                ranJobStoreIDs = [successorJobGraph.jobStoreID
+                                  for successorJobGraph in successorJobGraphs
+                                  if successorJobGraph.jobStoreID not in doneJobStoreIDs
+                                  or successorJobGraph.predecessorNumber > 1]
+                successorJobGraph = None
+
+                # Changes to the job graph don't affect its pending update, see
+                # AbstractFileStore._updateJobWhenDone, so it can be changed in place.
+                jobs = [jobNode for jobNode in jobGraph.stack[-1]
+                        if jobNode.jobStoreID not in doneJobStoreIDs or jobNode.predecessorNumber > 1]
+                if jobs:
+                    jobGraph.stack[-1] = jobs
+                    jobGraph.ranSuccessorJobStoreIDs = ranJobStoreIDs
+                else:
+                    jobGraph.stack.pop()
+                fileStore._setJobGraph(jobGraph)
+                fileStore.jobsToDelete.update(jobsToDelete)
+                fileStore._updateJobWhenDone()
+                if jobs:
+                    logger.debug("The leader must schedule the remaining successors")
+                    break
+
+            if successorJobGraph is None:
                 # Can't chain any more jobs.
                 break
 
@@ -369,9 +587,6 @@ def workerScript(jobStore, config, jobName, jobStoreID, redirectOutputToLogFile=
             # add the successor to the list of jobs run
             listOfJobs.append(str(successorJobGraph))
 
-            #Clone the jobGraph and its stack
-            jobGraph = copy.deepcopy(jobGraph)
-            
             #Remove the successor jobGraph
             jobGraph.stack.pop()
 
@@ -382,25 +597,20 @@ def workerScript(jobStore, config, jobName, jobStoreID, redirectOutputToLogFile=
             # logging output
             jobGraph.unitName = successorJobGraph.unitName
             jobGraph.jobName = successorJobGraph.jobName
+            jobGraph.inputFileIDs = successorJobGraph.inputFileIDs
             assert jobGraph.memory >= successorJobGraph.memory
             assert jobGraph.cores >= successorJobGraph.cores
             
-            #Build a fileStore to update the job
-            fileStore = AbstractFileStore.createFileStore(jobStore, jobGraph, localWorkerTempDir, blockFn,
-                                                          caching=not config.disableCaching)
-
-            #Update blockFn
-            blockFn = fileStore._blockFn
+            #Make the fileStore update the job
+            fileStore._setJobGraph(jobGraph)
 
             #Add successorJobGraph to those to be deleted
             fileStore.jobsToDelete.add(successorJobGraph.jobStoreID)
             
-            #This will update the job once the previous job is done
-            fileStore._updateJobWhenDone()            
-            
-            #Clone the jobGraph and its stack again, so that updates to it do
-            #not interfere with this update
-            jobGraph = copy.deepcopy(jobGraph)
+            #This will update the job once the previous job is done. The update
+            #works on a snapshot of the jobGraph, so that changes to it do not
+            #interfere with this update
+            fileStore._updateJobWhenDone()
             
             logger.debug("Starting the next job")
         
@@ -432,6 +642,11 @@ def workerScript(jobStore, config, jobName, jobStoreID, redirectOutputToLogFile=
     ########################################## 
        
     blockFn() 
+
+    if config.stats and fileStore is not None:
+        uploadStats = fileStore._getUploadStats()
+        if uploadStats is not None:
+            statsDict.workers.uploads = uploadStats
     
     ##########################################
     #All the asynchronous worker/update threads must be finished now, 
@@ -509,9 +724,23 @@ def workerScript(jobStore, config, jobName, jobStoreID, redirectOutputToLogFile=
         shutil.rmtree(localWorkerTempDir)
     
     #This must happen after the log file is done with, else there is no place to put the log
+    jobDeleted = False
     if (not workerFailed) and jobGraph.command == None and len(jobGraph.stack) == 0 and len(jobGraph.services) == 0:
         # We can now safely get rid of the jobGraph
         jobStore.delete(jobGraph.jobStoreID)
+        jobDeleted = True
+
+    if resultPath is not None:
+        # Spare the leader from loading the job. The job is reloaded because chained jobs are
+        # written asynchronously by the file store, so the record in the job store is the one to
+        # report.
+        try:
+            writeWorkerResult(resultPath, None if jobDeleted else jobStore.load(jobStoreID))
+        except:
+            logger.warning("Failed to leave the result of the worker, the leader will load the "
+                           "job instead.", exc_info=True)
+
+    return workerFailed
 
 def main(argv=None):
     if argv is None:
@@ -539,4 +768,5 @@ def main(argv=None):
     config = jobStore.config
 
     # Call the worker
-    workerScript(jobStore, config, jobName, jobStoreID)
+    workerScript(jobStore, config, jobName, jobStoreID,
+                 resultPath=os.environ.pop(workerResultEnvVar, None))